@@ -0,0 +1,170 @@
+import base64
+import configparser
+import getpass
+import json
+import os
+import sys
+import threading
+import time
+
+
+def config_dir():
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, "face_generator")
+
+
+DEFAULT_TOKEN_PATH = os.path.join(config_dir(), "token.json")
+
+# Optional INI file with an [extempo] section holding username, password and base_url
+DEFAULT_CONFIG_PATH = os.path.join(config_dir(), "config.ini")
+
+# Treat a token as expired this many seconds before its exp claim
+EXPIRY_MARGIN = 60
+
+
+def token_expiry(token):
+    """
+    Return the exp claim of a JWT as a UNIX timestamp, or None if the token is not a
+    JWT or carries no expiry. The signature is not checked; this is only a hint.
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def read_config(path=DEFAULT_CONFIG_PATH):
+    """
+    Return the [extempo] section of the config file as a dict, or {} if there is none.
+    """
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    return dict(parser["extempo"]) if parser.has_section("extempo") else {}
+
+
+def prompt_credentials(config_path=DEFAULT_CONFIG_PATH, interactive=None):
+    """
+    Read credentials from EXTEMPO_USERNAME / EXTEMPO_PASSWORD, then the config file, and
+    prompt for whatever is still missing.
+
+    :param interactive: Whether prompting is allowed; defaults to whether stdin is a terminal
+    :raises RuntimeError: if a credential is missing and prompting is not allowed
+    """
+    config = read_config(config_path)
+    username = os.environ.get("EXTEMPO_USERNAME") or config.get("username")
+    password = os.environ.get("EXTEMPO_PASSWORD") or config.get("password")
+    if interactive is None:
+        interactive = sys.stdin.isatty()
+    if not (username and password) and not interactive:
+        raise RuntimeError("No Extempo credentials: set EXTEMPO_USERNAME and EXTEMPO_PASSWORD "
+                           f"or add them to the [extempo] section of {config_path}")
+    username = username or input("Enter your email: ")
+    password = password or getpass.getpass("Enter your password: ")
+    return username, password
+
+
+class TokenManager:
+    """
+    Caches the Extempo bearer token on disk and logs in again only when needed.
+
+    The token file is written atomically with 0600 permissions and shared by every
+    process of the same user, so a fresh process starts without a login round-trip.
+    When a request comes back 401 the client calls refresh(); if another process has
+    already refreshed the file that token is picked up, otherwise we log in again.
+
+    :param client: ExtempoClient used for logging in; it is attached to this manager
+    :param credentials: Callable returning (username, password), only called when a login is needed
+    :param path: Token file location
+    """
+
+    def __init__(self, client, credentials=prompt_credentials, path=DEFAULT_TOKEN_PATH):
+        self.client = client
+        self.credentials = credentials
+        self.path = path
+        self.token = None
+        self.retired = set()
+        self.lock = threading.Lock()
+        client.token_manager = self
+
+    def _is_fresh(self, token):
+        expiry = token_expiry(token)
+        return expiry is None or expiry - EXPIRY_MARGIN > time.time()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f).get("token")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _write(self, token):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"token": token, "saved_at": time.time()}, f)
+        os.replace(tmp_path, self.path)
+
+    def _use(self, token):
+        if self.token and self.token != token:
+            self.retired.add(self.token)
+        self.token = token
+        self.client.set_token(token)
+        return token
+
+    def get_token(self):
+        """
+        Return a usable token from memory, the token file, or a new login, in that order.
+        """
+        with self.lock:
+            if self.token and self._is_fresh(self.token):
+                return self.token
+            cached = self._read()
+            if cached and self._is_fresh(cached):
+                print(f"Using cached token from {self.path}")
+                return self._use(cached)
+            return self._login()
+
+    def refresh(self, failed_token=None):
+        """
+        Replace a token the server rejected. Safe to call from several threads at once:
+        only the first caller logs in, the others get the token it obtained.
+        """
+        with self.lock:
+            if self.token and self.token != failed_token:
+                return self.token
+            cached = self._read()
+            if cached and cached != failed_token and self._is_fresh(cached):
+                return self._use(cached)
+            if failed_token:
+                self.retired.add(failed_token)
+            return self._login()
+
+    def resolve(self, token):
+        """
+        Map a token that has since been refreshed to the current one, so callers holding
+        on to an old token string keep working.
+        """
+        if token in self.retired and self.token:
+            return self.token
+        return token
+
+    def invalidate(self):
+        with self.lock:
+            self.token = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _login(self):
+        username, password = self.credentials()
+        token = self.client.login(username, password)
+        if not token:
+            return None
+        self._write(token)
+        return self._use(token)
@@ -0,0 +1,353 @@
+"""
+Headless, resumable batch runner.
+
+Reads jobs from a JSONL file (requests.jsonl by default), one job per line:
+
+    {"id": "age_set", "count": 500, "attributes": ["age"], "betas": [-3, 0, 3]}
+    {"id": "women", "count": 200, "filters": {"gender": [null, -0.5]}, "attributes": ["happy", "smart"],
+     "betas": [-2, 2], "control_attributes": ["age"], "with_predictions": true}
+    {"id": "young_men", "count": 100, "screen": "gender < -0.5 and |age| < 1", "attributes": ["smug"], "betas": [2]}
+    {"id": "rerun", "s3_keys": ["61/generate/...~~generated.jpeg"], "attributes": ["dominant"], "betas": [1, 2]}
+
+Fields:
+    id                  Job name; also names its output folder generations_batch_<id> (default: line number)
+    count / s3_keys     Number of random faces to generate, or existing faces to transform
+    filters             {trait: [min, max]} bounds a random face's predictions must meet; null is open
+    screen              Screening rule the predictions must also pass, e.g. "gender > 0.5 and |age| < 1"
+                        (see screening.py)
+    max_attempts        Faces decoded per item before giving up on the filters (default 20); an item
+                        of s3_keys whose face fails the filters fails without retrying
+    attributes, betas   Transformations applied to every accepted face (optional)
+    control_attributes  Attributes held constant during transformations (optional)
+    with_predictions    Also fetch predictions for every transformed image
+    output              Output folder instead of generations_batch_<id>
+
+Every job's folder holds a manifest.jsonl (see manifest.py) that is written record by
+record and doubles as the checkpoint: on restart each item resumes after its last
+recorded step, so no decode, download or transformation is requested twice. Jobs, and
+items within a job, run concurrently.
+
+    python batch.py                     # run or resume every job in requests.jsonl
+    python batch.py jobs.jsonl --status # show progress without calling the API
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from auth import TokenManager
+from catalog import Catalog
+from dedupe import DuplicateDetector
+from extempo_async import AsyncExtempoClient
+from extempo_client import BASE_URL, ExtempoClient
+from image_cache import ImageCache
+from manifest import MANIFEST_NAME, RunManifest, read_manifest
+from predictions_cache import PredictionsCache
+from rate_limit import RateLimiter
+from screening import compile_rule
+from storage import save_predictions
+from sweep import _fetch_and_save, _fetch_predictions, _transform_attribute, key_digest
+
+
+DEFAULT_JOBS_PATH = "requests.jsonl"
+
+# Items processed at the same time across all jobs
+DEFAULT_PARALLEL_ITEMS = 8
+
+DEFAULT_MAX_ATTEMPTS = 20
+
+
+def load_jobs(path):
+    """
+    Parse the jobs file. Lines that are not jobs are reported and skipped.
+    """
+    jobs = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {number}: {e}")
+                continue
+            if not isinstance(job, dict) or not ("count" in job or "s3_keys" in job):
+                print(f"Skipping line {number}: a job needs 'count' or 's3_keys'")
+                continue
+            if job.get("screen"):
+                try:
+                    compile_rule(job["screen"])
+                except ValueError as e:
+                    print(f"Skipping line {number}: {e}")
+                    continue
+            job = dict(job)
+            job.setdefault("id", f"line{number}")
+            job.setdefault("output", f"generations_batch_{job['id']}")
+            job["attributes"] = [job["attributes"]] if isinstance(job.get("attributes"), str) else job.get("attributes", [])
+            job.setdefault("betas", [])
+            job["count"] = len(job["s3_keys"]) if "s3_keys" in job else int(job["count"])
+            jobs.append(job)
+    return jobs
+
+
+def passes_filters(predictions, filters, screen=None):
+    """
+    Check a predictions dict against {trait: [min, max]} bounds and an optional screening rule.
+    """
+    if screen and not compile_rule(screen)(predictions):
+        return False
+    scores = predictions.get("predictions", predictions) if isinstance(predictions, dict) else {}
+    for trait, (low, high) in (filters or {}).items():
+        score = scores.get(trait)
+        if score is None or (low is not None and score < low) or (high is not None and score > high):
+            return False
+    return True
+
+
+class ItemState:
+    """
+    What has already been done for one item of a job, rebuilt from the manifest.
+    """
+
+    def __init__(self):
+        self.s3_key = None
+        self.attempts = 0
+        self.rejected = set()
+        self.image_saved = False
+        self.predictions = None
+        self.done = False
+
+
+class JobProgress:
+    """
+    Replays a job folder's manifest into per-item state.
+    """
+
+    def __init__(self, folder):
+        self.items = {}
+        # Saved image paths and predictions by S3 key, tracked apart since either may be missing
+        self.saved_images = {}
+        self.predictions = {}
+        self.transformations = {}
+        path = os.path.join(folder, MANIFEST_NAME)
+        records = read_manifest(path) if os.path.exists(path) else []
+        for record in records:
+            event, s3_key = record.get("event"), record.get("s3_key")
+            if event == "image":
+                self.saved_images[s3_key] = record.get("path")
+            elif event == "predictions":
+                self.predictions[s3_key] = record.get("predictions")
+            elif event == "transformation":
+                self.transformations[(s3_key, record.get("attribute"))] = record
+            if "item" not in record:
+                continue
+            state = self.items.setdefault(record["item"], ItemState())
+            if event == "decode":
+                state.s3_key = s3_key
+                state.attempts += 1
+            elif event == "rejected":
+                state.rejected.add(s3_key)
+                if state.s3_key == s3_key:
+                    state.s3_key = None
+            elif event == "item_done":
+                state.done = True
+        for state in self.items.values():
+            if state.s3_key:
+                state.image_saved = state.s3_key in self.saved_images
+                state.predictions = self.predictions.get(state.s3_key)
+
+    def item(self, n):
+        return self.items.setdefault(n, ItemState())
+
+    def done_count(self):
+        return sum(1 for state in self.items.values() if state.done)
+
+
+async def run_item(client, job, n, progress, manifest):
+    """
+    Run one item to completion, skipping every step the manifest shows as done.
+
+    :return: True if the item finished, False if it failed or ran out of attempts
+    """
+    state = progress.item(n)
+    folder = job["output"]
+    filters = job.get("filters")
+    screen = job.get("screen")
+    # Faces are checked on their predictions before the image is downloaded
+    screened = bool(filters or screen)
+    max_attempts = job.get("max_attempts", DEFAULT_MAX_ATTEMPTS)
+    while True:
+        if state.s3_key is None:
+            if "s3_keys" in job:
+                # A given face has no alternative, so once rejected the item cannot succeed
+                if job["s3_keys"][n] in state.rejected:
+                    print(f"[{job['id']}#{n}] {job['s3_keys'][n]} does not pass the filters")
+                    return False
+                state.s3_key = job["s3_keys"][n]
+            else:
+                if state.attempts >= max_attempts:
+                    print(f"[{job['id']}#{n}] No face passed the filters after {state.attempts} attempts")
+                    return False
+                face = await client.decode_random_face()
+                if not face:
+                    return False
+                state.s3_key = face["s3_key"]
+            state.attempts += 1
+            state.image_saved = False
+            state.predictions = None
+            manifest.record("decode", s3_key=state.s3_key, item=n)
+
+        if screened and state.predictions is None:
+            state.predictions = await client.wait_for_predictions(state.s3_key)
+            if not state.predictions:
+                return False
+            # Named after the face: every rejected face of the item keeps its own file
+            filename = f"face_{n:05d}_{key_digest(state.s3_key)}_predictions.json"
+            path = await asyncio.to_thread(save_predictions, state.predictions, filename, folder)
+            manifest.predictions(state.s3_key, state.predictions, path)
+        if screened and not passes_filters(state.predictions, filters, screen):
+            manifest.record("rejected", s3_key=state.s3_key, item=n)
+            state.rejected.add(state.s3_key)
+            state.s3_key = None
+            continue
+        break
+
+    if not state.image_saved:
+        path = await client.wait_for_download(state.s3_key, f"face_{n:05d}.jpg", folder)
+        if not path:
+            return False
+        manifest.image(state.s3_key, path)
+        state.image_saved = True
+    if state.predictions is None and not screened:
+        state.predictions = await client.wait_for_predictions(state.s3_key)
+        if state.predictions:
+            path = await asyncio.to_thread(save_predictions, state.predictions, f"face_{n:05d}_predictions.json", folder)
+            manifest.predictions(state.s3_key, state.predictions, path)
+
+    betas = job["betas"]
+    with_predictions = job.get("with_predictions", False)
+    pending = []
+    unpredicted = []
+    for attribute in job["attributes"]:
+        record = progress.transformations.get((state.s3_key, attribute))
+        if record is not None:
+            pairs = [(attribute, beta, image_key) for beta, image_key in zip(record["betas"], record.get("images", []))]
+        else:
+            pairs = await _transform_attribute(client, state.s3_key, attribute, betas, job.get("control_attributes"),
+                                               manifest)
+        for pair in pairs:
+            if pair[2] not in progress.saved_images:
+                pending.append(pair)
+            elif with_predictions and pair[2] not in progress.predictions:
+                # Saved by an earlier run that stopped before the image's predictions arrived
+                unpredicted.append(pair[2])
+    results, predicted = await asyncio.gather(
+        asyncio.gather(*(_fetch_and_save(client, attribute, beta, image_key, folder, with_predictions, manifest)
+                         for attribute, beta, image_key in pending)),
+        asyncio.gather(*(_fetch_predictions(client, image_key, os.path.basename(progress.saved_images[image_key]),
+                                            folder, manifest)
+                         for image_key in unpredicted)),
+    )
+    if any(result["image_path"] is None or (with_predictions and not result["predictions"]) for result in results):
+        return False
+    if not all(predicted):
+        return False
+
+    manifest.record("item_done", s3_key=state.s3_key, item=n)
+    state.done = True
+    return True
+
+
+async def run_job(client, job, semaphore):
+    os.makedirs(job["output"], exist_ok=True)
+    progress = JobProgress(job["output"])
+    todo = [n for n in range(job["count"]) if not progress.item(n).done]
+    if not todo:
+        print(f"[{job['id']}] already complete ({job['count']} items)")
+        return {"id": job["id"], "done": job["count"], "failed": 0}
+    print(f"[{job['id']}] {len(todo)} of {job['count']} items to do in {job['output']}")
+
+    # Written record by record: the manifest is the checkpoint
+    manifest = RunManifest(job["output"], buffer_size=1)
+    manifest.record("job", job=job)
+
+    async def one(n):
+        async with semaphore:
+            try:
+                return await run_item(client, job, n, progress, manifest)
+            except Exception as e:
+                print(f"[{job['id']}#{n}] failed: {e}")
+                return False
+
+    try:
+        finished = await asyncio.gather(*(one(n) for n in todo))
+    finally:
+        manifest.close()
+    failed = finished.count(False)
+    print(f"[{job['id']}] {progress.done_count()}/{job['count']} items complete, {failed} failed")
+    return {"id": job["id"], "done": progress.done_count(), "failed": failed}
+
+
+async def run_jobs_async(client, jobs, parallel_items=DEFAULT_PARALLEL_ITEMS):
+    semaphore = asyncio.Semaphore(parallel_items)
+    return await asyncio.gather(*(run_job(client, job, semaphore) for job in jobs))
+
+
+def run_jobs(token, jobs, parallel_items=DEFAULT_PARALLEL_ITEMS, base_url=BASE_URL, **client_options):
+    """
+    Blocking entry point: run every job with one shared AsyncExtempoClient.
+    """
+    async def run():
+        async with AsyncExtempoClient(base_url, token=token, **client_options) as client:
+            return await run_jobs_async(client, jobs, parallel_items)
+
+    return asyncio.run(run())
+
+
+def print_status(jobs):
+    for job in jobs:
+        progress = JobProgress(job["output"])
+        print(f"{job['id']}: {progress.done_count()}/{job['count']} items complete in {job['output']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the batch jobs in a JSONL file, resuming where they stopped")
+    parser.add_argument("jobs", nargs="?", default=DEFAULT_JOBS_PATH)
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL_ITEMS, help="items processed at once")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="HTTP requests in flight")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--status", action="store_true", help="only print progress")
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.jobs)
+    if not jobs:
+        print(f"No jobs in {args.jobs}")
+        return
+    if args.status:
+        print_status(jobs)
+        return
+
+    client = ExtempoClient(args.base_url, rate_limiter=RateLimiter())
+    DuplicateDetector(Catalog()).install()
+    token_manager = TokenManager(client)
+    token = token_manager.get_token()
+    if not token:
+        return
+    start = time.monotonic()
+    try:
+        summaries = run_jobs(token, jobs, args.parallel, args.base_url, max_concurrency=args.max_concurrency,
+                             image_cache=ImageCache(), predictions_cache=PredictionsCache(),
+                             token_manager=token_manager, rate_limiter=client.rate_limiter)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again to resume from the last completed step")
+        return
+    done = sum(summary["done"] for summary in summaries)
+    failed = sum(summary["failed"] for summary in summaries)
+    print(f"Batch finished in {time.monotonic() - start:.1f}s: {done} items complete, {failed} failed")
+    if failed:
+        print("Run again to retry the failed items")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from extempo_client import ExtempoClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal keep-alive stand-in for the gateway. Every new TCP connection bumps
+    server.connections, so we can see how many handshakes each client pays for.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this Nagle + delayed ACK
+    # adds ~40ms to every response on a reused connection
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/image/"):
+            body = b"\xff\xd8" + b"\x00" * 2048 + b"\xff\xd9"
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json({"s3_key": "61/generate/stub~~generated.jpeg"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self._send_json({"token": "stub-token", "images": []})
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_unpooled(base_url, n):
+    headers = {"Authorization": "Bearer stub-token"}
+    for _ in range(n):
+        requests.get(f"{base_url}/decode", headers=headers, timeout=10)
+        requests.get(f"{base_url}/image/generate/stub", headers=headers, timeout=10)
+        requests.get(f"{base_url}/users/me", headers=headers, timeout=10)
+
+
+def run_pooled(base_url, n):
+    with ExtempoClient(base_url, timeout=10) as client:
+        client.set_token("stub-token")
+        for _ in range(n):
+            client.decode_random_face()
+            client.get_image("generate", "stub")
+            client.get_user_info()
+
+
+def measure(server, label, fn, n):
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    before = server.connections
+    start = time.perf_counter()
+    fn(base_url, n)
+    elapsed = time.perf_counter() - start
+    connections = server.connections - before
+    print(f"{label:<10} requests: {3 * n:>5}  connections: {connections:>5}  "
+          f"total: {elapsed:.3f}s  per request: {elapsed / (3 * n) * 1000:.2f}ms")
+    return connections, elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server = start_stub_server()
+    try:
+        unpooled_connections, unpooled_time = measure(server, "unpooled", run_unpooled, n)
+        pooled_connections, pooled_time = measure(server, "pooled", run_pooled, n)
+    finally:
+        server.shutdown()
+    print(f"Connections saved: {unpooled_connections - pooled_connections}, "
+          f"speedup: {unpooled_time / pooled_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
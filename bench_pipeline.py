@@ -0,0 +1,269 @@
+"""
+End-to-end benchmark of the generate -> predict -> transform pipeline.
+
+Drives the real client code against the local emulator in generator_api.py with
+injected latency, and reports throughput, p50/p95/p99 latency per stage and per
+endpoint, and bytes moved. Results can be stored as a baseline and later runs
+compared against it, so regressions in the client show up as failures:
+
+    python bench_pipeline.py --save-baseline
+    python bench_pipeline.py --compare
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import extempo_async
+import generator_api
+from extempo_client import ExtempoClient, split_s3_key
+from storage import save_characteristic_info, save_image, save_predictions
+from sweep import run_sweep
+
+
+DEFAULT_BASELINE_PATH = "bench_baselines.json"
+
+# A metric is a regression when it is this much worse than the baseline...
+DEFAULT_TOLERANCE = 0.25
+# ...and, for latencies, also at least this many seconds worse, so sub-millisecond noise is ignored
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = (len(values) - 1) * p / 100
+    low = int(index)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (index - low)
+
+
+class Recorder:
+    """
+    Collects per-endpoint HTTP timings (as a client observer) and per-stage timings.
+    """
+
+    def __init__(self):
+        self.endpoints = defaultdict(list)
+        self.stages = defaultdict(list)
+        self.bytes = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def __call__(self, method, endpoint, status, seconds, nbytes):
+        name = endpoint.strip('/').split('/')[0] or "root"
+        self.endpoints[name].append(seconds)
+        self.bytes[name] += nbytes
+        self.statuses[name][status] += 1
+
+    def stage(self, name):
+        recorder = self
+
+        class Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, exc_type, exc, tb):
+                recorder.stages[name].append(time.perf_counter() - self.start)
+
+        return Timer()
+
+    def summary(self):
+        def describe(samples):
+            return {
+                "count": len(samples),
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+            }
+
+        return {
+            "stages": {name: describe(samples) for name, samples in self.stages.items()},
+            "endpoints": {
+                name: dict(describe(samples), bytes=self.bytes[name], statuses=dict(self.statuses[name]))
+                for name, samples in self.endpoints.items()
+            },
+        }
+
+
+def bench_single_faces(client, recorder, folder, n):
+    """
+    The selector.py flow without the human: decode, wait for the image, save it,
+    fetch and save predictions, one face after another.
+    """
+    start = time.perf_counter()
+    for i in range(n):
+        with recorder.stage("face.total"):
+            with recorder.stage("face.decode"):
+                face = client.decode_random_face()
+            s3_key = face["s3_key"]
+            path, id = split_s3_key(s3_key)
+            with recorder.stage("face.image"):
+                image = client.wait_for_image(path, id)
+            with recorder.stage("face.save"):
+                save_image(image, f"face_{i}.jpg", folder)
+            with recorder.stage("face.predictions"):
+                predictions = client.wait_for_predictions(s3_key)
+            with recorder.stage("face.save"):
+                save_predictions(predictions, f"face_{i}_predictions.json", folder)
+    elapsed = time.perf_counter() - start
+    return {"faces": n, "seconds": elapsed, "faces_per_second": n / elapsed}
+
+
+def bench_sweep(client, recorder, folder, betas):
+    """
+    The main.py flow: transform one face over a list of betas and save every result.
+    """
+    face = client.decode_random_face()
+    s3_key = face["s3_key"]
+    client.wait_for_image(*split_s3_key(s3_key))
+    start = time.perf_counter()
+    with recorder.stage("sweep.total"):
+        results = run_sweep(client.token, s3_key, "age", betas, folder, base_url=client.base_url,
+                            observers=client.observers)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        if not result["image_path"]:
+            continue
+        # One legacy _info.txt per image, named like manifest.export_info_files names them
+        photo_filename = os.path.basename(result["image_path"])
+        info_filename = os.path.splitext(photo_filename)[0] + "_info.txt"
+        with recorder.stage("sweep.info"):
+            save_characteristic_info(result["attribute"], result["beta"], info_filename, folder,
+                                     result["s3_key"], photo_filename)
+    saved = sum(1 for result in results if result["image_path"])
+    return {"images": saved, "seconds": elapsed, "images_per_second": saved / elapsed}
+
+
+def bench_batch(client, recorder, n, max_concurrency):
+    """
+    Decode n faces and fetch all images and predictions with the async client.
+    """
+    start = time.perf_counter()
+    with recorder.stage("batch.total"):
+        faces = extempo_async.generate_faces(client.token, n, base_url=client.base_url,
+                                             max_concurrency=max_concurrency, observers=client.observers)
+    elapsed = time.perf_counter() - start
+    complete = sum(1 for face in faces if face["image"] and face["predictions"])
+    return {"faces": complete, "seconds": elapsed, "faces_per_second": complete / elapsed}
+
+
+def run(args):
+    base_url, server = generator_api.start_in_background(
+        latency_ms=args.latency_ms, ready_after=args.ready_after, ready_jitter=args.ready_jitter,
+        image_size=args.image_size, seed=args.seed,
+    )
+    recorder = Recorder()
+    client = ExtempoClient(base_url)
+    client.observers.append(recorder)
+    # Keep the benchmark output readable
+    client.image_poller.deadline = client.predictions_poller.deadline = 30
+
+    stdout = sys.stdout
+    try:
+        sys.stdout = open(os.devnull, 'w')
+        client.login("bench@example.com", "bench")
+        with tempfile.TemporaryDirectory() as folder:
+            scenarios = {
+                "single": bench_single_faces(client, recorder, folder, args.faces),
+                "sweep": bench_sweep(client, recorder, folder, args.betas),
+                "batch": bench_batch(client, recorder, args.batch, args.concurrency),
+            }
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        server.should_exit = True
+
+    report = recorder.summary()
+    report["scenarios"] = scenarios
+    report["settings"] = {key: value for key, value in vars(args).items()
+                          if key not in ("save_baseline", "compare", "baseline", "tolerance", "json")}
+    return report
+
+
+def print_report(report):
+    print("Scenarios")
+    for name, result in report["scenarios"].items():
+        details = ", ".join(f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+                            for key, value in result.items())
+        print(f"  {name:<8} {details}")
+    print("\nStages (seconds)")
+    print(f"  {'stage':<18}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, s in sorted(report["stages"].items()):
+        print(f"  {name:<18}{s['count']:>7}{s['p50']:>9.3f}{s['p95']:>9.3f}{s['p99']:>9.3f}")
+    print("\nEndpoints (seconds per request)")
+    print(f"  {'endpoint':<24}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'bytes':>12}  statuses")
+    for name, s in sorted(report["endpoints"].items()):
+        print(f"  {name:<24}{s['count']:>7}{s['p50']:>9.3f}{s['p95']:>9.3f}{s['p99']:>9.3f}{s['bytes']:>12}  "
+              f"{s['statuses']}")
+
+
+def compare(report, baseline, tolerance):
+    """
+    Compare throughput and stage p95s with a baseline. Returns a list of regression messages.
+    """
+    regressions = []
+    for name, result in report["scenarios"].items():
+        for key, value in result.items():
+            if not key.endswith("_per_second"):
+                continue
+            old = baseline.get("scenarios", {}).get(name, {}).get(key)
+            if old and value < old * (1 - tolerance):
+                regressions.append(f"{name} {key}: {value:.2f} vs baseline {old:.2f}")
+    for name, stats in report["stages"].items():
+        old = baseline.get("stages", {}).get(name, {}).get("p95")
+        if old and stats["p95"] > max(old * (1 + tolerance), old + MIN_REGRESSION_SECONDS):
+            regressions.append(f"stage {name} p95: {stats['p95']:.3f}s vs baseline {old:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the client pipeline against the local emulator")
+    parser.add_argument("--faces", type=int, default=10, help="faces in the serial single-face scenario")
+    parser.add_argument("--betas", type=float, nargs="+", default=[-3, -2, -1, 0, 1, 2, 3])
+    parser.add_argument("--batch", type=int, default=100, help="faces in the concurrent batch scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--ready-after", type=float, default=1.0)
+    parser.add_argument("--ready-jitter", type=float, default=0.5)
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="fail if this run regresses against the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--json", help="also write the full report to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline first")
+            sys.exit(2)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != report["settings"]:
+            print("\nWarning: baseline was recorded with different settings")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
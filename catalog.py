@@ -0,0 +1,502 @@
+"""
+SQLite catalog of everything saved in generations_* folders.
+
+Scanning is incremental: each file's size and mtime are stored, and only new or changed
+files are parsed again. These kinds of files are indexed:
+
+  image        .jpg files
+  predictions  *predictions*.json files ({"s3_key": ..., "predictions": {...}})
+  info         *.txt files in the legacy "Characteristic / Beta / S3 Key / Photo Filename" format
+  manifest     manifest.jsonl run manifests; each image record is stored as an info row
+               and each predictions record without a saved file as a predictions row,
+               under the path 'folder/manifest.jsonl#<line>'
+
+Each image a manifest's transformation records produced, downloaded or not, also gets a
+transformation row ('folder/manifest.jsonl#<line>.<index>') with its attribute, beta and
+the key of the image it was made from (source_key).
+
+After a scan, images inherit the S3 key, attribute and beta of the info, manifest or
+predictions record that refers to them, so a single query answers e.g. "every age transform with
+beta >= 5":
+
+    python catalog.py index
+    python catalog.py query --attribute age --beta-min 5
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from manifest import MANIFEST_NAME
+
+
+DEFAULT_CATALOG_PATH = "catalog.sqlite3"
+
+FOLDER_PATTERN = "generations_*"
+
+# Seconds a write waits for another process (e.g. a pool worker storing hashes) to release the database
+BUSY_TIMEOUT = 30
+
+_TIMESTAMP = re.compile(r"(\d{8}_\d{6})")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    created TEXT,
+    s3_key TEXT,
+    face_key TEXT,
+    source_key TEXT,
+    attribute TEXT,
+    beta REAL,
+    photo_path TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS files_attribute_beta ON files (attribute, beta);
+CREATE INDEX IF NOT EXISTS files_s3_key ON files (s3_key);
+CREATE INDEX IF NOT EXISTS files_face_key ON files (face_key);
+CREATE INDEX IF NOT EXISTS files_created ON files (created);
+CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+CREATE INDEX IF NOT EXISTS files_photo_path ON files (photo_path);
+CREATE TABLE IF NOT EXISTS image_hashes (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    phash INTEGER NOT NULL,
+    duplicate_of TEXT,
+    face TEXT
+);
+"""
+
+_COLUMNS = ("path", "folder", "kind", "size", "mtime_ns", "created", "s3_key", "face_key", "source_key", "attribute",
+            "beta", "photo_path", "data")
+
+
+def face_key(s3_key):
+    """
+    Return the S3 key of the generated face an image descends from.
+
+    Transformed keys look like '61/transform/<uuid>~~generated.jpeg~~<request>~~<index>';
+    their face is '61/generate/<uuid>~~generated.jpeg'. Generated keys are their own face.
+    """
+    if not s3_key:
+        return None
+    parts = s3_key.split('/')
+    if len(parts) < 3:
+        return s3_key
+    name_parts = parts[-1].split('~~')
+    if parts[-2] != "transform" or len(name_parts) < 2:
+        return s3_key
+    return '/'.join(parts[:-2] + ["generate", '~~'.join(name_parts[:2])])
+
+
+def parse_timestamp(name):
+    """
+    Return the last YYYYMMDD_HHMMSS stamp in a file or folder name as 'YYYY-MM-DD HH:MM:SS', or None.
+    """
+    stamps = _TIMESTAMP.findall(name)
+    if not stamps:
+        return None
+    try:
+        return datetime.strptime(stamps[-1], "%Y%m%d_%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def parse_info(text):
+    """
+    Parse a legacy _info.txt file into a dict with attribute, beta, s3_key and photo_filename.
+    Missing fields are None.
+    """
+    fields = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition(':')
+        if sep:
+            fields[key.strip().lower()] = value.strip()
+    try:
+        beta = float(fields["beta"])
+    except (KeyError, ValueError):
+        beta = None
+    return {
+        "attribute": fields.get("characteristic") or None,
+        "beta": beta,
+        "s3_key": fields.get("s3 key") or None,
+        "photo_filename": fields.get("photo filename") or None,
+    }
+
+
+def file_kind(name):
+    if name == MANIFEST_NAME:
+        return "manifest"
+    lower = name.lower()
+    if lower.endswith((".jpg", ".jpeg")):
+        return "image"
+    if lower.endswith(".json") and "predictions" in lower:
+        return "predictions"
+    if lower.endswith(".txt"):
+        return "info"
+    return None
+
+
+def parse_manifest(path, folder, size, mtime_ns):
+    """
+    Build the catalog rows for a run manifest: one for the file, one per image record or
+    predictions record that has no predictions file of its own, and one per image of each
+    transformation record.
+    """
+    rows = []
+    base = dict.fromkeys(_COLUMNS)
+    base.update(folder=folder, size=size, mtime_ns=mtime_ns)
+    rows.append(dict(base, path=path, kind="manifest", created=parse_timestamp(folder)))
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            event = record.get("event")
+            if event == "transformation":
+                for index, (beta, image_key) in enumerate(zip(record.get("betas", []), record.get("images") or [])):
+                    rows.append(dict(base, path=f"{path}#{number}.{index}", kind="transformation",
+                                     created=record.get("time", "")[:19] or None, s3_key=image_key,
+                                     face_key=face_key(image_key), attribute=record.get("attribute"), beta=beta,
+                                     source_key=record.get("s3_key")))
+                continue
+            if event not in ("image", "predictions") or (event == "predictions" and record.get("path")):
+                continue
+            row = dict(base, path=f"{path}#{number}", created=record.get("time", "")[:19] or None,
+                       s3_key=record.get("s3_key"), face_key=face_key(record.get("s3_key")))
+            if event == "image":
+                row.update(kind="info", attribute=record.get("attribute"), beta=record.get("beta"),
+                           photo_path=os.path.join(folder, record["path"]) if record.get("path") else None)
+            else:
+                row.update(kind="predictions", data=json.dumps(record.get("predictions")))
+            rows.append(row)
+    return rows
+
+
+def parse_file(path, folder, kind, size, mtime_ns):
+    """
+    Build the catalog rows for one file.
+    """
+    if kind == "manifest":
+        return parse_manifest(path, folder, size, mtime_ns)
+    name = os.path.basename(path)
+    row = dict.fromkeys(_COLUMNS)
+    row.update(path=path, folder=folder, kind=kind, size=size, mtime_ns=mtime_ns,
+               created=parse_timestamp(name) or parse_timestamp(folder))
+    if kind == "info":
+        with open(path, errors="replace") as f:
+            info = parse_info(f.read())
+        row.update(attribute=info["attribute"], beta=info["beta"], s3_key=info["s3_key"])
+        if info["photo_filename"]:
+            row["photo_path"] = os.path.join(os.path.dirname(path), info["photo_filename"])
+    elif kind == "predictions":
+        with open(path) as f:
+            predictions = json.load(f)
+        if isinstance(predictions, dict):
+            row["s3_key"] = predictions.get("s3_key")
+            row["data"] = json.dumps(predictions.get("predictions", predictions))
+    row["face_key"] = face_key(row["s3_key"])
+    return [row]
+
+
+class Catalog:
+    """
+    Incremental SQLite index over generations_* folders.
+
+    :param path: SQLite file holding the catalog
+    :param root: Directory containing the generations_* folders
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH, root="."):
+        self.path = path
+        self.root = root
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def folders(self):
+        return sorted(os.path.normpath(path) for path in glob.glob(os.path.join(self.root, FOLDER_PATTERN))
+                      if os.path.isdir(path))
+
+    def scan(self, folders=None):
+        """
+        Index new and changed files and forget deleted ones.
+
+        :param folders: Folders to scan; defaults to every generations_* folder under root,
+            in which case rows of folders that no longer exist are dropped too
+        :return: dict with the number of files added, updated, removed and unchanged
+        """
+        full_scan = folders is None
+        folders = self.folders() if full_scan else [os.path.normpath(folder) for folder in folders]
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "errors": 0}
+        with self.lock:
+            known = {}
+            for folder in folders:
+                rows = self.db.execute("SELECT path, size, mtime_ns FROM files WHERE folder = ?", (folder,))
+                known.update((path, (size, mtime_ns)) for path, size, mtime_ns in rows)
+            if full_scan:
+                placeholders = ",".join("?" * len(folders))
+                gone = self.db.execute(f"SELECT path FROM files WHERE folder NOT IN ({placeholders})", folders)
+                known.update((path, None) for (path,) in gone)
+
+        changed = []
+        seen = set()
+        for folder in folders:
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                kind = file_kind(entry.name)
+                if kind is None or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                path = os.path.join(folder, entry.name)
+                seen.add(path)
+                if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                    if kind == "manifest":
+                        seen.update(known_path for known_path in known if known_path.startswith(f"{path}#"))
+                    counts["unchanged"] += 1
+                    continue
+                try:
+                    rows = parse_file(path, folder, kind, stat.st_size, stat.st_mtime_ns)
+                except (OSError, ValueError) as e:
+                    print(f"Skipping {path}: {e}")
+                    counts["errors"] += 1
+                    continue
+                changed.extend(rows)
+                seen.update(row["path"] for row in rows)
+                counts["updated" if path in known else "added"] += 1
+        removed = [path for path in known if path not in seen]
+        # Manifest records are not files of their own
+        counts["removed"] = sum(1 for path in removed if '#' not in path)
+
+        with self.lock:
+            placeholders = ",".join("?" * len(_COLUMNS))
+            self.db.executemany(f"INSERT OR REPLACE INTO files ({','.join(_COLUMNS)}) VALUES ({placeholders})",
+                                [tuple(row[column] for column in _COLUMNS) for row in changed])
+            self.db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+            self.db.executemany("DELETE FROM image_hashes WHERE path = ?", [(path,) for path in removed])
+            if changed or removed:
+                self._link_images()
+            self.db.commit()
+        return counts
+
+    def _link_images(self):
+        """
+        Copy S3 key, attribute and beta onto images from the info and predictions files describing them.
+        """
+        self.db.execute("""
+            UPDATE files SET s3_key = NULL, face_key = NULL, attribute = NULL, beta = NULL WHERE kind = 'image'
+        """)
+        self.db.execute("""
+            UPDATE files SET (s3_key, face_key) = (
+                SELECT p.s3_key, p.face_key FROM files AS p
+                WHERE p.kind = 'predictions' AND p.s3_key IS NOT NULL
+                  AND p.path IN (substr(files.path, 1, length(files.path) - 4) || '_predictions.json',
+                                 substr(files.path, 1, length(files.path) - 4) || '.json')
+            )
+            WHERE kind = 'image'
+        """)
+        self.db.execute("""
+            UPDATE files SET (s3_key, face_key, attribute, beta) = (
+                SELECT i.s3_key, i.face_key, i.attribute, i.beta FROM files AS i
+                WHERE i.kind = 'info' AND i.photo_path = files.path
+            )
+            WHERE kind = 'image' AND EXISTS (
+                SELECT 1 FROM files AS i WHERE i.kind = 'info' AND i.photo_path = files.path
+            )
+        """)
+
+    def find(self, kind="image", attribute=None, beta_min=None, beta_max=None, s3_key=None, face=None,
+             since=None, until=None, folder=None, limit=None):
+        """
+        Query the catalog. Every argument narrows the result; dates are compared as
+        'YYYY-MM-DD HH:MM:SS' strings, so a prefix such as '2024-10-21' works for since/until.
+
+        :param kind: 'image', 'predictions', 'info', 'manifest', 'transformation', or None for all
+        :param face: S3 key of a generated face; matches the face and all its transforms
+        :return: List of dicts, oldest first, with predictions decoded under 'predictions'
+        """
+        clauses, params = [], []
+        for column, op, value in (("kind", "=", kind), ("attribute", "=", attribute), ("beta", ">=", beta_min),
+                                  ("beta", "<=", beta_max), ("s3_key", "=", s3_key), ("face_key", "=", face),
+                                  ("created", ">=", since), ("folder", "=", folder)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        if until is not None:
+            # Make '2024-10-21' include the whole day
+            clauses.append("created < ?")
+            params.append(until + "\uffff")
+        query = "SELECT * FROM files"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created, path"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        results = []
+        for row in rows:
+            result = dict(row)
+            data = result.pop("data")
+            result["predictions"] = json.loads(data) if data else None
+            results.append(result)
+        return results
+
+    def transformation_pairs(self, attribute=None):
+        """
+        Return [(attribute, beta, source predictions, transformed predictions)] for every
+        transformed image whose own predictions and whose source's predictions are indexed.
+
+        The source is the image the transformation was applied to, as recorded in the
+        manifest, so undownloaded results and chained steps count too; images known only
+        from info files are paired with their face.
+        """
+        query = """
+            SELECT i.attribute, i.beta, f.data, t.data FROM (
+                SELECT s3_key, attribute, beta, source_key FROM files WHERE kind = 'transformation'
+                UNION ALL
+                SELECT s3_key, attribute, beta, face_key FROM files AS info
+                WHERE kind = 'info' AND s3_key != face_key AND NOT EXISTS (
+                    SELECT 1 FROM files AS x WHERE x.kind = 'transformation' AND x.s3_key = info.s3_key
+                )
+            ) AS i
+            JOIN files AS t ON t.kind = 'predictions' AND t.s3_key = i.s3_key AND t.data IS NOT NULL
+            JOIN files AS f ON f.kind = 'predictions' AND f.s3_key = i.source_key AND f.data IS NOT NULL
+            WHERE i.beta IS NOT NULL
+        """
+        params = []
+        if attribute is None:
+            query += " AND i.attribute IS NOT NULL"
+        else:
+            query += " AND i.attribute = ?"
+            params.append(attribute)
+        with self.lock:
+            rows = self.db.execute(query + " GROUP BY i.s3_key", params).fetchall()
+        return [(name, beta, json.loads(face), json.loads(transformed)) for name, beta, face, transformed in rows]
+
+    def unhashed_images(self):
+        """
+        Return the paths of indexed images without a perceptual hash for their current mtime.
+        """
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT f.path FROM files AS f LEFT JOIN image_hashes AS h ON h.path = f.path
+                WHERE f.kind = 'image' AND (h.path IS NULL OR h.mtime_ns != f.mtime_ns)
+                ORDER BY f.created, f.path
+            """)
+            return [path for (path,) in rows]
+
+    def store_hashes(self, rows):
+        """
+        Store (path, mtime_ns, phash, duplicate_of, face) rows; phash is an unsigned 64-bit int and
+        face names the generated face the image descends from, if known.
+        """
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO image_hashes (path, mtime_ns, phash, duplicate_of, face) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(path, mtime_ns, phash - (1 << 64) if phash >= 1 << 63 else phash, duplicate_of, face)
+                 for path, mtime_ns, phash, duplicate_of, face in rows])
+            self.db.commit()
+
+    def hashes(self):
+        """
+        Return [(path, phash, duplicate_of)] for every hashed image, in the order they were hashed.
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT path, phash, duplicate_of FROM image_hashes ORDER BY rowid").fetchall()
+        return [(path, phash & ((1 << 64) - 1), duplicate_of) for path, phash, duplicate_of in rows]
+
+    def hash_faces(self):
+        """
+        Return {path: key} for hashed images: the stored face, else the S3 key the image is indexed with.
+        """
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT h.path, COALESCE(h.face, f.s3_key) FROM image_hashes AS h
+                LEFT JOIN files AS f ON f.path = h.path
+            """).fetchall()
+        return {path: key for path, key in rows if key}
+
+    def attributes(self):
+        """
+        Return {attribute: number of images} for every transformed attribute in the catalog.
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT attribute, COUNT(*) FROM files WHERE kind = 'image' AND attribute IS NOT NULL "
+                                   "GROUP BY attribute ORDER BY attribute")
+            return dict(rows.fetchall())
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index and query the generations_* folders")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--root", default=".")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("index", help="scan the folders and update the catalog")
+    query = subparsers.add_parser("query", help="list matching files")
+    query.add_argument("--kind", default="image", help="image, predictions, info, manifest, transformation or all")
+    query.add_argument("--attribute")
+    query.add_argument("--beta-min", type=float)
+    query.add_argument("--beta-max", type=float)
+    query.add_argument("--s3-key")
+    query.add_argument("--face", help="S3 key of a generated face")
+    query.add_argument("--since", help="YYYY-MM-DD[ HH:MM:SS]")
+    query.add_argument("--until", help="YYYY-MM-DD[ HH:MM:SS]")
+    query.add_argument("--folder")
+    query.add_argument("--limit", type=int)
+    query.add_argument("--json", action="store_true", help="print full rows as JSON lines")
+    subparsers.add_parser("attributes", help="count images per transformed attribute")
+    args = parser.parse_args()
+
+    with Catalog(args.catalog, args.root) as catalog:
+        if args.command == "index":
+            counts = catalog.scan()
+            print(", ".join(f"{count} {name}" for name, count in counts.items()) + f"; {len(catalog)} files indexed")
+        elif args.command == "attributes":
+            for attribute, count in catalog.attributes().items():
+                print(f"{attribute}: {count}")
+        else:
+            rows = catalog.find(kind=None if args.kind == "all" else args.kind, attribute=args.attribute,
+                                beta_min=args.beta_min, beta_max=args.beta_max, s3_key=args.s3_key, face=args.face,
+                                since=args.since, until=args.until, folder=args.folder, limit=args.limit)
+            for row in rows:
+                if args.json:
+                    print(json.dumps(row))
+                else:
+                    beta = "" if row["beta"] is None else f" beta={row['beta']:g}"
+                    attribute = f" {row['attribute']}" if row["attribute"] else ""
+                    print(f"{row['created'] or '?'}  {row['path']}{attribute}{beta}  {row['s3_key'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
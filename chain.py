@@ -0,0 +1,196 @@
+"""
+Dependency-aware scheduling of chained transformations.
+
+A plan is a tree of steps rooted at one face. Each step transforms its parent's image
+(the face itself, or the result of another step) along one attribute:
+
+    face -> attractive+2 -> age+1
+    face -> gender+1
+
+Plans can be written compactly, with '>' chaining steps and ',' separating branches:
+
+    attractive+2>age+1, gender+1
+
+or as a list of steps with explicit parents:
+
+    [{"id": "attr", "attribute": "attractive", "beta": 2},
+     {"id": "older", "parent": "attr", "attribute": "age", "beta": 1},
+     {"id": "gender", "attribute": "gender", "beta": 1}]
+
+Independent branches run concurrently and each step is requested the moment its
+parent image is ready. Sibling steps sharing an attribute go out as one
+request_transformation call carrying all their betas.
+"""
+import asyncio
+import os
+import re
+import time
+
+from extempo_async import AsyncExtempoClient
+from extempo_client import BASE_URL
+from manifest import RunManifest
+from sweep import _fetch_and_save, _fetch_predictions
+
+
+_STEP = re.compile(r"^(?P<attribute>.+?)\s*(?::\s*(?P<beta>[+-]?[\d.]+)|(?P<signed>[+-][\d.]+))$")
+
+
+class Step:
+    """
+    One transformation in a plan.
+
+    :param id: Unique name of the step
+    :param attribute: Attribute to transform along
+    :param beta: Beta applied to the parent image
+    :param parent: id of the step whose result is transformed, or None for the face itself
+    :param control_attributes: Optional list of attributes held constant
+    """
+
+    def __init__(self, id, attribute, beta, parent=None, control_attributes=None):
+        self.id = id
+        self.attribute = attribute
+        self.beta = float(beta)
+        self.parent = parent
+        self.control_attributes = control_attributes
+
+    def __repr__(self):
+        return f"Step({self.id!r}, {self.attribute!r}, {self.beta:g}, parent={self.parent!r})"
+
+
+def parse_plan(plan, control_attributes=None):
+    """
+    Turn a compact plan string or a list of step dicts into a list of Steps.
+    Chains that share a prefix share its steps.
+    """
+    if isinstance(plan, str):
+        steps = {}
+        for branch in plan.split(','):
+            parent = None
+            path = []
+            for token in branch.split('>'):
+                match = _STEP.match(token.strip())
+                if not match:
+                    raise ValueError(f"Cannot parse step {token.strip()!r}; expected e.g. age+1 or age:-1.5")
+                attribute = match.group("attribute").strip()
+                beta = float(match.group("beta") or match.group("signed"))
+                path.append(f"{attribute}{beta:+g}")
+                id = ">".join(path)
+                if id not in steps:
+                    steps[id] = Step(id, attribute, beta, parent, control_attributes)
+                parent = id
+        return validate_plan(list(steps.values()))
+    return validate_plan([
+        Step(item.get("id") or f"step{n}", item["attribute"], item["beta"], item.get("parent"),
+             item.get("control_attributes", control_attributes))
+        for n, item in enumerate(plan)
+    ])
+
+
+def validate_plan(steps):
+    """
+    Check ids are unique and every parent exists; as each step has one parent this also rules out cycles.
+    """
+    ids = [step.id for step in steps]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Step ids must be unique")
+    by_id = {step.id: step for step in steps}
+    for step in steps:
+        seen = set()
+        current = step
+        while current.parent is not None:
+            if current.parent not in by_id:
+                raise ValueError(f"Step {current.id!r} has unknown parent {current.parent!r}")
+            if current.id in seen:
+                raise ValueError(f"Plan has a cycle through {current.id!r}")
+            seen.add(current.id)
+            current = by_id[current.parent]
+    return steps
+
+
+async def run_chain_async(client, s3_key, steps, output_folder, with_predictions=False, manifest=None):
+    """
+    Run a plan of Steps from one face, starting every step as soon as its parent image is ready.
+
+    :param client: An open AsyncExtempoClient
+    :param s3_key: S3 key of the face the root steps transform
+    :param steps: List of Steps, e.g. from parse_plan
+    :param output_folder: Folder the images are written to
+    :param with_predictions: Also fetch and save predictions for every step
+    :param manifest: RunManifest to record into; by default the output folder's manifest
+    :return: {step id: result dict}; steps below a failed step are missing
+    """
+    children = {}
+    for step in steps:
+        children.setdefault(step.parent, []).append(step)
+    own_manifest = manifest is None
+    if own_manifest:
+        os.makedirs(output_folder, exist_ok=True)
+        manifest = RunManifest(output_folder)
+    results = {}
+    start = time.monotonic()
+
+    async def expand(parent_id, parent_key):
+        # Siblings with the same attribute and controls share one transformation request
+        groups = {}
+        for step in children.get(parent_id, []):
+            groups.setdefault((step.attribute, tuple(step.control_attributes or ())), []).append(step)
+        await asyncio.gather(*(transform_group(parent_key, group) for group in groups.values()))
+
+    async def transform_group(parent_key, group):
+        attribute, control_attributes = group[0].attribute, group[0].control_attributes
+        betas = [step.beta for step in group]
+        transformation = await client.request_transformation(parent_key, attribute, betas, control_attributes)
+        images = (transformation or {}).get("images", [])
+        if len(images) != len(group):
+            print(f"Transformation {attribute} {betas} of {parent_key} failed")
+            return
+        manifest.transformation(parent_key, attribute, betas, control_attributes, images)
+        await asyncio.gather(*(finish_step(step, image_key) for step, image_key in zip(group, images)))
+
+    async def finish_step(step, image_key):
+        result = await _fetch_and_save(client, step.attribute, step.beta, image_key, output_folder, False, manifest)
+        result = results[step.id] = dict(result, step=step.id, parent=step.parent)
+        if not result["image_path"]:
+            return
+        manifest.record("step", s3_key=image_key, step=step.id, parent=step.parent)
+        print(f"Step {step.id} ready after {time.monotonic() - start:.1f}s")
+        # Children only need the image; the step's predictions are fetched alongside them
+        pending = [expand(step.id, image_key)]
+        if with_predictions:
+            pending.append(fetch_predictions(result))
+        await asyncio.gather(*pending)
+
+    async def fetch_predictions(result):
+        image_filename = os.path.basename(result["image_path"])
+        result["predictions"] = await _fetch_predictions(client, result["s3_key"], image_filename, output_folder,
+                                                         manifest)
+
+    try:
+        # The API only transforms faces whose image exists; usually a cache hit
+        if await client.wait_for_image_key(s3_key):
+            await expand(None, s3_key)
+        else:
+            print(f"Face {s3_key} never became ready")
+    finally:
+        if own_manifest:
+            manifest.close()
+        else:
+            manifest.flush()
+    done = sum(1 for result in results.values() if result["image_path"])
+    print(f"Chain finished: {done}/{len(steps)} steps in {time.monotonic() - start:.1f}s")
+    return results
+
+
+def run_chain(token, s3_key, plan, output_folder, with_predictions=False, control_attributes=None,
+              base_url=BASE_URL, manifest=None, **client_options):
+    """
+    Blocking wrapper around run_chain_async; plan may be a compact string, a list of step
+    dicts or a list of Steps. Extra keyword arguments are passed to AsyncExtempoClient.
+    """
+    steps = plan if plan and isinstance(plan[0], Step) else parse_plan(plan, control_attributes)
+
+    async def run():
+        async with AsyncExtempoClient(base_url, token=token, **client_options) as client:
+            return await run_chain_async(client, s3_key, steps, output_folder, with_predictions, manifest)
+
+    return asyncio.run(run())
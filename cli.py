@@ -0,0 +1,370 @@
+"""
+Non-interactive command line for the face generator.
+
+    python cli.py generate --count 20 --filter gender=0.5: --filter age=-1:1
+    python cli.py generate --count 20 --screen "gender > 0.5 and |age| < 1"
+    python cli.py predict 61/generate/<id>~~generated.jpeg
+    python cli.py transform --s3-key 61/generate/<id>~~generated.jpeg --attribute age --betas -2 0 2
+    python cli.py sweep --attributes age happy --betas -3 -1 1 3
+    python cli.py target --s3-key 61/generate/<id>~~generated.jpeg --target attractive=1.5 --tolerance 0.1
+    python cli.py chain --s3-key 61/generate/<id>~~generated.jpeg --plan "attractive+2>age+1, gender+1"
+
+Credentials come from EXTEMPO_USERNAME / EXTEMPO_PASSWORD or the [extempo] section of
+~/.config/face_generator/config.ini (which may also set base_url), and the token is
+cached as in the interactive scripts. Nothing prompts unless stdin is a terminal and a
+credential is missing, or --approve prompt is given, so commands can run from cron or
+a cluster scheduler. Output goes to a new generations_* folder unless --output is set.
+
+Results (S3 keys, predictions, paths) are the only thing written to stdout; progress
+messages go to stderr, so the output can be piped into the next command.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+
+from auth import DEFAULT_CONFIG_PATH, TokenManager, prompt_credentials, read_config
+from batch import JobProgress, passes_filters, run_jobs
+from catalog import Catalog
+from chain import parse_plan, run_chain
+from dedupe import DuplicateDetector
+from display import ImageDisplay
+from extempo_async import AsyncExtempoClient
+from extempo_client import BASE_URL, ExtempoClient
+from image_cache import ImageCache
+from manifest import RunManifest
+from predictions_cache import PredictionsCache
+from rate_limit import RateLimiter
+from screening import compile_rule
+from storage import create_timestamped_folder, get_timestamped_filename, save_predictions
+from sweep import run_sweep
+from target import DEFAULT_MAX_CALLS, DEFAULT_TOLERANCE, ResponseCurve, parse_target, run_targets
+
+
+def parse_filter(text):
+    """
+    Parse 'trait=min:max' (either bound may be empty) into (trait, [min, max]).
+    """
+    trait, sep, bounds = text.partition('=')
+    low, sep2, high = bounds.partition(':')
+    if not (sep and sep2 and trait):
+        raise argparse.ArgumentTypeError(f"expected trait=min:max, got {text!r}")
+    try:
+        return trait.strip(), [float(low) if low.strip() else None, float(high) if high.strip() else None]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bounds must be numbers, got {text!r}")
+
+
+def parse_screen(text):
+    """
+    Check a screening rule when the arguments are parsed; the text itself is passed on.
+    """
+    try:
+        compile_rule(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return text
+
+
+class Session:
+    """
+    Logged-in client, output folder and manifest shared by the subcommands.
+    """
+
+    def __init__(self, args, out=sys.stdout):
+        config = read_config(args.config)
+        self.args = args
+        self.out = out
+        self.base_url = args.base_url or config.get("base_url") or BASE_URL
+        self.client = ExtempoClient(self.base_url, image_cache=ImageCache(), predictions_cache=PredictionsCache(),
+                                    rate_limiter=RateLimiter())
+        self.token_manager = TokenManager(self.client, credentials=lambda: prompt_credentials(args.config))
+        # Faces can only be approved if they are shown, so --approve prompt implies --show
+        show = args.show or getattr(args, "approve", None) == "prompt"
+        self.display = ImageDisplay(None if show else "headless")
+        self.catalog = Catalog()
+        self.duplicates = DuplicateDetector(self.catalog).install()
+        self.output_folder = None
+        self.manifest = None
+
+    def emit(self, line):
+        print(line, file=self.out, flush=True)
+
+    def login(self):
+        token = self.token_manager.get_token()
+        if not token:
+            raise SystemExit("Login failed")
+        return token
+
+    def open_output(self):
+        self.output_folder = self.args.output or create_timestamped_folder()
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.manifest = RunManifest(self.output_folder)
+        print(f"Output will be saved in: {self.output_folder}")
+        return self.output_folder
+
+    def client_options(self):
+        return {"max_concurrency": self.args.max_concurrency, "image_cache": self.client.image_cache,
+                "predictions_cache": self.client.predictions_cache, "token_manager": self.token_manager,
+                "rate_limiter": self.client.rate_limiter}
+
+    def close(self):
+        if self.manifest is not None:
+            self.manifest.close()
+        self.display.close()
+        self.duplicates.uninstall()
+        self.catalog.close()
+        self.client.close()
+
+
+def generate_prompted(session, count, filters, screen=None):
+    """
+    Decode faces one at a time and ask for approval of those that pass the filters and screening rule.
+    """
+    client, manifest, folder = session.client, session.manifest, session.output_folder
+    approved = []
+    while len(approved) < count:
+        face = client.decode_random_face()
+        if not face:
+            break
+        s3_key = face["s3_key"]
+        manifest.decode(s3_key)
+        predictions = client.wait_for_predictions(s3_key)
+        if (filters or screen) and not (predictions and passes_filters(predictions, filters, screen)):
+            print(f"{s3_key} does not pass the filters, skipping")
+            continue
+        image_filename = get_timestamped_filename("random_face", "jpg")
+        image_path = client.wait_for_download(s3_key, image_filename, folder)
+        if not image_path:
+            continue
+        manifest.image(s3_key, image_path)
+        if predictions:
+            predictions_path = save_predictions(predictions, image_filename.replace(".jpg", "_predictions.json"), folder)
+            manifest.predictions(s3_key, predictions, predictions_path)
+        session.display.show(image_path)
+        if session.display.mode == "headless":
+            # No screen to show it on (see FACEGEN_DISPLAY); the file can still be opened by hand
+            print(f"Review {image_path}")
+        if input(f"Approve face {len(approved) + 1}/{count}? (yes/no): ").strip().lower() in ("y", "yes"):
+            approved.append(s3_key)
+    return approved
+
+
+def generate_faces(session, token, count, filters, approve, screen=None):
+    """
+    Return the S3 keys of count accepted faces saved in the session's output folder.
+    """
+    if approve == "prompt":
+        return generate_prompted(session, count, filters, screen)
+    # Unattended: the batch runner checks filters before downloading and can resume into --output
+    session.manifest.close()
+    job = {"id": "cli", "count": count, "filters": filters, "screen": screen, "output": session.output_folder,
+           "attributes": [], "betas": []}
+    run_jobs(token, [job], session.args.parallel, session.base_url, **session.client_options())
+    session.manifest = RunManifest(session.output_folder)
+    progress = JobProgress(session.output_folder)
+    return [progress.items[n].s3_key for n in sorted(progress.items) if progress.items[n].done]
+
+
+def cmd_generate(session, args):
+    token = session.login()
+    session.open_output()
+    keys = generate_faces(session, token, args.count, dict(args.filter), args.approve, args.screen)
+    for s3_key in keys:
+        session.emit(s3_key)
+    return 0 if len(keys) == args.count else 1
+
+
+def cmd_predict(session, args):
+    token = session.login()
+    keys = list(args.s3_keys)
+    if not keys or keys == ["-"]:
+        keys = [line.strip() for line in sys.stdin if line.strip()]
+
+    async def fetch():
+        async with AsyncExtempoClient(session.base_url, token=token, **session.client_options()) as client:
+            return await asyncio.gather(*(client.wait_for_predictions(s3_key) for s3_key in keys))
+
+    results = asyncio.run(fetch())
+    lines = [json.dumps({"s3_key": s3_key, "predictions": predictions}) for s3_key, predictions in zip(keys, results)]
+    if args.json_output:
+        with open(args.json_output, 'w') as f:
+            f.write("".join(f"{line}\n" for line in lines))
+    else:
+        for line in lines:
+            session.emit(line)
+    return 0 if all(results) else 1
+
+
+def run_transformations(session, token, s3_key, attributes, args):
+    results = run_sweep(token, s3_key, attributes, args.betas, session.output_folder, args.control,
+                        args.with_predictions, base_url=session.base_url, manifest=session.manifest,
+                        **session.client_options())
+    for result in sorted(results, key=lambda r: (r["attribute"], r["beta"])):
+        if result["image_path"]:
+            session.display.show(result["image_path"])
+            session.emit(f"{result['attribute']}\t{result['beta']:g}\t{result['s3_key']}\t{result['image_path']}")
+    return 0 if results and all(result["image_path"] for result in results) else 1
+
+
+def cmd_transform(session, args):
+    token = session.login()
+    session.open_output()
+    return run_transformations(session, token, args.s3_key, [args.attribute], args)
+
+
+def cmd_sweep(session, args):
+    token = session.login()
+    session.open_output()
+    s3_key = args.s3_key
+    if not s3_key:
+        keys = generate_faces(session, token, 1, dict(args.filter), args.approve, args.screen)
+        if not keys:
+            print("No face was accepted")
+            return 1
+        s3_key = keys[0]
+    return run_transformations(session, token, s3_key, args.attributes, args)
+
+
+def cmd_target(session, args):
+    token = session.login()
+    session.open_output()
+    s3_key = args.s3_key
+    if not s3_key:
+        keys = generate_faces(session, token, 1, dict(args.filter), args.approve, args.screen)
+        if not keys:
+            print("No face was accepted")
+            return 1
+        s3_key = keys[0]
+    curve = ResponseCurve.from_catalog(session.catalog)
+    print(f"Response curve learned from {len(curve)} transformations")
+    results = run_targets(token, s3_key, dict(args.target), session.output_folder, args.tolerance, curve,
+                          session.base_url, session.manifest,
+                          search_options={"max_calls": args.max_calls, "probes": args.probes,
+                                          "control_attributes": args.control},
+                          **session.client_options())
+    for result in results:
+        if result["image_path"]:
+            session.display.show(result["image_path"])
+        session.emit(f"{result['attribute']}\t{result['beta']:g}\t{result['prediction']:.3f}\t{result['s3_key']}\t"
+                     f"{result['image_path'] or ''}")
+    return 0 if len(results) == len(args.target) and all(result["reached"] for result in results) else 1
+
+
+def cmd_chain(session, args):
+    if args.plan_file:
+        with open(args.plan_file) as f:
+            plan = json.load(f)
+    else:
+        plan = args.plan
+    try:
+        steps = parse_plan(plan, args.control)
+    except (ValueError, KeyError) as e:
+        raise RuntimeError(f"Invalid plan: {e}")
+    token = session.login()
+    session.open_output()
+    s3_key = args.s3_key
+    if not s3_key:
+        keys = generate_faces(session, token, 1, dict(args.filter), args.approve, args.screen)
+        if not keys:
+            print("No face was accepted")
+            return 1
+        s3_key = keys[0]
+    results = run_chain(token, s3_key, steps, session.output_folder, args.with_predictions,
+                        base_url=session.base_url, manifest=session.manifest, **session.client_options())
+    for step in steps:
+        result = results.get(step.id)
+        if result and result["image_path"]:
+            session.display.show(result["image_path"])
+            session.emit(f"{step.id}\t{result['s3_key']}\t{result['image_path']}")
+    return 0 if all(results.get(step.id, {}).get("image_path") for step in steps) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate, score and transform faces with the Extempo API")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="INI file with an [extempo] section")
+    parser.add_argument("--base-url", help=f"API root (default: config base_url or {BASE_URL})")
+    parser.add_argument("--output", help="output folder (default: a new generations_* folder)")
+    parser.add_argument("--show", action="store_true",
+                        help="display images (FACEGEN_DISPLAY picks how); implied by --approve prompt")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="HTTP requests in flight")
+    parser.add_argument("--parallel", type=int, default=8, help="faces generated at once when unattended")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_face_options(subparser):
+        subparser.add_argument("--filter", type=parse_filter, action="append", default=[], metavar="TRAIT=MIN:MAX",
+                               help="only accept faces whose prediction is within bounds; repeatable")
+        subparser.add_argument("--screen", type=parse_screen, metavar="RULE",
+                               help="only accept faces whose predictions match, e.g. 'gender > 0.5 and |age| < 1'")
+        subparser.add_argument("--approve", choices=("auto", "prompt"), default="auto",
+                               help="accept faces passing the filters automatically or ask for each one")
+
+    def add_transform_options(subparser):
+        subparser.add_argument("--betas", type=float, nargs="+", required=True)
+        subparser.add_argument("--control", nargs="+", help="attributes held constant")
+        subparser.add_argument("--with-predictions", action="store_true", help="also save predictions of results")
+
+    generate = subparsers.add_parser("generate", help="generate random faces")
+    generate.add_argument("--count", type=int, default=1)
+    add_face_options(generate)
+    generate.set_defaults(run=cmd_generate)
+
+    predict = subparsers.add_parser("predict", help="print predictions for S3 keys as JSON lines")
+    predict.add_argument("s3_keys", nargs="*", help="S3 keys, or - / nothing to read them from stdin")
+    predict.add_argument("--json-output", help="write the JSON lines to this file")
+    predict.set_defaults(run=cmd_predict)
+
+    transform = subparsers.add_parser("transform", help="transform one face along one attribute")
+    transform.add_argument("--s3-key", required=True)
+    transform.add_argument("--attribute", required=True)
+    add_transform_options(transform)
+    transform.set_defaults(run=cmd_transform)
+
+    sweep = subparsers.add_parser("sweep", help="transform a face along several attributes")
+    sweep.add_argument("--s3-key", help="face to transform (default: generate one)")
+    sweep.add_argument("--attributes", nargs="+", required=True)
+    add_transform_options(sweep)
+    add_face_options(sweep)
+    sweep.set_defaults(run=cmd_sweep)
+
+    target = subparsers.add_parser("target", help="find the betas that give a face target predictions")
+    target.add_argument("--s3-key", help="face to transform (default: generate one)")
+    target.add_argument("--target", type=parse_target, action="append", required=True, metavar="TRAIT=VALUE",
+                        help="prediction to reach; repeatable")
+    target.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    target.add_argument("--max-calls", type=int, default=DEFAULT_MAX_CALLS, help="transformations per target")
+    target.add_argument("--probes", type=int, default=1, help="betas requested in the first transformation")
+    target.add_argument("--control", nargs="+", help="attributes held constant")
+    add_face_options(target)
+    target.set_defaults(run=cmd_target)
+
+    chain = subparsers.add_parser("chain", help="apply chained and branched transformations to a face")
+    chain.add_argument("--s3-key", help="face to transform (default: generate one)")
+    plan = chain.add_mutually_exclusive_group(required=True)
+    plan.add_argument("--plan", help="steps such as 'attractive+2>age+1, gender+1'")
+    plan.add_argument("--plan-file", help="JSON list of {id, parent, attribute, beta} steps")
+    chain.add_argument("--control", nargs="+", help="attributes held constant")
+    chain.add_argument("--with-predictions", action="store_true", help="also save predictions of results")
+    add_face_options(chain)
+    chain.set_defaults(run=cmd_chain)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    session = Session(args, out=sys.stdout)
+    # The client and storage helpers report progress with print(); keep it off stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return args.run(session, args)
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+        finally:
+            session.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+Contact sheets and animations of transformation sweeps.
+
+Instead of opening one viewer window per image, a sweep (or a whole attribute x beta
+grid) is composited into one labeled sheet, one row per attribute (and face) and one
+column per beta:
+
+    python contact_sheet.py generations_20241021_102456
+    python contact_sheet.py generations_20241021_102456 --gif sweep.gif --tile 256
+    python contact_sheet.py generations_20241021_102456 --mp4 sweep.mp4   # needs ffmpeg on PATH
+
+Sheets are written as PNG so the catalog does not index them as generated images.
+
+The animation steps through the betas, each frame showing every row at that beta side
+by side. Tiles are decoded in a thread pool at reduced scale (JPEG draft mode), and
+the grid is assembled with NumPy reshapes and slice assignments rather than per-tile
+paste calls, so sheets of hundreds of faces render in well under a second. PIL only
+draws the label text.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from catalog import DEFAULT_CATALOG_PATH, Catalog
+from storage import get_timestamped_filename
+from sweep import format_beta
+
+
+DEFAULT_TILE = 192
+DEFAULT_GAP = 4
+BACKGROUND = 255
+MISSING = 200
+
+_LABEL_WIDTH = 140
+_HEADER_HEIGHT = 28
+
+
+def load_tiles(paths, tile_size=DEFAULT_TILE, workers=8):
+    """
+    Decode images into one (N, tile, tile, 3) uint8 array; missing or unreadable images are left gray.
+    """
+    from PIL import Image
+
+    tiles = np.full((len(paths), tile_size, tile_size, 3), MISSING, dtype=np.uint8)
+
+    def load(index):
+        path = paths[index]
+        if not path:
+            return
+        try:
+            with Image.open(path) as image:
+                image.draft("RGB", (tile_size, tile_size))
+                image = image.convert("RGB")
+                image.thumbnail((tile_size, tile_size), Image.BILINEAR)
+                pixels = np.asarray(image)
+        except Exception as e:
+            print(f"Cannot read {path}: {e}")
+            return
+        # Center faces that are not square
+        top, left = (tile_size - pixels.shape[0]) // 2, (tile_size - pixels.shape[1]) // 2
+        tiles[index, top:top + pixels.shape[0], left:left + pixels.shape[1]] = pixels
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(load, range(len(paths))))
+    return tiles
+
+
+def tile_grid(tiles, rows, cols, gap=DEFAULT_GAP):
+    """
+    Lay out (rows * cols, h, w, 3) tiles row by row into one (rows*(h+gap)-gap, cols*(w+gap)-gap, 3) image.
+    """
+    count, height, width, channels = tiles.shape
+    if count < rows * cols:
+        tiles = np.concatenate([tiles, np.full((rows * cols - count, height, width, channels), BACKGROUND,
+                                               dtype=tiles.dtype)])
+    padded = np.pad(tiles[:rows * cols], ((0, 0), (0, gap), (0, gap), (0, 0)), constant_values=BACKGROUND)
+    grid = padded.reshape(rows, cols, height + gap, width + gap, channels).transpose(0, 2, 1, 3, 4)
+    grid = grid.reshape(rows * (height + gap), cols * (width + gap), channels)
+    return grid[:grid.shape[0] - gap, :grid.shape[1] - gap]
+
+
+def _fit_label(draw, label, fonts, width):
+    """
+    Pick the largest font in which label fits width, trimming it with an ellipsis if even the smallest is too wide.
+    """
+    for font in fonts:
+        if draw.textlength(label, font=font) <= width:
+            return label, font
+    while label and draw.textlength(label + "…", font=font) > width:
+        label = label[:-1]
+    return label.rstrip() + "…", font
+
+
+def _label_strip(labels, length, step, thickness, vertical):
+    """
+    Render labels centred in consecutive cells of size step along a strip, shrunk or cut to fit their cell.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    size = (thickness, length) if vertical else (length, thickness)
+    strip = Image.new("RGB", size, (BACKGROUND,) * 3)
+    draw = ImageDraw.Draw(strip)
+    fonts = [ImageFont.load_default(size=points) for points in (14, 13, 12, 11, 10)]
+    width = thickness - 12 if vertical else step - 8
+    for i, label in enumerate(labels):
+        label, font = _fit_label(draw, label, fonts, width)
+        left, top, right, bottom = draw.textbbox((0, 0), label, font=font)
+        centre = i * step + (step - (bottom - top if vertical else right - left)) // 2
+        position = (6, centre - top) if vertical else (centre - left, (thickness - (bottom - top)) // 2 - top)
+        draw.text(position, label, fill=(0, 0, 0), font=font)
+    return np.asarray(strip)
+
+
+def contact_sheet(cells, row_labels, col_labels, tile_size=DEFAULT_TILE, gap=DEFAULT_GAP, tiles=None):
+    """
+    Composite a grid of images with row and column labels.
+
+    :param cells: List of rows, each a list of image paths (None for a missing image)
+    :param tiles: Already loaded tiles for cells, as returned by load_tiles, to skip decoding
+    :return: (H, W, 3) uint8 array
+    """
+    rows, cols = len(cells), max((len(row) for row in cells), default=0)
+    if tiles is None:
+        tiles = load_tiles([row[col] if col < len(row) else None for row in cells for col in range(cols)], tile_size)
+    grid = tile_grid(tiles, rows, cols, gap)
+    step = tile_size + gap
+    sheet = np.full((grid.shape[0] + _HEADER_HEIGHT, grid.shape[1] + _LABEL_WIDTH, 3), BACKGROUND, dtype=np.uint8)
+    sheet[_HEADER_HEIGHT:, _LABEL_WIDTH:] = grid
+    sheet[:_HEADER_HEIGHT, _LABEL_WIDTH:] = _label_strip(col_labels, grid.shape[1], step, _HEADER_HEIGHT, False)
+    sheet[_HEADER_HEIGHT:, :_LABEL_WIDTH] = _label_strip(row_labels, grid.shape[0], step, _LABEL_WIDTH, True)
+    return sheet
+
+
+def animation_frames(cells, row_labels, col_labels, tile_size=DEFAULT_TILE, gap=DEFAULT_GAP):
+    """
+    One frame per column (beta): the rows at that beta side by side, labeled with the row and beta.
+
+    :return: (frames, H, W, 3) uint8 array
+    """
+    rows, cols = len(cells), max((len(row) for row in cells), default=0)
+    tiles = load_tiles([row[col] if col < len(row) else None for row in cells for col in range(cols)], tile_size)
+    # (rows, cols, ...) -> (cols, rows, ...): frame j holds every row's tile at column j
+    by_column = tiles.reshape(rows, cols, tile_size, tile_size, 3).transpose(1, 0, 2, 3, 4)
+    row_strip = _label_strip(row_labels, rows * (tile_size + gap) - gap, tile_size + gap, _HEADER_HEIGHT, False)
+    frames = []
+    for col in range(cols):
+        strip = tile_grid(by_column[col], 1, rows, gap)
+        frame = np.full((strip.shape[0] + 2 * _HEADER_HEIGHT, strip.shape[1], 3), BACKGROUND, dtype=np.uint8)
+        frame[:_HEADER_HEIGHT] = row_strip
+        frame[_HEADER_HEIGHT:-_HEADER_HEIGHT] = strip
+        frame[-_HEADER_HEIGHT:] = _label_strip([col_labels[col]], strip.shape[1], strip.shape[1], _HEADER_HEIGHT,
+                                               False)
+        frames.append(frame)
+    return np.stack(frames)
+
+
+def save_sheet(sheet, path):
+    from PIL import Image
+
+    Image.fromarray(sheet).save(path)
+    print(f"Contact sheet saved as '{path}'")
+    return path
+
+
+def save_gif(frames, path, frame_seconds=0.6):
+    from PIL import Image
+
+    images = [Image.fromarray(frame) for frame in frames]
+    # Play forwards then back so the sweep reads as a continuous change
+    sequence = images + images[-2:0:-1]
+    sequence[0].save(path, save_all=True, append_images=sequence[1:], duration=int(frame_seconds * 1000), loop=0)
+    print(f"Animation saved as '{path}'")
+    return path
+
+
+def save_mp4(frames, path, frame_seconds=0.6):
+    """
+    Encode frames as H.264 by piping raw RGB to the ffmpeg executable.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("Writing MP4 needs ffmpeg on PATH; use a GIF instead")
+    count, height, width, channels = frames.shape
+    # H.264 with yuv420p wants even dimensions
+    frames = np.pad(frames, ((0, 0), (0, height % 2), (0, width % 2), (0, 0)), constant_values=BACKGROUND)
+    command = [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+               "-s", f"{frames.shape[2]}x{frames.shape[1]}", "-r", f"{1 / frame_seconds:g}", "-i", "-",
+               "-c:v", "libx264", "-pix_fmt", "yuv420p", "-r", "25", path]
+    subprocess.run(command, input=np.ascontiguousarray(frames).tobytes(), check=True)
+    print(f"Animation saved as '{path}'")
+    return path
+
+
+def cells_from_results(results):
+    """
+    Arrange sweep results (dicts with attribute, beta and image_path, as returned by run_sweep) into a grid.
+
+    :return: (cells, row_labels, col_labels)
+    """
+    return _arrange((result["attribute"], None, result["beta"], result["image_path"]) for result in results)
+
+
+def save_sweep_sheet(results, folder, tile_size=DEFAULT_TILE):
+    """
+    Save the contact sheet of one sweep's results in folder.
+
+    :return: Path of the sheet, or None if no image was saved
+    """
+    results = [result for result in results if result.get("image_path")]
+    if not results:
+        return None
+    cells, row_labels, col_labels = cells_from_results(results)
+    attributes = "_".join(sorted({result["attribute"] for result in results}))
+    path = os.path.join(folder, get_timestamped_filename(f"contact_sheet_{attributes}", "png"))
+    return save_sheet(contact_sheet(cells, row_labels, col_labels, tile_size), path)
+
+
+def cells_from_catalog(catalog, folder):
+    """
+    Arrange the transformed images of one run folder into a grid with a row per face and attribute.
+    """
+    rows = catalog.find(kind="image", folder=os.path.normpath(folder))
+    return _arrange((row["attribute"], row["face_key"], row["beta"], row["path"])
+                    for row in rows if row["attribute"] is not None and row["beta"] is not None)
+
+
+def _arrange(items):
+    grid = {}
+    betas = set()
+    faces = set()
+    for attribute, face, beta, path in items:
+        if not path:
+            continue
+        beta = float(beta)
+        betas.add(beta)
+        faces.add(face)
+        grid.setdefault((attribute, face), {})[beta] = path
+    betas = sorted(betas)
+    keys = sorted(grid, key=lambda key: (key[0], key[1] or ""))
+    # The face is only worth a label when the grid has more than one
+    row_labels = [attribute if len(faces) == 1 else f"{attribute} {(face or '').split('/')[-1][:8]}"
+                  for attribute, face in keys]
+    cells = [[grid[key].get(beta) for beta in betas] for key in keys]
+    return cells, row_labels, [f"beta {format_beta(beta)}" for beta in betas]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Composite a run's transformed images into a contact sheet")
+    parser.add_argument("folder", help="run folder to render")
+    parser.add_argument("--sheet", help="sheet image to write (default: <folder>/contact_sheet.png)")
+    parser.add_argument("--gif", help="also write an animation stepping through the betas")
+    parser.add_argument("--mp4", help="also write the animation as MP4 (needs ffmpeg)")
+    parser.add_argument("--tile", type=int, default=DEFAULT_TILE, help="tile size in pixels")
+    parser.add_argument("--frame-seconds", type=float, default=0.6)
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    args = parser.parse_args()
+
+    with Catalog(args.catalog) as catalog:
+        catalog.scan([args.folder])
+        cells, row_labels, col_labels = cells_from_catalog(catalog, args.folder)
+    if not cells:
+        print(f"No transformed images with an attribute and beta in {args.folder}")
+        return
+    save_sheet(contact_sheet(cells, row_labels, col_labels, args.tile),
+               args.sheet or os.path.join(args.folder, "contact_sheet.png"))
+    if args.gif or args.mp4:
+        frames = animation_frames(cells, row_labels, col_labels, args.tile)
+        if args.gif:
+            save_gif(frames, args.gif, args.frame_seconds)
+        if args.mp4:
+            save_mp4(frames, args.mp4, args.frame_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Perceptual-hash duplicate detection for the saved images.
+
+Every JPEG gets a 64-bit DCT perceptual hash (pHash); images whose hashes differ in
+at most a few bits look the same to a person even if their bytes differ. Hashes are
+stored in the catalog's image_hashes table, computed in a process pool for the images
+already on disk, and looked up through a BK-tree, which only visits the part of the
+corpus that can be within the requested distance.
+
+    python dedupe.py index              # hash every catalogued image not hashed yet
+    python dedupe.py groups --distance 4
+    python dedupe.py near some/image.jpg --distance 8
+
+DuplicateDetector(catalog).install() hooks into storage.save_hooks so new downloads
+are hashed, checked and flagged as they are written.
+"""
+import argparse
+import io
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import storage
+from catalog import DEFAULT_CATALOG_PATH, Catalog
+
+
+# Hamming distance at or below which two images count as near duplicates
+DEFAULT_DISTANCE = 6
+
+_HASH_SIZE = 8
+_DCT_SIZE = 32
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def phash(image):
+    """
+    Return the 64-bit perceptual hash of a PIL image, JPEG bytes or a file path.
+    """
+    from PIL import Image
+
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    elif isinstance(image, str):
+        image = Image.open(image)
+    # Let the JPEG decoder downscale while decoding; far cheaper than a full-size decode
+    image.draft("L", (_DCT_SIZE * 2, _DCT_SIZE * 2))
+    pixels = np.asarray(image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    # The DC term only reflects overall brightness and is left out of the median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def face_name(key):
+    """
+    Return the name of the generated face an image key descends from, '<uuid>~~generated.jpeg' for the face
+    and every transform of it alike, or None for no key. Works on full S3 keys and 'path/id' pairs.
+    """
+    if not key:
+        return None
+    return '~~'.join(key.rsplit('/', 1)[-1].split('~~')[:2])
+
+
+def hash_file(path):
+    """
+    Process-pool worker: return (path, mtime_ns, phash), with phash None if the file cannot be decoded.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        return path, mtime_ns, phash(path)
+    except Exception as e:
+        print(f"Cannot hash {path}: {e}")
+        return path, 0, None
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance.
+
+    Each node keeps children keyed by their distance to it; by the triangle inequality a
+    query within distance d only needs to descend into children keyed node_distance +/- d.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        node = [value, [item], {}]
+        if self.root is None:
+            self.root = node
+            self.size += 1
+            return
+        current = self.root
+        while True:
+            d = distance(value, current[0])
+            if d == 0:
+                current[1].append(item)
+                self.size += 1
+                return
+            child = current[2].get(d)
+            if child is None:
+                current[2][d] = node
+                self.size += 1
+                return
+            current = child
+
+    def query(self, value, max_distance):
+        """
+        Return [(distance, item)] for every item within max_distance of value, closest first.
+        """
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            d = distance(value, node_value)
+            if d <= max_distance:
+                found.extend((d, item) for item in items)
+            for child_distance, child in children.items():
+                if d - max_distance <= child_distance <= d + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def __len__(self):
+        return self.size
+
+
+def index_images(catalog, workers=None, chunksize=16):
+    """
+    Hash every catalogued image without a current hash, in a process pool.
+
+    :return: Number of images hashed
+    """
+    paths = catalog.unhashed_images()
+    if not paths:
+        return 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = [result for result in pool.map(hash_file, paths, chunksize=chunksize) if result[2] is not None]
+    catalog.store_hashes([(path, mtime_ns, value, None, None) for path, mtime_ns, value in results])
+    return len(results)
+
+
+def build_tree(catalog):
+    tree = BKTree()
+    for path, value, duplicate_of in catalog.hashes():
+        tree.add(value, path)
+    return tree
+
+
+def duplicate_groups(catalog, max_distance=DEFAULT_DISTANCE):
+    """
+    Group images that are within max_distance of each other (transitively), leaving out
+    pairs that descend from the same face.
+
+    :return: List of path lists with more than one member, largest first
+    """
+    tree = BKTree()
+    hashes = catalog.hashes()
+    faces = {path: face_name(key) for path, key in catalog.hash_faces().items()}
+    parent = {path: path for path, value, duplicate_of in hashes}
+
+    def find(path):
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for path, value, duplicate_of in hashes:
+        for d, other in tree.query(value, max_distance):
+            # A face and its small-beta transforms look alike by design
+            if faces.get(path) is None or faces.get(path) != faces.get(other):
+                parent[find(other)] = find(path)
+        tree.add(value, path)
+    groups = {}
+    for path in parent:
+        groups.setdefault(find(path), []).append(path)
+    return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+
+class DuplicateDetector:
+    """
+    Flags near-duplicate images as they are saved.
+
+    The BK-tree is loaded from the catalog's stored hashes; each new image is hashed,
+    compared against it, added to it and stored with the nearest earlier image in
+    duplicate_of when one is within max_distance. Images of the same face (a face and
+    its transforms, e.g. a sweep's small beta steps) are not flagged against each other.
+
+    :param catalog: Catalog holding the stored hashes
+    :param max_distance: Hamming distance at or below which an image is flagged
+    """
+
+    def __init__(self, catalog, max_distance=DEFAULT_DISTANCE):
+        self.catalog = catalog
+        self.max_distance = max_distance
+        self.tree = build_tree(catalog)
+        self.faces = {path: face_name(key) for path, key in catalog.hash_faces().items()}
+        self.flagged = []
+        self.lock = threading.Lock()
+
+    def install(self):
+        storage.save_hooks.append(self.check)
+        return self
+
+    def uninstall(self):
+        if self.check in storage.save_hooks:
+            storage.save_hooks.remove(self.check)
+
+    def check(self, path, image_data=None, image_key=None):
+        """
+        Hash one saved image and return [(distance, path)] of its near duplicates of other faces.
+        Streamed downloads pass no image_data and are hashed from the file.
+        """
+        try:
+            value = phash(image_data if image_data is not None else path)
+        except Exception as e:
+            print(f"Cannot hash {path}: {e}")
+            return []
+        face = face_name(image_key)
+        with self.lock:
+            matches = [(d, other) for d, other in self.tree.query(value, self.max_distance)
+                       if other != path and (face is None or self.faces.get(other) != face)]
+            self.tree.add(value, path)
+            self.faces[path] = face
+        duplicate_of = matches[0][1] if matches else None
+        try:
+            self.catalog.store_hashes([(path, os.stat(path).st_mtime_ns, value, duplicate_of, face)])
+        except (sqlite3.Error, OSError) as e:
+            # The image itself is saved; losing its hash must not fail the download
+            print(f"Cannot store the hash of {path}: {e}")
+        if matches:
+            self.flagged.append((path, matches))
+            print(f"Near duplicate: {path} is {matches[0][0]} bits from {duplicate_of}")
+        return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images with perceptual hashes")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--root", default=".")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index = subparsers.add_parser("index", help="scan the folders and hash new images")
+    index.add_argument("--workers", type=int, help="hashing processes (default: CPU count)")
+    groups = subparsers.add_parser("groups", help="list groups of near-duplicate images")
+    groups.add_argument("--distance", type=int, default=DEFAULT_DISTANCE)
+    near = subparsers.add_parser("near", help="list images within a distance of one image")
+    near.add_argument("path")
+    near.add_argument("--distance", type=int, default=DEFAULT_DISTANCE)
+    args = parser.parse_args()
+
+    with Catalog(args.catalog, args.root) as catalog:
+        if args.command == "index":
+            catalog.scan()
+            print(f"Hashed {index_images(catalog, args.workers)} images")
+        elif args.command == "groups":
+            for group in duplicate_groups(catalog, args.distance):
+                print(f"{len(group)} images:")
+                for path in group:
+                    print(f"  {path}")
+        else:
+            tree = build_tree(catalog)
+            for d, path in tree.query(phash(args.path), args.distance):
+                print(f"{d:>3}  {path}")
+
+
+if __name__ == "__main__":
+    main()
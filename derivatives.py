@@ -0,0 +1,237 @@
+"""
+Small preview versions of the saved images for review tools and galleries.
+
+Every catalogued image gets a JPEG thumbnail and WebP versions at several sizes, so a
+viewer loads a few kilobytes instead of the full 1024px StyleGAN JPEG. Outputs mirror
+the run folders under derivatives/:
+
+    derivatives/generations_20241021_102456/random_face_20241021_102501_128.jpg
+    derivatives/generations_20241021_102456/random_face_20241021_102501_256.webp
+    derivatives/generations_20241021_102456/manifest.json
+
+Each folder's manifest.json maps a source image name to the size and mtime it was
+built from and to its outputs (path, width, height, bytes), so a gallery can read it
+directly and a rebuild only touches new or changed sources. Images are processed in a
+process pool, one source per task, and each source is decoded once: the JPEG decoder
+scales it down to about the largest output size while decoding and the smaller sizes
+are resized from the next larger one.
+
+    python derivatives.py build                    # every generations_* folder
+    python derivatives.py build generations_2024*  # some folders
+    python derivatives.py build --variant 96:jpeg --variant 384:webp
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from catalog import DEFAULT_CATALOG_PATH, Catalog
+
+
+DEFAULT_ROOT = "derivatives"
+
+# (longest side in pixels, format) pairs built for every image
+DEFAULT_VARIANTS = ((128, "jpeg"), (256, "webp"), (512, "webp"))
+
+MANIFEST_NAME = "manifest.json"
+
+_EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+_SAVE_OPTIONS = {"jpeg": {"quality": 82, "optimize": True, "progressive": True},
+                 "webp": {"quality": 80, "method": 4}}
+
+
+def parse_variant(text):
+    """
+    Parse 'size:format' (format jpeg or webp, default webp) into (size, format).
+    """
+    size, _, image_format = text.partition(':')
+    image_format = (image_format or "webp").lower().replace("jpg", "jpeg")
+    try:
+        size = int(size)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected size:format, got {text!r}")
+    if size <= 0 or image_format not in _EXTENSIONS:
+        raise argparse.ArgumentTypeError(f"expected a positive size and jpeg or webp, got {text!r}")
+    return size, image_format
+
+
+def variant_name(size, image_format):
+    return f"{size}.{_EXTENSIONS[image_format]}"
+
+
+def make_derivatives(source, out_dir, variants):
+    """
+    Process-pool worker: build every variant of one image.
+
+    :return: (source, {variant name: {path, width, height, bytes}}, error message or None)
+    """
+    from PIL import Image
+
+    outputs = {}
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(source))[0]
+        largest = max(size for size, image_format in variants)
+        with Image.open(source) as image:
+            # Decode at a reduced scale when the JPEG allows it; never below the largest output
+            image.draft("RGB", (largest, largest))
+            image = image.convert("RGB")
+            # Largest first, each size resized from the previous one: a pyramid instead of N full-size resizes
+            current = image
+            for size, image_format in sorted(variants, reverse=True):
+                if max(current.size) > size:
+                    scale = size / max(current.size)
+                    current = current.resize((max(1, round(current.width * scale)), max(1, round(current.height * scale))),
+                                             Image.LANCZOS, reducing_gap=2.0)
+                path = os.path.join(out_dir, f"{stem}_{variant_name(size, image_format)}")
+                tmp_path = f"{path}.part"
+                current.save(tmp_path, format=image_format.upper(), **_SAVE_OPTIONS[image_format])
+                os.replace(tmp_path, path)
+                outputs[variant_name(size, image_format)] = {"path": path, "width": current.width,
+                                                             "height": current.height,
+                                                             "bytes": os.path.getsize(path)}
+    except Exception as e:
+        return source, outputs, f"{type(e).__name__}: {e}"
+    return source, outputs, None
+
+
+class DerivativesManifest:
+    """
+    The manifest.json of one output folder: which sources have been built, from what, into what.
+    """
+
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.images = {}
+        self.changed = False
+        try:
+            with open(self.path) as f:
+                self.images = json.load(f).get("images", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Rebuilding unreadable {self.path}: {e}")
+
+    def is_current(self, name, size, mtime_ns, variants):
+        entry = self.images.get(name)
+        return (entry is not None and entry["size"] == size and entry["mtime_ns"] == mtime_ns
+                and all(variant_name(*variant) in entry["outputs"] for variant in variants))
+
+    def record(self, name, size, mtime_ns, outputs):
+        # Outputs of variants no longer built are removed rather than left orphaned
+        out_dir = os.path.dirname(self.path)
+        for variant, output in self.images.get(name, {}).get("outputs", {}).items():
+            if variant not in outputs:
+                try:
+                    os.unlink(os.path.join(out_dir, output["path"]))
+                except FileNotFoundError:
+                    pass
+        self.images[name] = {"size": size, "mtime_ns": mtime_ns,
+                             "outputs": {variant: dict(output, path=os.path.basename(output["path"]))
+                                         for variant, output in sorted(outputs.items())}}
+        self.changed = True
+
+    def prune(self, names):
+        """
+        Drop entries (and their files) whose source is no longer in names.
+        """
+        out_dir = os.path.dirname(self.path)
+        for name in set(self.images) - set(names):
+            for output in self.images.pop(name)["outputs"].values():
+                try:
+                    os.unlink(os.path.join(out_dir, output["path"]))
+                except FileNotFoundError:
+                    pass
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"images": dict(sorted(self.images.items()))}, f, indent=1)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def build(catalog, folders=None, variants=DEFAULT_VARIANTS, root=DEFAULT_ROOT, workers=None):
+    """
+    Build the missing or outdated derivatives of every catalogued image in folders.
+
+    :param folders: Run folders to process; defaults to every catalogued folder
+    :return: dict with the number of images built, skipped (already current), failed and pruned
+    """
+    variants = [tuple(variant) for variant in variants]
+    sources = {}
+    for row in catalog.find(kind="image"):
+        if folders is None or row["folder"] in folders:
+            sources.setdefault(row["folder"], []).append(row)
+
+    counts = {"built": 0, "current": 0, "failed": 0, "pruned": 0}
+    manifests = {}
+    tasks = []
+    out_dirs = {folder: os.path.join(root, os.path.relpath(folder, catalog.root)) for folder in sources}
+    for folder, rows in sources.items():
+        manifest = manifests[folder] = DerivativesManifest(out_dirs[folder])
+        names = [os.path.basename(row["path"]) for row in rows]
+        before = len(manifest.images)
+        manifest.prune(names)
+        counts["pruned"] += before - len(manifest.images)
+        for row, name in zip(rows, names):
+            if manifest.is_current(name, row["size"], row["mtime_ns"], variants):
+                counts["current"] += 1
+            else:
+                tasks.append((folder, name, row))
+    if not tasks:
+        for manifest in manifests.values():
+            manifest.save()
+        return counts
+
+    print(f"Building derivatives of {len(tasks)} images ({counts['current']} already current)")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(make_derivatives, row["path"], out_dirs[folder], variants): (folder, name, row)
+                       for folder, name, row in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                folder, name, row = futures[future]
+                source, outputs, error = future.result()
+                if error:
+                    print(f"Cannot build derivatives of {source}: {error}")
+                    counts["failed"] += 1
+                    continue
+                manifests[folder].record(name, row["size"], row["mtime_ns"], outputs)
+                counts["built"] += 1
+                if done % 500 == 0:
+                    print(f"{done}/{len(tasks)} images")
+    finally:
+        # Whatever finished is kept even if the run is interrupted
+        for manifest in manifests.values():
+            manifest.save()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build thumbnails and WebP previews of the saved images")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--root", default=".", help="directory containing the generations_* folders")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build missing or outdated derivatives")
+    build_parser.add_argument("folders", nargs="*", help="run folders (default: all)")
+    build_parser.add_argument("--variant", type=parse_variant, action="append", metavar="SIZE:FORMAT",
+                              help=f"size and format to build; repeatable (default: "
+                                   f"{' '.join(f'{size}:{image_format}' for size, image_format in DEFAULT_VARIANTS)})")
+    build_parser.add_argument("--output", default=DEFAULT_ROOT, help="directory the derivatives are written to")
+    build_parser.add_argument("--workers", type=int, help="processes (default: CPU count)")
+    args = parser.parse_args()
+
+    with Catalog(args.catalog, args.root) as catalog:
+        folders = [os.path.normpath(folder) for folder in args.folders] or None
+        catalog.scan(folders)
+        counts = build(catalog, folders, args.variant or DEFAULT_VARIANTS, args.output, args.workers)
+    print(f"{counts['built']} built, {counts['current']} already current, {counts['failed']} failed, "
+          f"{counts['pruned']} pruned")
+
+
+if __name__ == "__main__":
+    main()
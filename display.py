@@ -0,0 +1,122 @@
+import os
+import queue
+import sys
+import threading
+
+
+DISPLAY_MODES = ("headless", "external", "viewer")
+
+# Longest side of the image in the viewer window
+VIEWER_SIZE = 768
+
+
+def default_mode():
+    """
+    Pick the display mode from the FACEGEN_DISPLAY environment variable, falling back to
+    headless on machines without a display and to the external viewer everywhere else.
+    """
+    mode = os.environ.get("FACEGEN_DISPLAY", "").strip().lower()
+    if mode in DISPLAY_MODES:
+        return mode
+    if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        return "headless"
+    return "external"
+
+
+class ImageDisplay:
+    """
+    Shows saved images without tying the caller to how (or whether) they are displayed.
+
+    Modes:
+      headless  - do nothing; the image is never decoded, so batch runs go at network speed
+      external  - open each image in the system viewer (one process per image, as before)
+      viewer    - a single Tk window on a background thread, replaced with every new image
+
+    :param mode: One of DISPLAY_MODES, or None to use default_mode()
+    """
+
+    def __init__(self, mode=None):
+        self.mode = mode or default_mode()
+        if self.mode not in DISPLAY_MODES:
+            raise ValueError(f"Unknown display mode {self.mode!r}, expected one of {DISPLAY_MODES}")
+        self.queue = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    def show(self, image_path, title=None):
+        if self.mode == "headless":
+            return
+        if self.mode == "viewer":
+            # Falls back to the external mode if Tk cannot start
+            self._ensure_viewer()
+        if self.mode == "viewer":
+            self.queue.put((image_path, title or os.path.basename(image_path)))
+        else:
+            from PIL import Image
+            Image.open(image_path).show()
+
+    def wait(self):
+        """
+        Block until the user closes the viewer window, so the last image stays up until the
+        script exits. Returns at once in the other modes.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            print("Close the image window to exit")
+            self.thread.join()
+        self.queue = None
+        self.thread = None
+
+    def close(self):
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+            self.queue = None
+            self.thread = None
+
+    def _ensure_viewer(self):
+        # Started again if the user closed the window
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.queue = queue.Queue()
+        self.ready.clear()
+        self.thread = threading.Thread(target=self._run_viewer, name="image-viewer", daemon=True)
+        self.thread.start()
+        self.ready.wait(timeout=5)
+
+    def _run_viewer(self):
+        try:
+            import tkinter
+            from PIL import Image, ImageTk
+            root = tkinter.Tk()
+        except Exception as e:
+            print(f"Image viewer unavailable ({e}), falling back to the external viewer")
+            self.mode = "external"
+            self.ready.set()
+            return
+
+        root.title("Face generator")
+        label = tkinter.Label(root)
+        label.pack()
+        self.ready.set()
+
+        def poll():
+            try:
+                while True:
+                    item = self.queue.get_nowait()
+                    if item is None:
+                        root.destroy()
+                        return
+                    image_path, title = item
+                    image = Image.open(image_path)
+                    image.thumbnail((VIEWER_SIZE, VIEWER_SIZE))
+                    photo = ImageTk.PhotoImage(image)
+                    label.configure(image=photo)
+                    # Tk does not hold a reference to the image itself
+                    label.image = photo
+                    root.title(title)
+            except queue.Empty:
+                pass
+            root.after(50, poll)
+
+        root.after(50, poll)
+        root.mainloop()
@@ -0,0 +1,368 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+from extempo_client import BASE_URL, predictions_key, split_s3_key
+from rate_limit import parse_retry_after
+from readiness import PermanentError, ReadinessPoller, is_transient
+from storage import CHUNK_SIZE, ImageWriter, run_save_hooks
+
+
+# Downloaded chunks handed to the writer thread at once
+WRITE_BATCH = 4
+
+
+class AsyncExtempoClient:
+    """
+    asyncio counterpart of ExtempoClient covering the same endpoints.
+
+    All requests share one aiohttp session and pass through a semaphore, so a caller can
+    fan out hundreds of decode/image/prediction calls while at most max_concurrency are
+    in flight at once. Use it as an async context manager.
+
+    :param base_url: Gateway URL
+    :param token: Bearer token, may also be set later with set_token
+    :param timeout: Total timeout in seconds for a single request
+    :param max_concurrency: Maximum number of requests in flight
+    :param ready_deadline: Seconds wait_for_image / wait_for_predictions keep polling
+    :param image_cache: Optional ImageCache consulted before downloading an image
+    :param predictions_cache: Optional PredictionsCache consulted before requesting predictions
+    :param token_manager: Optional TokenManager used to refresh the token after a 401
+    :param rate_limiter: Optional RateLimiter every request waits on; 429s are retried up to throttle_retries times
+    :param throttle_retries: How often a 429 response is retried when a rate limiter is set
+    :param observers: Callables called after every HTTP exchange as
+        observer(method, endpoint, status, seconds, nbytes), as with ExtempoClient.observers
+    """
+
+    def __init__(self, base_url=BASE_URL, token=None, timeout=10, max_concurrency=16, ready_deadline=120,
+                 image_cache=None, predictions_cache=None, token_manager=None, rate_limiter=None, throttle_retries=3,
+                 observers=None):
+        self.base_url = base_url.rstrip('/')
+        self.rate_limiter = rate_limiter
+        self.throttle_retries = throttle_retries
+        self.observers = list(observers or [])
+        self.token_manager = token_manager
+        self.token = token_manager.resolve(token) if token_manager is not None else token
+        self.image_cache = image_cache
+        self.predictions_cache = predictions_cache
+        self.image_poller = ReadinessPoller(deadline=ready_deadline, name="image")
+        self.predictions_poller = ReadinessPoller(deadline=ready_deadline, name="predictions")
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self.set_token(self.token)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def set_token(self, token):
+        if self.token_manager is not None:
+            token = self.token_manager.resolve(token)
+        self.token = token
+        if self.session is None:
+            return
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        else:
+            self.session.headers.pop("Authorization", None)
+
+    async def _request(self, method, endpoint, read="json", **kwargs):
+        """
+        Send one request and return (status, body). The body is decoded according to
+        read ('json', 'bytes' or 'text') only for 200 responses, otherwise it is the text.
+        read may also be a storage.ImageWriter, which a 200 body is streamed into and
+        returned as the body.
+        """
+        status, body = await self._send(method, endpoint, read, **kwargs)
+        if status == 401 and self.token_manager is not None and endpoint != "/auth/login":
+            failed_token = self.token
+            # The token manager logs in with blocking calls; keep the event loop free meanwhile
+            token = await asyncio.to_thread(self.token_manager.refresh, failed_token)
+            if token:
+                self.set_token(token)
+                status, body = await self._send(method, endpoint, read, **kwargs)
+        return status, body
+
+    async def _send(self, method, endpoint, read, **kwargs):
+        if self.rate_limiter is None:
+            status, body, _ = await self._send_once(method, endpoint, read, **kwargs)
+            return status, body
+        for attempt in range(self.throttle_retries + 1):
+            await self.rate_limiter.acquire_async()
+            status, body, retry_after = await self._send_once(method, endpoint, read, **kwargs)
+            if status != 429:
+                await asyncio.to_thread(self.rate_limiter.on_success)
+                return status, body
+            delay = await asyncio.to_thread(self.rate_limiter.on_throttled, parse_retry_after(retry_after))
+            print(f"Rate limited on {endpoint}, backing off {delay:.1f}s")
+        return status, body
+
+    async def _send_once(self, method, endpoint, read, **kwargs):
+        """
+        Send one request and return (status, body, Retry-After header).
+        """
+        async with self.semaphore:
+            start = time.perf_counter()
+            async with self.session.request(method, f"{self.base_url}{endpoint}", **kwargs) as response:
+                retry_after = response.headers.get("Retry-After")
+                if response.status == 200 and isinstance(read, ImageWriter):
+                    # File I/O and hashing run in a thread, a few chunks at a time, so the event
+                    # loop keeps serving every other download meanwhile
+                    await asyncio.to_thread(read.reset)
+                    if "Content-Encoding" not in response.headers:
+                        read.expected_length = response.content_length
+                    pending = []
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        pending.append(chunk)
+                        if len(pending) >= WRITE_BATCH:
+                            await asyncio.to_thread(read.write, b"".join(pending))
+                            pending = []
+                    if pending:
+                        await asyncio.to_thread(read.write, b"".join(pending))
+                    elapsed = time.perf_counter() - start
+                    for observer in self.observers:
+                        observer(method, endpoint, response.status, elapsed, read.length)
+                    return response.status, read, retry_after
+                raw = await response.read()
+                elapsed = time.perf_counter() - start
+                for observer in self.observers:
+                    observer(method, endpoint, response.status, elapsed, len(raw))
+                if response.status != 200:
+                    return response.status, raw.decode(errors="replace"), retry_after
+                if read == "bytes":
+                    return response.status, raw, retry_after
+                try:
+                    body = raw.decode() if read == "text" else json.loads(raw)
+                except ValueError as e:
+                    # A ClientError, like the sync client's JSONDecodeError is a RequestException,
+                    # so every endpoint method reports it and returns None
+                    raise aiohttp.ClientPayloadError(f"Invalid response body from {endpoint}: {e}") from e
+                return response.status, body, retry_after
+
+    async def login(self, username, password):
+        try:
+            status, body = await self._request("POST", "/auth/login", json={"username": username, "password": password})
+            if status == 200:
+                self.set_token(body["token"])
+                return body["token"]
+            print(f"Login failed: {body}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"An error occurred during login: {e}")
+            return None
+
+    async def get_user_info(self):
+        try:
+            status, body = await self._request("GET", "/users/me")
+            if status == 200:
+                return body
+            print(f"Failed to get user info: {body}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"An error occurred while getting user info: {e}")
+            return None
+
+    async def decode_random_face(self):
+        try:
+            status, body = await self._request("GET", "/decode")
+            if status == 200:
+                return body
+            print(f"Failed to decode random face: {body}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"An error occurred while decoding random face: {e}")
+            return None
+
+    async def get_image(self, path, id, quiet=False, polling=False):
+        cache_key = f"{path}/{id}"
+        if self.image_cache is not None:
+            cached = await asyncio.to_thread(self.image_cache.get, cache_key)
+            if cached is not None:
+                return cached
+        params = {"path": path, "id": id}
+        try:
+            status, body = await self._request("GET", f"/image/{path}/{id}", read="bytes", params=params)
+            if status == 200:
+                if self.image_cache is not None:
+                    await asyncio.to_thread(self.image_cache.put, cache_key, body)
+                return body
+            if not quiet:
+                print(f"Failed to get image: {body}")
+            if polling and not is_transient(status):
+                raise PermanentError(f"{status} {body}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"An error occurred while getting image: {e}")
+            return None
+
+    async def download_image(self, path, id, filename, folder, quiet=False, polling=False):
+        """
+        Stream one image into folder/filename without holding it in memory; see storage.ImageWriter.
+
+        :param polling: Raise readiness.PermanentError instead of returning None for errors waiting cannot fix
+        :return: The saved path, or None if the image is not ready or arrived incomplete
+        """
+        cache_key = f"{path}/{id}"
+        with ImageWriter(filename, folder) as writer:
+            blob_path = None
+            if self.image_cache is not None:
+                blob_path = await asyncio.to_thread(self.image_cache.get_path, cache_key)
+            try:
+                if blob_path is not None:
+                    await asyncio.to_thread(writer.write_file, blob_path)
+                else:
+                    status, body = await self._request("GET", f"/image/{path}/{id}", read=writer,
+                                                       params={"path": path, "id": id})
+                    if status != 200:
+                        if not quiet:
+                            print(f"Failed to get image: {body}")
+                        if polling and not is_transient(status):
+                            raise PermanentError(f"{status} {body}")
+                        return None
+                # Validating and renaming run off the event loop, as do the save hooks below
+                saved_path = await asyncio.to_thread(writer.commit)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                print(f"An error occurred while downloading image: {e}")
+                return None
+            except ValueError as e:
+                print(f"Discarding incomplete image {id}: {e}")
+                return None
+        if self.image_cache is not None and blob_path is None:
+            await asyncio.to_thread(self.image_cache.put_file, cache_key, saved_path, writer.sha256())
+        await asyncio.to_thread(run_save_hooks, saved_path, None, cache_key)
+        return saved_path
+
+    async def get_predictions(self, s3_key, quiet=False, polling=False):
+        key = predictions_key(s3_key)
+        if key is None:
+            if polling:
+                raise PermanentError(f"Invalid s3_key format: {s3_key}")
+            print(f"Invalid s3_key format: {s3_key}")
+            return None
+        if self.predictions_cache is not None:
+            cached = await asyncio.to_thread(self.predictions_cache.get, key)
+            if cached is not None:
+                return cached
+        try:
+            status, body = await self._request("GET", f"/predictions/{key}")
+            if status == 200:
+                if self.predictions_cache is not None:
+                    await asyncio.to_thread(self.predictions_cache.put, key, body)
+                return body
+            if not quiet:
+                print(f"Failed to get predictions: {body}")
+            if polling and not is_transient(status):
+                raise PermanentError(f"{status} {body}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"An error occurred while getting predictions: {e}")
+            return None
+
+    async def request_transformation(self, s3_key, attribute, betas, control_attributes=None):
+        path, id = split_s3_key(s3_key)
+        data = {
+            "attribute": attribute,
+            "betas": betas,
+            "control_attributes": control_attributes,
+            "interpretable_betas": True
+        }
+        try:
+            status, body = await self._request("POST", f"/request_transformation/{path}/{id}", json=data)
+            if status == 200:
+                return body
+            print(f"Failed to request transformation: {body}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"An error occurred while requesting transformation: {e}")
+            return None
+
+    async def wait_for_image(self, path, id):
+        return await self.image_poller.poll_async(lambda: self.get_image(path, id, quiet=True, polling=True),
+                                                  f"image {id}")
+
+    async def wait_for_predictions(self, s3_key):
+        return await self.predictions_poller.poll_async(lambda: self.get_predictions(s3_key, quiet=True, polling=True),
+                                                        f"predictions for {s3_key}")
+
+    async def wait_for_image_key(self, s3_key):
+        path, id = split_s3_key(s3_key)
+        return await self.wait_for_image(path, id)
+
+    async def wait_for_download(self, s3_key, filename, folder):
+        """
+        Poll until the image for s3_key is ready and stream it to folder/filename; return the path or None.
+        """
+        path, id = split_s3_key(s3_key)
+        return await self.image_poller.poll_async(
+            lambda: self.download_image(path, id, filename, folder, quiet=True, polling=True), f"image {id}")
+
+    async def fetch_face(self, s3_key):
+        """
+        Fetch the image and predictions for one S3 key concurrently, each returning as
+        soon as the server has it ready.
+        """
+        image, predictions = await asyncio.gather(self.wait_for_image_key(s3_key), self.wait_for_predictions(s3_key))
+        return {"s3_key": s3_key, "image": image, "predictions": predictions}
+
+    async def fetch_faces(self, s3_keys):
+        return await asyncio.gather(*(self.fetch_face(s3_key) for s3_key in s3_keys))
+
+    async def decode_random_faces(self, n):
+        faces = await asyncio.gather(*(self.decode_random_face() for _ in range(n)))
+        return [face for face in faces if face]
+
+    async def generate_faces(self, n):
+        """
+        Decode n random faces and fetch all of their images and predictions.
+        Each face's downloads start as soon as its own decode returns.
+        """
+        async def one():
+            face = await self.decode_random_face()
+            if not face:
+                return None
+            return await self.fetch_face(face["s3_key"])
+
+        results = await asyncio.gather(*(one() for _ in range(n)))
+        return [result for result in results if result]
+
+
+async def _with_client(token, base_url, client_options, fn):
+    async with AsyncExtempoClient(base_url, token=token, **client_options) as client:
+        return await fn(client)
+
+
+def generate_faces(token, n, base_url=BASE_URL, **client_options):
+    """
+    Blocking wrapper around AsyncExtempoClient.generate_faces for synchronous scripts.
+    """
+    return asyncio.run(_with_client(token, base_url, client_options, lambda client: client.generate_faces(n)))
+
+
+def fetch_faces(token, s3_keys, base_url=BASE_URL, **client_options):
+    """
+    Blocking wrapper around AsyncExtempoClient.fetch_faces for synchronous scripts.
+    """
+    return asyncio.run(_with_client(token, base_url, client_options, lambda client: client.fetch_faces(s3_keys)))
+
+
+def decode_random_faces(token, n, base_url=BASE_URL, **client_options):
+    """
+    Blocking wrapper around AsyncExtempoClient.decode_random_faces for synchronous scripts.
+    """
+    return asyncio.run(_with_client(token, base_url, client_options, lambda client: client.decode_random_faces(n)))
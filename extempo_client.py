@@ -0,0 +1,303 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from rate_limit import parse_retry_after
+from readiness import PermanentError, ReadinessPoller, is_transient
+from storage import CHUNK_SIZE, ImageWriter, run_save_hooks
+
+
+BASE_URL = "https://gateway.extempo.rocks"
+
+
+def split_s3_key(s3_key):
+    """
+    Split an S3 key such as '61/generate/<uuid>~~generated.jpeg' into the (path, id)
+    pair used by the image and transformation endpoints.
+    """
+    path, id = s3_key.split('/', 1)[1].split('/', 1)
+    return path, id
+
+
+def predictions_key(s3_key):
+    """
+    Return the 'prefix/image_name' part of an S3 key that the predictions endpoint is
+    addressed by, or None if the key is malformed.
+    """
+    parts = s3_key.split('/')
+    if len(parts) < 3:
+        return None
+    return f"{parts[1]}/{parts[-1]}"
+
+
+class ExtempoClient:
+    """
+    Owns a single pooled, keep-alive requests.Session for talking to the Extempo gateway.
+
+    The bearer token is stored on the session headers once, so every helper shares the
+    same TCP/TLS connections instead of opening a new one per call.
+
+    :param base_url: Gateway URL
+    :param timeout: Default timeout in seconds, either a number or a (connect, read) tuple
+    :param pool_connections: Number of host pools to cache
+    :param pool_maxsize: Maximum number of connections kept alive per host
+    :param max_retries: Connection-level retries passed to the HTTPAdapter
+    :param ready_deadline: Seconds wait_for_image / wait_for_predictions keep polling
+    :param image_cache: Optional ImageCache consulted before downloading an image
+    :param predictions_cache: Optional PredictionsCache consulted before requesting predictions
+    :param rate_limiter: Optional RateLimiter every request waits on; 429s are retried up to throttle_retries times
+    :param throttle_retries: How often a 429 response is retried when a rate limiter is set
+
+    A TokenManager attaches itself as token_manager; requests answered with 401 are then
+    retried once with a refreshed token. Callables appended to observers are called after
+    every HTTP exchange as observer(method, endpoint, status, seconds, nbytes).
+    """
+
+    def __init__(self, base_url=BASE_URL, timeout=10, pool_connections=4, pool_maxsize=16, max_retries=0,
+                 ready_deadline=120, image_cache=None, predictions_cache=None, rate_limiter=None, throttle_retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.token_manager = None
+        self.observers = []
+        self.rate_limiter = rate_limiter
+        self.throttle_retries = throttle_retries
+        self.image_cache = image_cache
+        self.predictions_cache = predictions_cache
+        self.image_poller = ReadinessPoller(deadline=ready_deadline, name="image")
+        self.predictions_poller = ReadinessPoller(deadline=ready_deadline, name="predictions")
+        self.token = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=max_retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def set_token(self, token):
+        if self.token_manager is not None:
+            token = self.token_manager.resolve(token)
+        if token == self.token:
+            return
+        self.token = token
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        else:
+            self.session.headers.pop("Authorization", None)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _request(self, method, endpoint, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        response = self._send(method, endpoint, **kwargs)
+        if response.status_code == 401 and self.token_manager is not None and endpoint != "/auth/login":
+            print("Token rejected, refreshing and retrying once")
+            token = self.token_manager.refresh(failed_token=self.token)
+            if token:
+                self.set_token(token)
+                # Release the rejected response's connection (it may be streamed) before retrying
+                response.close()
+                response = self._send(method, endpoint, **kwargs)
+        return response
+
+    def _send(self, method, endpoint, **kwargs):
+        if self.rate_limiter is None:
+            return self._send_once(method, endpoint, **kwargs)
+        for attempt in range(self.throttle_retries + 1):
+            self.rate_limiter.acquire()
+            response = self._send_once(method, endpoint, **kwargs)
+            if response.status_code != 429:
+                self.rate_limiter.on_success()
+                return response
+            delay = self.rate_limiter.on_throttled(parse_retry_after(response.headers.get("Retry-After")))
+            print(f"Rate limited on {endpoint}, backing off {delay:.1f}s")
+            if attempt < self.throttle_retries:
+                response.close()
+        return response
+
+    def _send_once(self, method, endpoint, **kwargs):
+        if not self.observers:
+            return self.session.request(method, f"{self.base_url}{endpoint}", **kwargs)
+        start = time.perf_counter()
+        response = self.session.request(method, f"{self.base_url}{endpoint}", **kwargs)
+        elapsed = time.perf_counter() - start
+        # Reading a streamed body here would defeat streaming; report its announced size instead
+        nbytes = int(response.headers.get("Content-Length") or 0) if kwargs.get("stream") else len(response.content)
+        for observer in self.observers:
+            observer(method, endpoint, response.status_code, elapsed, nbytes)
+        return response
+
+    def login(self, username, password):
+        try:
+            print(f"Attempting to connect to {self.base_url}/auth/login")
+            response = self._request("POST", "/auth/login", json={"username": username, "password": password})
+            print(f"Response status code: {response.status_code}")
+            print(f"Response content: {response.text}")
+            if response.status_code == 200:
+                token = response.json()["token"]
+                self.set_token(token)
+                return token
+            else:
+                print(f"Login failed: {response.text}")
+                return None
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred during login: {e}")
+            print(f"Error type: {type(e).__name__}")
+            return None
+
+    def get_user_info(self):
+        try:
+            response = self._request("GET", "/users/me")
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"Failed to get user info: {response.text}")
+                return None
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred while getting user info: {e}")
+            return None
+
+    def decode_random_face(self):
+        try:
+            response = self._request("GET", "/decode")
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"Failed to decode random face: {response.text}")
+                return None
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred while decoding random face: {e}")
+            return None
+
+    def get_image(self, path, id, quiet=False, polling=False):
+        cache_key = f"{path}/{id}"
+        if self.image_cache is not None:
+            cached = self.image_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        params = {"path": path, "id": id}
+        try:
+            response = self._request("GET", f"/image/{path}/{id}", params=params)
+            if response.status_code == 200:
+                if self.image_cache is not None:
+                    self.image_cache.put(cache_key, response.content)
+                return response.content
+            else:
+                if not quiet:
+                    print(f"Failed to get image: {response.text}")
+                if polling and not is_transient(response.status_code):
+                    raise PermanentError(f"{response.status_code} {response.text}")
+                return None
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred while getting image: {e}")
+            return None
+
+    def download_image(self, path, id, filename, folder, quiet=False, polling=False):
+        """
+        Stream one image into folder/filename without holding it in memory; see storage.ImageWriter.
+
+        :param polling: Raise readiness.PermanentError instead of returning None for errors waiting cannot fix
+        :return: The saved path, or None if the image is not ready or arrived incomplete
+        """
+        cache_key = f"{path}/{id}"
+        with ImageWriter(filename, folder) as writer:
+            blob_path = self.image_cache.get_path(cache_key) if self.image_cache is not None else None
+            try:
+                if blob_path is not None:
+                    writer.write_file(blob_path)
+                else:
+                    with self._request("GET", f"/image/{path}/{id}", params={"path": path, "id": id},
+                                       stream=True) as response:
+                        if response.status_code != 200:
+                            if not quiet:
+                                print(f"Failed to get image: {response.text}")
+                            if polling and not is_transient(response.status_code):
+                                raise PermanentError(f"{response.status_code} {response.text}")
+                            return None
+                        if "Content-Encoding" not in response.headers and response.headers.get("Content-Length"):
+                            writer.expected_length = int(response.headers["Content-Length"])
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            writer.write(chunk)
+                saved_path = writer.commit()
+            except (requests.exceptions.RequestException, OSError) as e:
+                print(f"An error occurred while downloading image: {e}")
+                return None
+            except ValueError as e:
+                print(f"Discarding incomplete image {id}: {e}")
+                return None
+        if self.image_cache is not None and blob_path is None:
+            self.image_cache.put_file(cache_key, saved_path, writer.sha256())
+        run_save_hooks(saved_path, image_key=cache_key)
+        return saved_path
+
+    def get_predictions(self, s3_key, quiet=False, polling=False):
+        key = predictions_key(s3_key)
+        if key is None:
+            if polling:
+                raise PermanentError(f"Invalid s3_key format: {s3_key}")
+            print(f"Invalid s3_key format: {s3_key}")
+            return None
+        if self.predictions_cache is not None:
+            cached = self.predictions_cache.get(key)
+            if cached is not None:
+                return cached
+
+        try:
+            if not quiet:
+                print(f"Requesting predictions from: {self.base_url}/predictions/{key}")
+            response = self._request("GET", f"/predictions/{key}")
+            if response.status_code == 200:
+                predictions = response.json()
+                if self.predictions_cache is not None:
+                    self.predictions_cache.put(key, predictions)
+                return predictions
+            else:
+                if not quiet:
+                    print(f"Failed to get predictions: {response.text}")
+                if polling and not is_transient(response.status_code):
+                    raise PermanentError(f"{response.status_code} {response.text}")
+                return None
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred while getting predictions: {e}")
+            return None
+
+    def wait_for_image(self, path, id):
+        """
+        Poll get_image until the server has rendered the image, instead of sleeping a fixed time.
+        """
+        return self.image_poller.poll(lambda: self.get_image(path, id, quiet=True, polling=True), f"image {id}")
+
+    def wait_for_download(self, s3_key, filename, folder):
+        """
+        Poll until the image for s3_key is ready and stream it to folder/filename; return the path or None.
+        """
+        path, id = split_s3_key(s3_key)
+        return self.image_poller.poll(
+            lambda: self.download_image(path, id, filename, folder, quiet=True, polling=True), f"image {id}")
+
+    def wait_for_predictions(self, s3_key):
+        return self.predictions_poller.poll(lambda: self.get_predictions(s3_key, quiet=True, polling=True),
+                                            f"predictions for {s3_key}")
+
+    def request_transformation(self, s3_key, attribute, betas, control_attributes=None):
+        path, id = split_s3_key(s3_key)
+        data = {
+            "attribute": attribute,
+            "betas": betas,
+            "control_attributes": control_attributes,
+            "interpretable_betas": True
+        }
+        try:
+            response = self._request("POST", f"/request_transformation/{path}/{id}", json=data)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"Failed to request transformation: {response.text}")
+                return None
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred while requesting transformation: {e}")
+            return None
@@ -1,9 +1,282 @@
+"""
+Local stand-in for the Extempo gateway.
 
-from fastapi import FastAPI
+Implements the endpoints the scripts use (/auth/login, /users/me, /decode, /image,
+/predictions and /request_transformation) with configurable latency, not-ready
+windows, 429s and failures, so the client can be tested and benchmarked offline.
 
-app = FastAPI()
+Run it with:
 
+    python generator_api.py --port 8000 --latency-ms 80 --ready-after 2
 
-@app.get("/")
-async def root():
-    return {"message": "Hello World"}
+and point the client at http://127.0.0.1:8000. The configuration can also be read and
+changed at runtime through GET/POST /_emulator/config, and counters are available at
+GET /_emulator/stats.
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import math
+import random
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import Response
+
+
+TRAITS = [
+    "trustworthy", "attractive", "dominant", "smart", "age", "gender", "weight", "typical", "happy",
+    "familiar", "outgoing", "well-groomed", "long-haired", "smug", "dorky", "hair-color", "alert",
+    "cute", "privileged", "liberal", "electable", "outdoors", "healthy",
+]
+
+DEFAULT_CONFIG = {
+    # Median latency per request in milliseconds and the lognormal spread around it
+    "latency_ms": 50.0,
+    "latency_sigma": 0.3,
+    # Per-endpoint overrides of latency_ms, e.g. {"decode": 400, "request_transformation": 800}
+    "endpoint_latency_ms": {},
+    # Seconds after creation during which /image and /predictions answer 404
+    "ready_after": 1.0,
+    "ready_jitter": 0.5,
+    # Probability of a 500 and of a 429 (with Retry-After) on any endpoint
+    "failure_rate": 0.0,
+    "throttle_rate": 0.0,
+    "retry_after": 1.0,
+    # Seconds a token stays valid; 0 means forever
+    "token_ttl": 0.0,
+    "user_id": 61,
+    "image_size": 256,
+    "seed": 0,
+}
+
+# Number of rendered images kept in memory
+IMAGE_CACHE_SIZE = 512
+
+
+class Emulator:
+    """
+    State behind the emulated gateway: issued tokens, generated keys and counters.
+    """
+
+    def __init__(self, **config):
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.random = random.Random(self.config["seed"])
+        self.tokens = {}
+        self.ready_at = {}
+        self.keys_by_name = {}
+        self.transform_params = {}
+        self.transform_counter = 10000
+        self.images = OrderedDict()
+        self.stats = Counter()
+
+    def latency(self, endpoint):
+        median = self.config["endpoint_latency_ms"].get(endpoint, self.config["latency_ms"])
+        if median <= 0:
+            return 0.0
+        return median / 1000 * math.exp(self.random.gauss(0, self.config["latency_sigma"]))
+
+    async def enter(self, endpoint, authorization=None, check_auth=True):
+        """
+        Apply latency, injected failures and authentication shared by every endpoint.
+        """
+        self.stats[f"{endpoint}.requests"] += 1
+        await asyncio.sleep(self.latency(endpoint))
+        if self.random.random() < self.config["throttle_rate"]:
+            self.stats[f"{endpoint}.429"] += 1
+            raise HTTPException(429, "Too many requests", headers={"Retry-After": str(self.config["retry_after"])})
+        if self.random.random() < self.config["failure_rate"]:
+            self.stats[f"{endpoint}.500"] += 1
+            raise HTTPException(500, "Injected failure")
+        if check_auth:
+            token = (authorization or "").removeprefix("Bearer ").strip()
+            expires = self.tokens.get(token)
+            if expires is None or (expires and expires < time.time()):
+                self.stats[f"{endpoint}.401"] += 1
+                raise HTTPException(401, "Could not validate credentials")
+
+    def register(self, s3_key):
+        jitter = self.random.uniform(0, self.config["ready_jitter"])
+        self.ready_at[s3_key] = time.time() + self.config["ready_after"] + jitter
+        self.keys_by_name[s3_key.split('/', 1)[1]] = s3_key
+        return s3_key
+
+    def check_ready(self, endpoint, s3_key):
+        ready_at = self.ready_at.get(s3_key)
+        if ready_at is None:
+            self.stats[f"{endpoint}.404"] += 1
+            raise HTTPException(404, f"{s3_key} not found")
+        if ready_at > time.time():
+            self.stats[f"{endpoint}.not_ready"] += 1
+            raise HTTPException(404, f"{s3_key} is not ready yet")
+
+    def find_key(self, kind, name):
+        """
+        Find the full S3 key for a 'kind/name' pair regardless of the user prefix.
+        """
+        return self.keys_by_name.get(f"{kind}/{name}", f"{self.config['user_id']}/{kind}/{name}")
+
+    def predictions(self, s3_key):
+        """
+        Deterministic trait scores: the base face's scores plus, for transformed images,
+        beta times the attribute's effect, so transformations move predictions predictably.
+        """
+        name = s3_key.split('/')[-1]
+        base_name = name.split('~~')[0]
+        rng = random.Random(hashlib.sha256(base_name.encode()).digest())
+        scores = {trait: rng.gauss(0, 1) for trait in TRAITS}
+        for attribute, beta in self.transform_params.get(s3_key, []):
+            if attribute in scores:
+                scores[attribute] += 0.8 * beta + random.Random(name).gauss(0, 0.05)
+        return scores
+
+    def render(self, s3_key):
+        if s3_key in self.images:
+            self.images.move_to_end(s3_key)
+            return self.images[s3_key]
+        from PIL import Image, ImageDraw
+
+        size = self.config["image_size"]
+        rng = random.Random(hashlib.sha256(s3_key.encode()).digest())
+        background = tuple(rng.randrange(40, 200) for _ in range(3))
+        skin = tuple(rng.randrange(120, 240) for _ in range(3))
+        image = Image.new("RGB", (size, size), background)
+        draw = ImageDraw.Draw(image)
+        draw.ellipse([size * 0.2, size * 0.1, size * 0.8, size * 0.9], fill=skin)
+        for x in (0.38, 0.62):
+            draw.ellipse([size * (x - 0.05), size * 0.4, size * (x + 0.05), size * 0.46], fill=(30, 30, 30))
+        draw.arc([size * 0.35, size * 0.55, size * 0.65, size * 0.72], 20, 160, fill=(120, 30, 30), width=max(1, size // 64))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        data = buffer.getvalue()
+        self.images[s3_key] = data
+        while len(self.images) > IMAGE_CACHE_SIZE:
+            self.images.popitem(last=False)
+        return data
+
+
+def create_app(**config):
+    app = FastAPI(title="Extempo emulator")
+    emulator = Emulator(**config)
+    app.state.emulator = emulator
+
+    @app.get("/")
+    async def root():
+        return {"message": "Extempo emulator", "config": emulator.config}
+
+    @app.post("/auth/login")
+    async def login(body: dict):
+        await emulator.enter("login", check_auth=False)
+        if not body.get("username") or not body.get("password"):
+            raise HTTPException(401, "Incorrect username or password")
+        token = uuid.uuid4().hex
+        ttl = emulator.config["token_ttl"]
+        emulator.tokens[token] = time.time() + ttl if ttl else 0
+        return {"token": token}
+
+    @app.get("/users/me")
+    async def users_me(authorization: str = Header(None)):
+        await emulator.enter("users_me", authorization)
+        return {"id": emulator.config["user_id"], "username": "emulator@example.com"}
+
+    @app.get("/decode")
+    async def decode(authorization: str = Header(None)):
+        await emulator.enter("decode", authorization)
+        s3_key = emulator.register(f"{emulator.config['user_id']}/generate/{uuid.uuid4()}~~generated.jpeg")
+        return {"s3_key": s3_key}
+
+    @app.get("/image/{path}/{id}")
+    async def image(path: str, id: str, authorization: str = Header(None)):
+        await emulator.enter("image", authorization)
+        s3_key = emulator.find_key(path, id)
+        emulator.check_ready("image", s3_key)
+        data = await asyncio.to_thread(emulator.render, s3_key)
+        emulator.stats["image.bytes"] += len(data)
+        return Response(data, media_type="image/jpeg")
+
+    @app.get("/predictions/{prefix}/{name}")
+    async def predictions(prefix: str, name: str, authorization: str = Header(None)):
+        await emulator.enter("predictions", authorization)
+        s3_key = emulator.find_key(prefix, name)
+        emulator.check_ready("predictions", s3_key)
+        return {"s3_key": s3_key, "predictions": emulator.predictions(s3_key)}
+
+    @app.post("/request_transformation/{path}/{id}")
+    async def request_transformation(path: str, id: str, body: dict, authorization: str = Header(None)):
+        await emulator.enter("request_transformation", authorization)
+        source = emulator.find_key(path, id)
+        emulator.check_ready("request_transformation", source)
+        emulator.transform_counter += 1
+        parent_params = emulator.transform_params.get(source, [])
+        images = []
+        for i, beta in enumerate(body.get("betas") or []):
+            s3_key = emulator.register(f"{emulator.config['user_id']}/transform/{id}~~{emulator.transform_counter}~~{i}")
+            emulator.transform_params[s3_key] = parent_params + [(body.get("attribute"), float(beta))]
+            images.append(s3_key)
+        return {"images": images}
+
+    @app.get("/_emulator/config")
+    async def get_config():
+        return emulator.config
+
+    @app.post("/_emulator/config")
+    async def set_config(body: dict):
+        unknown = set(body) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise HTTPException(400, f"Unknown settings: {sorted(unknown)}")
+        emulator.config.update(body)
+        return emulator.config
+
+    @app.get("/_emulator/stats")
+    async def get_stats():
+        return dict(emulator.stats)
+
+    return app
+
+
+app = create_app()
+
+
+def start_in_background(host="127.0.0.1", port=0, **config):
+    """
+    Serve a fresh emulator from a daemon thread, for benchmarks and tests.
+
+    :return: (base_url, server) where server.should_exit = True stops it
+    """
+    import threading
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(create_app(**config), host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return f"http://{host}:{port}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local emulator of the Extempo gateway")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_CONFIG["latency_ms"])
+    parser.add_argument("--ready-after", type=float, default=DEFAULT_CONFIG["ready_after"])
+    parser.add_argument("--failure-rate", type=float, default=DEFAULT_CONFIG["failure_rate"])
+    parser.add_argument("--throttle-rate", type=float, default=DEFAULT_CONFIG["throttle_rate"])
+    parser.add_argument("--token-ttl", type=float, default=DEFAULT_CONFIG["token_ttl"])
+    parser.add_argument("--image-size", type=int, default=DEFAULT_CONFIG["image_size"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG["seed"])
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(latency_ms=args.latency_ms, ready_after=args.ready_after, failure_rate=args.failure_rate,
+                           throttle_rate=args.throttle_rate, token_ttl=args.token_ttl, image_size=args.image_size,
+                           seed=args.seed),
+                host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
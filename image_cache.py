@@ -0,0 +1,189 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+
+DEFAULT_CACHE_DIR = ".image_cache"
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageCache:
+    """
+    Persistent, content-addressed cache for generated images.
+
+    Generated images never change once they exist, so they are cached forever under
+    their S3 key. Each key maps to a small index file holding the SHA-256 of the image
+    bytes, and the bytes themselves live in a blob named after that hash. Hits re-hash
+    the blob, so a corrupted or truncated file is dropped instead of returned.
+
+    Blob mtimes are bumped on every hit and the least recently used blobs are evicted
+    once the cache grows past max_bytes. All writes go through a temp file and
+    os.replace, so a crash never leaves a partial entry behind.
+
+    :param root: Cache directory
+    :param max_bytes: Size limit for all blobs together
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.keys_dir = os.path.join(root, "keys")
+        self.blobs_dir = os.path.join(root, "blobs")
+        os.makedirs(self.keys_dir, exist_ok=True)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.size = sum(entry.stat().st_size for entry in self._blob_entries())
+
+    def _blob_entries(self):
+        for shard in os.scandir(self.blobs_dir):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.is_file() and not entry.name.startswith('.'):
+                        yield entry
+
+    def _key_path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.keys_dir, digest[:2], digest)
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.blobs_dir, content_hash[:2], content_hash)
+
+    def _write_atomic(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, key):
+        """
+        Return the cached bytes for an S3 key, or None on a miss or failed integrity check.
+        """
+        try:
+            with open(self._key_path(key)) as f:
+                content_hash = f.read().strip()
+            blob_path = self._blob_path(content_hash)
+            with open(blob_path, "rb") as f:
+                data = f.read()
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        if hashlib.sha256(data).hexdigest() != content_hash:
+            print(f"Cached image for {key} failed its integrity check, discarding it")
+            with self.lock:
+                self._remove_blob(blob_path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(blob_path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        with self.lock:
+            if not os.path.exists(blob_path):
+                self._write_atomic(blob_path, data)
+                self.size += len(data)
+            self._write_atomic(self._key_path(key), content_hash.encode())
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def get_path(self, key):
+        """
+        Like get, but return the path of the verified blob instead of its bytes, hashing it
+        in chunks so large images are never held in memory. Copy it before modifying it.
+        """
+        try:
+            with open(self._key_path(key)) as f:
+                content_hash = f.read().strip()
+            blob_path = self._blob_path(content_hash)
+            digest = hashlib.sha256()
+            with open(blob_path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        if digest.hexdigest() != content_hash:
+            print(f"Cached image for {key} failed its integrity check, discarding it")
+            with self.lock:
+                self._remove_blob(blob_path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(blob_path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return blob_path
+
+    def put_file(self, key, path, content_hash):
+        """
+        Cache an image already written to path, whose SHA-256 is content_hash, without reading it into memory.
+        The blob is a copy rather than a hard link: touching it on hits must not change the mtime of path.
+        """
+        blob_path = self._blob_path(content_hash)
+        with self.lock:
+            if not os.path.exists(blob_path):
+                directory = os.path.dirname(blob_path)
+                os.makedirs(directory, exist_ok=True)
+                tmp_path = os.path.join(directory, f".tmp-{content_hash}-{threading.get_ident()}")
+                try:
+                    shutil.copyfile(path, tmp_path)
+                    os.replace(tmp_path, blob_path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    raise
+                self.size += os.path.getsize(blob_path)
+            self._write_atomic(self._key_path(key), content_hash.encode())
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def __contains__(self, key):
+        try:
+            with open(self._key_path(key)) as f:
+                return os.path.exists(self._blob_path(f.read().strip()))
+        except FileNotFoundError:
+            return False
+
+    def _remove_blob(self, blob_path):
+        try:
+            size = os.path.getsize(blob_path)
+            os.unlink(blob_path)
+            self.size -= size
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """
+        Drop least recently used blobs until the cache is at 90% of max_bytes. Key files
+        pointing at evicted blobs are left behind and simply miss on the next lookup.
+        """
+        entries = sorted(self._blob_entries(), key=lambda entry: entry.stat().st_mtime)
+        target = int(self.max_bytes * 0.9)
+        for entry in entries:
+            if self.size <= target:
+                break
+            self._remove_blob(entry.path)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.size, "max_bytes": self.max_bytes}
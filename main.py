@@ -1,187 +1,140 @@
 # This code was created using Claude 3.5 Sonnet
+import argparse
 import requests
 import json
 import sys
-import time
-import os
-from datetime import datetime
-from PIL import Image
+from auth import TokenManager
+from catalog import Catalog
+from contact_sheet import save_sweep_sheet
+from dedupe import DuplicateDetector
+from display import ImageDisplay
+from extempo_client import BASE_URL, ExtempoClient
+from image_cache import ImageCache
+from manifest import RunManifest
+from predictions_cache import PredictionsCache
+from rate_limit import RateLimiter
+from storage import create_timestamped_folder, get_timestamped_filename, save_image, save_predictions
+from sweep import run_sweep
 
 
-BASE_URL = "https://gateway.extempo.rocks"
+# One pooled keep-alive session shared by every API helper below
+client = ExtempoClient(BASE_URL, timeout=10)
+token_manager = None
 
+# Set FACEGEN_DISPLAY=headless|external|viewer to choose how images are shown
+display = ImageDisplay()
 
-def create_timestamped_folder(base_dir="generations"):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    folder_name = f"{base_dir}_{timestamp}"
-    os.makedirs(folder_name, exist_ok=True)
-    return folder_name
+duplicates = None
 
 
-def get_timestamped_filename(base_name, extension):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return f"{base_name}_{timestamp}.{extension}"
+def setup():
+    """
+    Open the local caches and shared state on first use, so importing this module creates no files.
+    """
+    global token_manager, duplicates
+    if client.image_cache is None:
+        # Images already downloaded are served from the local cache
+        client.image_cache = ImageCache()
+    if client.predictions_cache is None:
+        # Predictions already requested are served from the local cache
+        client.predictions_cache = PredictionsCache()
+    if token_manager is None:
+        # Reuses the token cached on disk and logs in again on 401
+        token_manager = TokenManager(client)
+    if client.rate_limiter is None:
+        # Every request draws from the rate budget shared with other local processes
+        client.rate_limiter = RateLimiter()
+    if duplicates is None:
+        # Every saved image is hashed and flagged if it nearly duplicates one already catalogued
+        duplicates = DuplicateDetector(Catalog()).install()
 
 
 def login(username, password):
-    try:
-        print(f"Attempting to connect to {BASE_URL}/auth/login")
-        response = requests.post(f"{BASE_URL}/auth/login", json={"username": username, "password": password}, timeout=10)
-        print(f"Response status code: {response.status_code}")
-        print(f"Response content: {response.text}")
-        if response.status_code == 200:
-            return response.json()["token"]
-        else:
-            print(f"Login failed: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred during login: {e}")
-        print(f"Error type: {type(e).__name__}")
-        return None
+    setup()
+    return client.login(username, password)
 
 
 def get_user_info(token):
-    headers = {"Authorization": f"Bearer {token}"}
-    try:
-        response = requests.get(f"{BASE_URL}/users/me", headers=headers, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to get user info: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while getting user info: {e}")
-        return None
+    setup()
+    client.set_token(token)
+    return client.get_user_info()
 
 
-def wait_with_message(seconds, message):
-    print(message)
-    for i in range(seconds, 0, -1):
-        print(f"Waiting... {i} seconds remaining", end='\r')
-        time.sleep(1)
-    print("\nDone waiting.")
+def wait_for_image(token, path, id):
+    """
+    Poll for the image with backoff and return it as soon as the server has rendered it.
+    """
+    setup()
+    client.set_token(token)
+    return client.wait_for_image(path, id)
 
 
-def decode_random_face(token):
-    headers = {"Authorization": f"Bearer {token}"}
-    try:
-        response = requests.get(f"{BASE_URL}/decode", headers=headers, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to decode random face: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while decoding random face: {e}")
-        return None
+def download_image(token, s3_key, filename, folder):
+    """
+    Poll for the image and stream it straight to folder/filename; return the saved path.
+    """
+    setup()
+    client.set_token(token)
+    return client.wait_for_download(s3_key, filename, folder)
 
 
-def get_image(token, path, id):
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"path": path, "id": id}
-    try:
-        response = requests.get(f"{BASE_URL}/image/{path}/{id}", headers=headers, params=params, timeout=10)
-        if response.status_code == 200:
-            return response.content
-        else:
-            print(f"Failed to get image: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while getting image: {e}")
-        return None
+def wait_for_predictions(token, s3_key):
+    setup()
+    client.set_token(token)
+    return client.wait_for_predictions(s3_key)
 
 
-def save_and_show_image(image_data, filename, folder):
-    # Create the full path for the file
-    full_path = os.path.join(folder, filename)
-    
-    # Ensure the filename has a .jpg extension
-    if not full_path.lower().endswith('.jpg'):
-        full_path += '.jpg'
-    
-    # Save the image
-    with open(full_path, "wb") as f:
-        f.write(image_data)
-    print(f"Image saved as '{full_path}'")
-    
-    # Show the image
-    Image.open(full_path).show()
+def decode_random_face(token):
+    setup()
+    client.set_token(token)
+    return client.decode_random_face()
 
 
-def get_predictions(token, s3_key):
-    headers = {"Authorization": f"Bearer {token}"}
-    parts = s3_key.split('/')
-    if len(parts) < 3:
-        print(f"Invalid s3_key format: {s3_key}")
-        return None
-    
-    prefix = parts[1]
-    image_name = parts[-1]
-    
+def get_image(token, path, id):
+    setup()
+    client.set_token(token)
+    return client.get_image(path, id)
+
+
+def save_and_show_image(image_data, filename, folder, image_key=None):
+    """
+    Save and show an image; return its path, or None if the bytes are not a complete JPEG.
+    """
+    setup()
     try:
-        url = f"{BASE_URL}/predictions/{prefix}/{image_name}"
-        print(f"Requesting predictions from: {url}")
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to get predictions: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while getting predictions: {e}")
+        full_path = save_image(image_data, filename, folder, image_key)
+    except ValueError as e:
+        print(f"Could not save {filename}: {e}")
         return None
+    display.show(full_path)
+    return full_path
 
 
-def save_predictions(predictions, filename, folder):
-    full_path = os.path.join(folder, filename)
-    if not full_path.lower().endswith('.json'):
-        full_path += '.json'
-    with open(full_path, 'w') as f:
-        json.dump(predictions, f, indent=2)
-    print(f"Predictions saved to {full_path}")
+def get_predictions(token, s3_key):
+    setup()
+    client.set_token(token)
+    return client.get_predictions(s3_key)
 
 
 def request_transformation(token, s3_key, attribute, betas, control_attributes=None):
-    headers = {"Authorization": f"Bearer {token}"}
-    path, id = s3_key.split('/', 1)[1].split('/', 1)
-    data = {
-        "attribute": attribute,
-        "betas": betas,
-        "control_attributes": control_attributes,
-        "interpretable_betas": True
-    }
-    try:
-        response = requests.post(f"{BASE_URL}/request_transformation/{path}/{id}", json=data, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to request transformation: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while requesting transformation: {e}")
-        return None
+    setup()
+    client.set_token(token)
+    return client.request_transformation(s3_key, attribute, betas, control_attributes)
 
-def save_characteristic_info(attribute, beta, filename, folder, s3_key, photo_filename):
+
+def main(attribute="black", betas=(-2, 0, 2), auto_approve=False):
     """
-    Save the characteristic (attribute), beta value, s3_key, and photo filename to a text file.
+    Generate random faces until one is approved, then transform it over betas.
+    With auto_approve the first face is used without asking; see cli.py for fully
+    unattended runs.
     """
-    full_path = os.path.join(folder, filename)
-    with open(full_path, 'w') as f:
-        f.write(f"Characteristic: {attribute}\n")
-        f.write(f"Beta: {beta}\n")
-        f.write(f"S3 Key: {s3_key}\n")
-        f.write(f"Photo Filename: {photo_filename}")
-    print(f"Characteristic info saved to {full_path}")
-
-
-def main():
     print(f"Python version: {sys.version}")
     print(f"Requests version: {requests.__version__}")
+    setup()
 
-    username = input("Enter your email: ")
-    password = input("Enter your password: ")
-
-    token = login(username, password)
+    # Reuses the token cached on disk by earlier runs and only prompts for
+    # credentials when a new login is needed
+    token = token_manager.get_token()
     if not token:
         return
 
@@ -192,31 +145,32 @@ def main():
     # Create a timestamped folder for this run
     output_folder = create_timestamped_folder()
     print(f"Output will be saved in: {output_folder}")
+    # Every decode, saved file and transformation of this run goes into one manifest.jsonl
+    manifest = RunManifest(output_folder)
 
     while True:
         random_face = decode_random_face(token)
         if random_face:
             print(f"Random face generated: {json.dumps(random_face, indent=2)}")
             s3_key = random_face["s3_key"]
-
-            wait_with_message(10, "Waiting for the server to generate the image...")
-
-            path, id = s3_key.split('/', 1)[1].split('/', 1)
-            image_data = get_image(token, path, id)
-            if image_data:
-                image_filename = get_timestamped_filename("random_face", "jpg")
-                save_and_show_image(image_data, image_filename, output_folder)
+            manifest.decode(s3_key)
+
+            print("Waiting for the server to generate the image...")
+            image_filename = get_timestamped_filename("random_face", "jpg")
+            image_path = download_image(token, s3_key, image_filename, output_folder)
+            if image_path:
+                display.show(image_path)
+                manifest.image(s3_key, image_path)
                 
                 # Prompt for approval immediately after showing the image
-                approval = input("Do you approve this image? (yes/no): ").lower()
+                approval = 'yes' if auto_approve else input("Do you approve this image? (yes/no): ").lower()
                 if approval == 'yes':
                     # If approved, proceed with predictions and transformations
-                    wait_with_message(10, "Waiting before requesting predictions...")
-                    
-                    predictions = get_predictions(token, s3_key)
+                    predictions = wait_for_predictions(token, s3_key)
                     if predictions:
                         predictions_filename = image_filename.replace(".jpg", "_predictions.json")
-                        save_predictions(predictions, predictions_filename, output_folder)
+                        predictions_path = save_predictions(predictions, predictions_filename, output_folder)
+                        manifest.predictions(s3_key, predictions, predictions_path)
                     else:
                         print("Failed to get predictions for the random face")
                     
@@ -230,32 +184,26 @@ def main():
             return
 
     # Proceed with transformations only if an image was approved
-    attribute = "black"
-    betas = [-2, 0, 2]
-    transformation = request_transformation(token, s3_key, attribute, betas)
-    if transformation:
-        print(f"Transformation result: {json.dumps(transformation, indent=2)}")
-
-        wait_with_message(10, "Waiting for the server to generate transformed images...")
-
-        # Get transformed images
-        for i, image_path in enumerate(transformation["images"]):
-            path, id = image_path.split('/', 1)[1].split('/', 1)
-            image_data = get_image(token, path, id)
-            if image_data:
-                # Generate timestamped filename for the image
-                image_filename = get_timestamped_filename(f"transformed_face_{i}", "jpg")
-                save_and_show_image(image_data, image_filename, output_folder)
-                
-                # Save characteristic info with the same timestamp
-                info_filename = image_filename.replace(".jpg", "_info.txt")
-                save_characteristic_info(attribute, betas[i], info_filename, output_folder, image_path, image_filename)
-            else:
-                print(f"Failed to retrieve transformed image {i}")
-
-            # Wait between processing each transformed image
-            if i < len(transformation["images"]) - 1:  # Don't wait after the last image
-                wait_with_message(5, "Waiting before processing the next transformed image...")
+    # One transformation call for all betas; every image is downloaded concurrently
+    # and written to disk (and recorded in the manifest) as soon as it is ready
+    results = run_sweep(token, s3_key, attribute, betas, output_folder, base_url=client.base_url,
+                        image_cache=client.image_cache, predictions_cache=client.predictions_cache,
+                        token_manager=token_manager, rate_limiter=client.rate_limiter, manifest=manifest)
+    manifest.close()
+    # One labeled sheet of the whole sweep instead of a window per image
+    sheet_path = save_sweep_sheet(results, output_folder)
+    if sheet_path:
+        display.show(sheet_path)
+
+    client.image_poller.stats.print_summary()
+    client.predictions_poller.stats.print_summary()
+    # Keep the contact sheet on screen until the user closes the viewer
+    display.wait()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate a face and transform it over a list of betas")
+    parser.add_argument("--attribute", default="black")
+    parser.add_argument("--betas", type=float, nargs="+", default=[-2, 0, 2])
+    parser.add_argument("--yes", action="store_true", help="approve the first face without asking")
+    args = parser.parse_args()
+    main(args.attribute, args.betas, args.yes)
\ No newline at end of file
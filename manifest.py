@@ -0,0 +1,194 @@
+"""
+Append-only JSONL manifest of everything a run does.
+
+Each output folder gets one manifest.jsonl with a record per API event:
+
+    {"time": "...", "event": "decode", "s3_key": "..."}
+    {"time": "...", "event": "image", "s3_key": "...", "path": "initial_face_....jpg"}
+    {"time": "...", "event": "predictions", "s3_key": "...", "predictions": {...}, "path": "..."}
+    {"time": "...", "event": "transformation", "s3_key": "...", "attribute": "age", "betas": [...],
+     "control_attributes": [...], "images": ["...", ...]}
+    {"time": "...", "event": "image", "s3_key": "...", "path": "...", "attribute": "age", "beta": 2.0}
+
+Records are buffered and appended in one write, so reading a run's metadata is a
+single sequential read instead of one small file per image. The legacy _info.txt
+files can still be produced from a manifest:
+
+    python manifest.py export-info generations_20241021_102456
+"""
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from storage import save_characteristic_info
+
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+class RunManifest:
+    """
+    Buffered writer for a folder's manifest.jsonl.
+
+    The file is opened with O_APPEND and every flush is a single write, so several
+    writers (e.g. a sweep and the script that started it) can share one manifest
+    without interleaving partial lines. Buffered records are flushed when the buffer
+    fills, when flush_interval has passed since the last flush, on close() and at exit.
+
+    :param folder: Run output folder the manifest lives in
+    :param buffer_size: Number of records kept in memory before they are written
+    :param flush_interval: Seconds after which buffered records are written on the next record
+    :param fsync: Also fsync on every flush, for runs on filesystems that lose data on crashes
+    """
+
+    def __init__(self, folder, buffer_size=64, flush_interval=2.0, fsync=False):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        atexit.register(self.close)
+
+    def record(self, event, **fields):
+        """
+        Add one record and return it. None-valued fields are left out.
+        """
+        record = {"time": datetime.now().isoformat(sep=' ', timespec='milliseconds'), "event": event}
+        record.update((key, value) for key, value in fields.items() if value is not None)
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            if self.fd is None:
+                raise ValueError(f"{self.path} is closed")
+            self.buffer.append(line)
+            if len(self.buffer) >= self.buffer_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+        return record
+
+    def decode(self, s3_key):
+        return self.record("decode", s3_key=s3_key)
+
+    def image(self, s3_key, path, attribute=None, beta=None):
+        """
+        Record a saved image; path is stored relative to the run folder.
+        """
+        return self.record("image", s3_key=s3_key, path=self._relative(path), attribute=attribute,
+                           beta=None if beta is None else float(beta))
+
+    def predictions(self, s3_key, predictions, path=None):
+        if isinstance(predictions, dict) and "predictions" in predictions:
+            predictions = predictions["predictions"]
+        return self.record("predictions", s3_key=s3_key, predictions=predictions,
+                           path=self._relative(path) if path else None)
+
+    def transformation(self, s3_key, attribute, betas, control_attributes=None, images=None):
+        return self.record("transformation", s3_key=s3_key, attribute=attribute, betas=[float(b) for b in betas],
+                           control_attributes=control_attributes, images=images)
+
+    def _relative(self, path):
+        if os.path.dirname(path) and os.path.abspath(os.path.dirname(path)) == os.path.abspath(self.folder):
+            return os.path.basename(path)
+        return path
+
+    def _flush(self):
+        if self.buffer:
+            os.write(self.fd, "".join(self.buffer).encode())
+            if self.fsync:
+                os.fsync(self.fd)
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            if self.fd is not None:
+                self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.fd is None:
+                return
+            self._flush()
+            os.close(self.fd)
+            self.fd = None
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def manifest_path(folder_or_path):
+    if os.path.isdir(folder_or_path):
+        return os.path.join(folder_or_path, MANIFEST_NAME)
+    return folder_or_path
+
+
+def read_manifest(folder_or_path, event=None):
+    """
+    Read all records of a manifest (given its folder or path), optionally only those
+    of one event type. A truncated last line from an interrupted write is skipped.
+    """
+    records = []
+    with open(manifest_path(folder_or_path)) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event is None or record.get("event") == event:
+                records.append(record)
+    return records
+
+
+def export_info_files(folder_or_path, overwrite=False):
+    """
+    Write a legacy _info.txt next to every transformed image recorded in a manifest.
+
+    :return: Number of files written
+    """
+    path = manifest_path(folder_or_path)
+    folder = os.path.dirname(path) or "."
+    written = 0
+    for record in read_manifest(path, "image"):
+        if record.get("attribute") is None:
+            continue
+        photo_filename = os.path.basename(record["path"])
+        info_filename = os.path.splitext(photo_filename)[0] + "_info.txt"
+        if not overwrite and os.path.exists(os.path.join(folder, info_filename)):
+            continue
+        save_characteristic_info(record["attribute"], record.get("beta"), info_filename, folder,
+                                 record.get("s3_key"), photo_filename)
+        written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect run manifests")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show = subparsers.add_parser("show", help="print a manifest's records")
+    show.add_argument("folder")
+    show.add_argument("--event")
+    export = subparsers.add_parser("export-info", help="write legacy _info.txt files for transformed images")
+    export.add_argument("folders", nargs="+")
+    export.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        for record in read_manifest(args.folder, args.event):
+            print(json.dumps(record))
+    else:
+        for folder in args.folders:
+            print(f"{folder}: {export_info_files(folder, args.overwrite)} info files written")
+
+
+if __name__ == "__main__":
+    main()
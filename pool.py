@@ -0,0 +1,302 @@
+"""
+Multi-account worker pool for batch jobs.
+
+Runs the jobs of a batch file (see batch.py for the format) across several Extempo
+accounts at once. Each account gets its own worker process with its own login, token
+file, keep-alive session and rate-limit budget; the parent hands out items one at a
+time to whichever account is expected to finish soonest, based on its observed item
+latency, error rate and current load. All workers write into the jobs' shared output
+folders and manifests (so runs stay resumable), and the parent merges the results
+into the catalog at the end.
+
+Accounts are listed in the config file (~/.config/face_generator/config.ini) as
+
+    [account:lab1]
+    username = lab1@example.com
+    password = ...
+
+    [account:lab2]
+    username = lab2@example.com
+    password = ...
+
+and the pool is started with
+
+    python pool.py jobs.jsonl --per-account 4
+"""
+import argparse
+import asyncio
+import configparser
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque
+
+from auth import DEFAULT_CONFIG_PATH, TokenManager, config_dir, read_config
+from batch import DEFAULT_JOBS_PATH, JobProgress, load_jobs, run_item
+from catalog import DEFAULT_CATALOG_PATH, Catalog
+from dedupe import DuplicateDetector
+from extempo_async import AsyncExtempoClient
+from extempo_client import BASE_URL, ExtempoClient
+from manifest import RunManifest
+from rate_limit import RateLimiter
+
+
+# Items an account works on at the same time
+DEFAULT_PER_ACCOUNT = 4
+
+# Times an item is handed out again after failing
+DEFAULT_RETRIES = 2
+
+# Weight of the newest observation in the per-account moving averages
+EWMA_ALPHA = 0.2
+
+
+def read_accounts(path=DEFAULT_CONFIG_PATH):
+    """
+    Return [{"name", "username", "password", "base_url"}] from the [account:<name>] sections of the config file.
+    """
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    accounts = []
+    for section in parser.sections():
+        if not section.startswith("account:"):
+            continue
+        fields = parser[section]
+        accounts.append({
+            "name": section.split(":", 1)[1].strip(),
+            "username": fields.get("username"),
+            "password": fields.get("password"),
+            "base_url": fields.get("base_url"),
+        })
+    return accounts
+
+
+def account_path(name, kind):
+    return os.path.join(config_dir(), "accounts", f"{name}_{kind}.json")
+
+
+def worker_main(account, base_url, tasks, results, catalog_path=DEFAULT_CATALOG_PATH):
+    """
+    Entry point of a worker process: log in, then run items from tasks until it yields None.
+    Downloads are checked for near duplicates against the catalog as they are saved.
+    """
+    DuplicateDetector(Catalog(catalog_path)).install()
+    try:
+        asyncio.run(_worker(account, base_url, tasks, results))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker(account, base_url, tasks, results):
+    name = account["name"]
+    client = ExtempoClient(base_url)
+    token_manager = TokenManager(client, credentials=lambda: (account["username"], account["password"]),
+                                 path=account_path(name, "token"))
+    try:
+        token = await asyncio.to_thread(token_manager.get_token)
+    except Exception as e:
+        print(f"[{name}] login failed: {e}")
+        token = None
+    if not token:
+        results.put(("dead", name, None))
+        return
+
+    http_errors = 0
+
+    def count_errors(method, endpoint, status, seconds, nbytes):
+        nonlocal http_errors
+        if status == 429 or status >= 500:
+            http_errors += 1
+
+    progress = {}
+    manifests = {}
+    running = set()
+
+    async def run_task(job, n, retry):
+        job_id = job["id"]
+        if retry or job_id not in progress:
+            # Another worker may have recorded steps of a retried item
+            progress[job_id] = await asyncio.to_thread(JobProgress, job["output"])
+        if job_id not in manifests:
+            os.makedirs(job["output"], exist_ok=True)
+            manifests[job_id] = RunManifest(job["output"], buffer_size=1)
+        errors_before = http_errors
+        start = time.monotonic()
+        try:
+            ok = await run_item(aclient, job, n, progress[job_id], manifests[job_id])
+        except Exception as e:
+            print(f"[{name}] {job_id}#{n} failed: {e}")
+            ok = False
+        results.put(("item", name, (job_id, n, ok, time.monotonic() - start, http_errors - errors_before)))
+
+    rate_limiter = RateLimiter(state_path=account_path(name, "rate_limit"))
+    async with AsyncExtempoClient(base_url, token=token, token_manager=token_manager, rate_limiter=rate_limiter,
+                                  observers=[count_errors]) as aclient:
+        results.put(("ready", name, None))
+        while True:
+            task = await asyncio.to_thread(tasks.get)
+            if task is None:
+                break
+            running.add(asyncio.ensure_future(run_task(*task)))
+            running = {future for future in running if not future.done()}
+        await asyncio.gather(*running)
+    for manifest in manifests.values():
+        manifest.close()
+    client.close()
+
+
+class AccountStats:
+    """
+    Parent-side view of one account: load, moving averages and totals.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.ready = False
+        self.alive = True
+        self.inflight = set()
+        self.done = 0
+        self.failed = 0
+        self.http_errors = 0
+        self.mean_seconds = None
+        self.error_rate = 0.0
+
+    def record(self, ok, seconds, http_errors):
+        if ok:
+            self.done += 1
+        else:
+            self.failed += 1
+        self.http_errors += http_errors
+        self.mean_seconds = seconds if self.mean_seconds is None else \
+            (1 - EWMA_ALPHA) * self.mean_seconds + EWMA_ALPHA * seconds
+        failure = 0.0 if ok and not http_errors else 1.0
+        self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA * failure
+
+    def expected_finish(self, default_seconds):
+        """
+        Estimated time until a new item given to this account would be done.
+        """
+        seconds = self.mean_seconds if self.mean_seconds is not None else default_seconds
+        return (len(self.inflight) + 1) * seconds * (1 + 4 * self.error_rate)
+
+
+def run_pool(jobs, accounts, per_account=DEFAULT_PER_ACCOUNT, retries=DEFAULT_RETRIES, base_url=BASE_URL,
+             catalog_path=DEFAULT_CATALOG_PATH):
+    """
+    Run every pending item of jobs across the accounts and index the results.
+
+    :return: {account name: AccountStats}
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    stats, task_queues, processes = {}, {}, {}
+    for account in accounts:
+        name = account["name"]
+        stats[name] = AccountStats(name)
+        task_queues[name] = context.Queue()
+        processes[name] = context.Process(target=worker_main, name=f"worker-{name}", daemon=True,
+                                          args=(account, account.get("base_url") or base_url, task_queues[name], results,
+                                                catalog_path))
+        processes[name].start()
+
+    jobs_by_id = {job["id"]: job for job in jobs}
+    pending = deque()
+    for job in jobs:
+        progress = JobProgress(job["output"])
+        pending.extend((job["id"], n, 0) for n in range(job["count"]) if not progress.item(n).done)
+    attempts = {}
+    print(f"{len(pending)} items to do across {len(accounts)} accounts")
+
+    try:
+        while pending or any(account.inflight for account in stats.values()):
+            usable = [account for account in stats.values() if account.ready and account.alive]
+            known = [account.mean_seconds for account in usable if account.mean_seconds is not None]
+            default_seconds = sum(known) / len(known) if known else 1.0
+            while pending:
+                candidates = [account for account in usable if len(account.inflight) < per_account]
+                if not candidates:
+                    break
+                job_id, n, attempt = pending.popleft()
+                best = min(candidates, key=lambda account: account.expected_finish(default_seconds))
+                best.inflight.add((job_id, n))
+                attempts[(job_id, n)] = attempt
+                task_queues[best.name].put((jobs_by_id[job_id], n, attempt > 0))
+
+            if not any(account.alive for account in stats.values()):
+                print("No account is usable; stopping")
+                break
+            try:
+                kind, name, payload = results.get(timeout=5)
+            except queue.Empty:
+                # Requeue the items of workers that died without reporting
+                for name, process in processes.items():
+                    account = stats[name]
+                    if account.alive and not process.is_alive():
+                        print(f"[{name}] worker exited; requeueing {len(account.inflight)} items")
+                        account.alive = False
+                        pending.extend((job_id, n, attempts[(job_id, n)] + 1) for job_id, n in account.inflight)
+                        account.inflight.clear()
+                continue
+            account = stats[name]
+            if kind == "ready":
+                account.ready = True
+            elif kind == "dead":
+                account.alive = False
+                print(f"[{name}] unavailable")
+            else:
+                job_id, n, ok, seconds, http_errors = payload
+                account.inflight.discard((job_id, n))
+                account.record(ok, seconds, http_errors)
+                if not ok and attempts[(job_id, n)] < retries:
+                    pending.append((job_id, n, attempts[(job_id, n)] + 1))
+    finally:
+        for name, process in processes.items():
+            if process.is_alive():
+                task_queues[name].put(None)
+        for process in processes.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+    with Catalog(catalog_path) as catalog:
+        counts = catalog.scan([job["output"] for job in jobs])
+    print(f"Catalog updated: {counts['added']} added, {counts['updated']} updated")
+    return stats
+
+
+def print_summary(stats, elapsed):
+    print(f"{'account':<16}{'done':>7}{'failed':>8}{'http err':>10}{'s/item':>9}")
+    for account in stats.values():
+        seconds = f"{account.mean_seconds:.2f}" if account.mean_seconds is not None else "-"
+        print(f"{account.name:<16}{account.done:>7}{account.failed:>8}{account.http_errors:>10}{seconds:>9}")
+    done = sum(account.done for account in stats.values())
+    print(f"{done} items in {elapsed:.1f}s ({done / elapsed:.2f} items/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run batch jobs across several Extempo accounts")
+    parser.add_argument("jobs", nargs="?", default=DEFAULT_JOBS_PATH)
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="INI file with [account:<name>] sections")
+    parser.add_argument("--per-account", type=int, default=DEFAULT_PER_ACCOUNT, help="items in flight per account")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--base-url", help=f"API root (default: config base_url or {BASE_URL})")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    args = parser.parse_args()
+
+    accounts = read_accounts(args.config)
+    if not accounts:
+        print(f"No [account:<name>] sections in {args.config}")
+        return
+    jobs = load_jobs(args.jobs)
+    if not jobs:
+        print(f"No jobs in {args.jobs}")
+        return
+    base_url = args.base_url or read_config(args.config).get("base_url") or BASE_URL
+    start = time.monotonic()
+    stats = run_pool(jobs, accounts, args.per_account, args.retries, base_url, args.catalog)
+    print_summary(stats, time.monotonic() - start)
+
+
+if __name__ == "__main__":
+    main()
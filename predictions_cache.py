@@ -0,0 +1,145 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from extempo_client import predictions_key
+
+
+DEFAULT_CACHE_PATH = ".predictions_cache.sqlite3"
+
+# SQLite's default limit on host parameters per statement
+_SQL_CHUNK = 900
+
+
+class PredictionsCache:
+    """
+    Two-tier cache for get_predictions responses, keyed by the same 'prefix/image_name'
+    string that get_predictions puts in the URL.
+
+    Lookups try an in-memory LRU first and fall back to a SQLite file, so predictions
+    survive between runs. get_many resolves thousands of keys in a handful of queries
+    without touching the network.
+
+    :param path: SQLite file backing the cache
+    :param capacity: Number of entries kept in memory
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, capacity=4096):
+        self.path = path
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key]
+            row = self.db.execute("SELECT data FROM predictions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value = json.loads(row[0])
+            self._remember(key, value)
+            self.disk_hits += 1
+            return value
+
+    def get_many(self, keys):
+        """
+        Look up many keys at once and return a dict with the ones that are cached.
+        Disk lookups are batched into a few IN queries.
+        """
+        found = {}
+        with self.lock:
+            missing = []
+            for key in keys:
+                if key in self.memory:
+                    found[key] = self.memory[key]
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+            from_disk = 0
+            for i in range(0, len(missing), _SQL_CHUNK):
+                chunk = missing[i:i + _SQL_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.db.execute(f"SELECT key, data FROM predictions WHERE key IN ({placeholders})", chunk)
+                for key, data in rows:
+                    found[key] = json.loads(data)
+                    from_disk += 1
+            self.disk_hits += from_disk
+            self.misses += len(missing) - from_disk
+        return found
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, items):
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO predictions (key, data) VALUES (?, ?)",
+                                [(key, json.dumps(value)) for key, value in items.items()])
+            self.db.commit()
+            for key, value in items.items():
+                self._remember(key, value)
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "in_memory": len(self.memory),
+        }
+
+
+def import_saved_predictions(cache, pattern=os.path.join("generations_*", "*predictions*.json")):
+    """
+    Seed the cache from _predictions.json files already saved in generations_* folders.
+    Files without an s3_key field are skipped.
+
+    :return: Number of entries imported
+    """
+    items = {}
+    for path in glob.glob(pattern):
+        try:
+            with open(path) as f:
+                predictions = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        key = predictions_key(predictions.get("s3_key", "")) if isinstance(predictions, dict) else None
+        if key:
+            items[key] = predictions
+    if items:
+        cache.put_many(items)
+    print(f"Imported {len(items)} saved predictions into {cache.path}")
+    return len(items)
+
+
+if __name__ == "__main__":
+    import_saved_predictions(PredictionsCache())
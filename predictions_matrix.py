@@ -0,0 +1,250 @@
+"""
+Columnar store of trait predictions for corpus-wide analysis.
+
+Predictions are kept as one float32 matrix with a row per image and a column per
+trait, next to a key index:
+
+    .predictions_matrix/
+        traits.json   column names, fixed when the store is created
+        matrix.f32    raw little-endian float32 rows, appended in place
+        keys.txt      one S3 key per line, line i describing row i
+
+matrix() memory-maps the rows, so NumPy code can slice a trait over the whole corpus
+without parsing any JSON:
+
+    store = PredictionsMatrix()
+    ages = store.column("age")
+    store.to_dataframe().describe()
+
+Build or update the store from the catalog of generations_* folders with:
+
+    python predictions_matrix.py build
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+
+DEFAULT_MATRIX_PATH = ".predictions_matrix"
+
+TRAITS = [
+    "trustworthy", "attractive", "dominant", "smart", "age", "gender", "weight", "typical", "happy",
+    "familiar", "outgoing", "well-groomed", "long-haired", "smug", "dorky", "hair-color", "alert",
+    "cute", "privileged", "liberal", "electable", "outdoors", "healthy",
+]
+
+DTYPE = np.dtype("<f4")
+
+
+class PredictionsMatrix:
+    """
+    Append-only N x len(traits) float32 matrix of predictions plus an S3 key index.
+
+    Rows are written to the matrix before their key, so after a crash the store is
+    trimmed to the rows that have a key when it is next opened. Traits missing from a
+    prediction are stored as NaN; traits not in the store's columns are ignored.
+
+    :param path: Directory holding the store
+    :param traits: Column names used when creating a new store
+    """
+
+    def __init__(self, path=DEFAULT_MATRIX_PATH, traits=TRAITS):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        traits_path = os.path.join(path, "traits.json")
+        if os.path.exists(traits_path):
+            with open(traits_path) as f:
+                self.traits = json.load(f)
+        else:
+            self.traits = list(traits)
+            with open(traits_path, 'w') as f:
+                json.dump(self.traits, f)
+        self.columns = {trait: i for i, trait in enumerate(self.traits)}
+        self.matrix_path = os.path.join(path, "matrix.f32")
+        self.keys_path = os.path.join(path, "keys.txt")
+        self.row_bytes = DTYPE.itemsize * len(self.traits)
+        self.keys = []
+        self.index = {}
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as f:
+                self.keys = f.read().splitlines()
+        size = os.path.getsize(self.matrix_path) if os.path.exists(self.matrix_path) else 0
+        if size != len(self.keys) * self.row_bytes:
+            # An interrupted append; keep the rows that are complete on both sides
+            n = min(size // self.row_bytes, len(self.keys))
+            print(f"Trimming {self.path} to {n} consistent rows")
+            self.keys = self.keys[:n]
+            with open(self.keys_path, 'w') as f:
+                f.write("".join(f"{key}\n" for key in self.keys))
+            with open(self.matrix_path, 'ab') as f:
+                f.truncate(n * self.row_bytes)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def row_for(self, predictions):
+        """
+        Convert a {trait: score} dict into one float32 row.
+        """
+        row = np.full(len(self.traits), np.nan, dtype=DTYPE)
+        for trait, value in predictions.items():
+            column = self.columns.get(trait)
+            if column is not None and value is not None:
+                row[column] = value
+        return row
+
+    def append(self, items):
+        """
+        Append predictions for keys not yet in the store.
+
+        :param items: Iterable of (s3_key, {trait: score}) pairs
+        :return: Number of rows added
+        """
+        with self.lock:
+            # Only published to self.index once both files hold the rows
+            added = {}
+            rows = []
+            for key, predictions in items:
+                if not key or key in self.index or key in added or '\n' in key:
+                    continue
+                added[key] = len(self.keys) + len(added)
+                rows.append(self.row_for(predictions))
+            if not rows:
+                return 0
+            keys_size = os.path.getsize(self.keys_path) if os.path.exists(self.keys_path) else 0
+            try:
+                with open(self.matrix_path, 'ab') as f:
+                    f.write(np.stack(rows).astype(DTYPE).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self.keys_path, 'a') as f:
+                    f.write("".join(f"{key}\n" for key in added))
+            except BaseException:
+                self._roll_back(keys_size)
+                raise
+            self.keys.extend(added)
+            self.index.update(added)
+            return len(rows)
+
+    def _roll_back(self, keys_size):
+        """
+        Cut both files back to the rows in self.keys after a failed append, so the next append lines up.
+        """
+        try:
+            with open(self.matrix_path, 'ab') as f:
+                f.truncate(len(self.keys) * self.row_bytes)
+            if os.path.exists(self.keys_path):
+                with open(self.keys_path, 'ab') as f:
+                    f.truncate(keys_size)
+        except OSError as e:
+            # _load trims the files to their consistent rows when the store is next opened
+            print(f"Cannot roll back {self.path}: {e}")
+
+    def matrix(self):
+        """
+        Return a read-only memory map of shape (len(self), len(self.traits)).
+        """
+        if not self.keys:
+            return np.empty((0, len(self.traits)), dtype=DTYPE)
+        return np.memmap(self.matrix_path, dtype=DTYPE, mode='r', shape=(len(self.keys), len(self.traits)))
+
+    def column(self, trait):
+        return self.matrix()[:, self.columns[trait]]
+
+    def get(self, key):
+        """
+        Return the predictions of one key as a {trait: score} dict, or None.
+        """
+        i = self.index.get(key)
+        if i is None:
+            return None
+        return {trait: float(value) for trait, value in zip(self.traits, self.matrix()[i]) if not np.isnan(value)}
+
+    def rows(self, keys):
+        """
+        Return the matrix rows for keys, in order; unknown keys give rows of NaN.
+        """
+        matrix = self.matrix()
+        result = np.full((len(keys), len(self.traits)), np.nan, dtype=DTYPE)
+        found = [(n, self.index[key]) for n, key in enumerate(keys) if key in self.index]
+        if found:
+            targets, sources = zip(*found)
+            result[list(targets)] = matrix[list(sources)]
+        return result
+
+    def to_dataframe(self):
+        """
+        Return the store as a pandas DataFrame indexed by S3 key (requires pandas).
+        """
+        import pandas as pd
+        return pd.DataFrame(self.matrix(), index=pd.Index(self.keys, name="s3_key"), columns=self.traits)
+
+
+def build_from_catalog(store, catalog):
+    """
+    Append every predictions file in the catalog whose key is not in the store yet.
+
+    :return: Number of rows added
+    """
+    rows = catalog.find(kind="predictions")
+    return store.append((row["s3_key"], row["predictions"]) for row in rows if row["predictions"])
+
+
+def build_from_cache(store, cache):
+    """
+    Append every entry of a PredictionsCache whose key is not in the store yet.
+
+    :return: Number of rows added
+    """
+    with cache.lock:
+        data = [json.loads(data) for (data,) in cache.db.execute("SELECT data FROM predictions")]
+    return store.append((predictions.get("s3_key"), predictions.get("predictions", {}))
+                        for predictions in data if isinstance(predictions, dict))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect the columnar predictions store")
+    parser.add_argument("--path", default=DEFAULT_MATRIX_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="append predictions from the catalog (and optionally the cache)")
+    build.add_argument("--catalog", default=None, help="catalog file (default: catalog.DEFAULT_CATALOG_PATH)")
+    build.add_argument("--root", default=".", help="directory containing the generations_* folders")
+    build.add_argument("--with-cache", action="store_true", help="also import the predictions cache")
+    subparsers.add_parser("stats", help="print per-trait summary statistics")
+    args = parser.parse_args()
+
+    store = PredictionsMatrix(args.path)
+    if args.command == "build":
+        from catalog import DEFAULT_CATALOG_PATH, Catalog
+        with Catalog(args.catalog or DEFAULT_CATALOG_PATH, args.root) as catalog:
+            catalog.scan()
+            added = build_from_catalog(store, catalog)
+        if args.with_cache:
+            from predictions_cache import PredictionsCache
+            cache = PredictionsCache()
+            added += build_from_cache(store, cache)
+            cache.close()
+        print(f"Added {added} rows; {len(store)} rows in {store.path}")
+    else:
+        matrix = np.asarray(store.matrix(), dtype=np.float64)
+        print(f"{len(store)} rows")
+        if len(store):
+            means = np.nanmean(matrix, axis=0)
+            stds = np.nanstd(matrix, axis=0)
+            for trait, mean, std in zip(store.traits, means, stds):
+                print(f"  {trait:<14} mean {mean:+.3f}  std {std:.3f}")
+
+
+if __name__ == "__main__":
+    main()
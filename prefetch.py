@@ -0,0 +1,184 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from extempo_client import split_s3_key
+
+
+DEFAULT_POOL_PATH = ".candidate_pool.json"
+
+# Seconds stop() waits for each worker; one still polling for an image must not hold up exit
+STOP_TIMEOUT = 10
+
+
+class CandidatePrefetcher:
+    """
+    Keeps a buffer of ready-to-review random faces filled in the background.
+
+    Worker threads decode faces and download their images and predictions ahead of
+    time, so the next candidate is available the moment the previous one is rejected.
+    Candidates still buffered when the prefetcher stops are written to a pool file
+    (S3 key and predictions) and served first the next time it starts.
+
+    With a screening rule, each face's predictions are fetched first and faces the rule
+    rejects are dropped before any image bytes are downloaded.
+
+    :param client: ExtempoClient with a token set; its caches are shared with the workers
+    :param buffer_size: Number of fully downloaded candidates to keep ready
+    :param workers: Number of background threads fetching candidates
+    :param pool_path: File holding unused candidates between sessions, or None to disable
+    :param screen: Optional callable taking a face's predictions and returning whether to keep it,
+        e.g. a screening.ScreeningRule
+    """
+
+    def __init__(self, client, buffer_size=3, workers=2, pool_path=DEFAULT_POOL_PATH, screen=None):
+        self.client = client
+        self.screen = screen
+        self.screened_out = 0
+        self.buffer_size = buffer_size
+        self.workers = workers
+        self.pool_path = pool_path
+        self.ready = queue.Queue()
+        self.slots = threading.Semaphore(buffer_size)
+        self.stopping = threading.Event()
+        self.threads = []
+        self.saved = queue.Queue()
+        self.failures = 0
+        # Guards handing candidates to ready against stop() draining it; once closed, a worker
+        # still finishing a fetch adds its candidate to the saved pool instead
+        self.lock = threading.Lock()
+        self.closed = False
+        self.unused = []
+
+    def start(self):
+        for candidate in self._load_pool():
+            self.saved.put(candidate)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"prefetch-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        """
+        Stop the workers and keep whatever is still buffered for the next session.
+        """
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join(timeout=STOP_TIMEOUT)
+        self.threads = []
+        with self.lock:
+            self.closed = True
+            for source in (self.ready, self.saved):
+                while True:
+                    try:
+                        candidate = source.get_nowait()
+                    except queue.Empty:
+                        break
+                    self.unused.append(self._pooled(candidate))
+            self._save_pool(self.unused)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def next_candidate(self, timeout=None):
+        """
+        Return the next candidate as a dict with s3_key, image and predictions, blocking
+        until one is ready. Returns None if nothing arrives within timeout seconds.
+        """
+        try:
+            candidate = self.ready.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self.slots.release()
+        return candidate
+
+    def _run(self):
+        while not self.stopping.is_set():
+            if not self.slots.acquire(timeout=0.5):
+                continue
+            candidate = self._fetch_candidate()
+            if candidate is None:
+                self.slots.release()
+                self.failures += 1
+                # Back off on repeated failures instead of hammering the gateway
+                self.stopping.wait(min(30, 2 ** min(self.failures, 5)))
+                continue
+            self.failures = 0
+            with self.lock:
+                if not self.closed:
+                    self.ready.put(candidate)
+                    continue
+                # stop() gave up waiting for this worker and has already saved the pool
+                self.unused.append(self._pooled(candidate))
+                self._save_pool(self.unused)
+            return
+
+    def _fetch_candidate(self):
+        while True:
+            try:
+                saved = self.saved.get_nowait()
+            except queue.Empty:
+                saved = None
+
+            if saved is not None:
+                s3_key = saved["s3_key"]
+                predictions = saved.get("predictions")
+            else:
+                random_face = self.client.decode_random_face()
+                if not random_face:
+                    return None
+                s3_key = random_face["s3_key"]
+                predictions = None
+
+            if self.screen is None:
+                break
+            if predictions is None:
+                predictions = self.client.wait_for_predictions(s3_key)
+                if predictions is None:
+                    return None
+            if self.screen(predictions):
+                break
+            self.screened_out += 1
+            print(f"Screened out {s3_key} without downloading it")
+            if self.stopping.is_set():
+                return None
+
+        path, id = split_s3_key(s3_key)
+        image = self.client.wait_for_image(path, id)
+        if image is None:
+            return None
+        if predictions is None:
+            predictions = self.client.wait_for_predictions(s3_key)
+        return {"s3_key": s3_key, "image": image, "predictions": predictions, "fetched_at": time.time()}
+
+    @staticmethod
+    def _pooled(candidate):
+        return {"s3_key": candidate["s3_key"], "predictions": candidate.get("predictions")}
+
+    def _load_pool(self):
+        if not self.pool_path or not os.path.exists(self.pool_path):
+            return []
+        try:
+            with open(self.pool_path) as f:
+                candidates = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable candidate pool {self.pool_path}: {e}")
+            return []
+        print(f"Loaded {len(candidates)} unused candidates from {self.pool_path}")
+        return candidates
+
+    def _save_pool(self, candidates):
+        if not self.pool_path:
+            return
+        tmp_path = f"{self.pool_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(candidates, f, indent=2)
+        os.replace(tmp_path, self.pool_path)
+        if candidates:
+            print(f"Saved {len(candidates)} unused candidates to {self.pool_path}")
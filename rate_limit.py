@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from auth import config_dir
+
+
+DEFAULT_STATE_PATH = os.path.join(config_dir(), "rate_limit.json")
+
+try:
+    import fcntl
+
+    def _lock(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+except ImportError:
+    # Windows: lock the first byte of the state file instead of the whole file
+    import msvcrt
+
+    def _lock(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                # LK_LOCK gives up after about 10 seconds of retries
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (delta-seconds or HTTP date) into seconds, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by every process on this machine.
+
+    The bucket lives in a small JSON state file guarded by an exclusive file lock, so all
+    scripts using the same account draw from one budget. A 429 response halves the
+    rate and, if the server sent Retry-After, blocks everyone until then; each
+    successful response then nudges the rate back up towards the configured ceiling.
+
+    :param rate: Requests per second allowed across all processes
+    :param burst: Bucket capacity, i.e. how many requests may go out back to back
+    :param min_rate: Floor the adaptive rate never drops below
+    :param state_path: Shared state file; use the same path on every process of one account
+    """
+
+    def __init__(self, rate=5.0, burst=10, min_rate=0.2, state_path=DEFAULT_STATE_PATH):
+        self.max_rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.state_path = state_path
+        self.observed_rate = rate
+        self.local_lock = threading.Lock()
+        directory = os.path.dirname(state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _update(self, fn):
+        """
+        Run fn(state) -> result while holding the cross-process lock and persist the state.
+        """
+        with self.local_lock:
+            fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                _lock(fd)
+                raw = b""
+                while True:
+                    chunk = os.read(fd, 4096)
+                    if not chunk:
+                        break
+                    raw += chunk
+                try:
+                    state = json.loads(raw) if raw else {}
+                except ValueError:
+                    state = {}
+                now = time.time()
+                state.setdefault("rate", self.max_rate)
+                state.setdefault("tokens", float(self.burst))
+                state.setdefault("updated", now)
+                state.setdefault("blocked_until", 0.0)
+                # Refill the bucket for the time elapsed since the last writer
+                rate = min(state["rate"], self.max_rate)
+                state["tokens"] = min(float(self.burst), state["tokens"] + (now - state["updated"]) * rate)
+                state["updated"] = now
+                result = fn(state, now)
+                data = json.dumps(state).encode()
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, data)
+                return result
+            finally:
+                _unlock(fd)
+                os.close(fd)
+
+    def _take(self, state, now):
+        """
+        Take one token if available and return 0, otherwise return how long to wait.
+        """
+        self.observed_rate = state["rate"]
+        if state["blocked_until"] > now:
+            return state["blocked_until"] - now
+        if state["tokens"] >= 1:
+            state["tokens"] -= 1
+            return 0.0
+        rate = max(self.min_rate, min(state["rate"], self.max_rate))
+        return (1 - state["tokens"]) / rate
+
+    def acquire(self):
+        """
+        Block until a request may be sent. Returns the total time spent waiting.
+        """
+        waited = 0.0
+        while True:
+            delay = self._update(self._take)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self):
+        waited = 0.0
+        while True:
+            delay = await asyncio.to_thread(self._update, self._take)
+            if delay <= 0:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        if self.observed_rate >= self.max_rate:
+            # Nothing to recover; skip the file lock on the common path
+            return
+
+        def grow(state, now):
+            # Additive increase: recover 5% of the ceiling per successful request
+            state["rate"] = min(self.max_rate, state["rate"] + self.max_rate * 0.05)
+            self.observed_rate = state["rate"]
+        self._update(grow)
+
+    def on_throttled(self, retry_after=None):
+        """
+        Record a 429 response. Returns the number of seconds the caller should wait before retrying.
+        """
+        def shrink(state, now):
+            state["rate"] = max(self.min_rate, state["rate"] / 2)
+            self.observed_rate = state["rate"]
+            state["tokens"] = 0.0
+            pause = retry_after if retry_after is not None else 1 / state["rate"]
+            state["blocked_until"] = max(state["blocked_until"], now + pause)
+            return state["blocked_until"] - now
+        return self._update(shrink)
+
+    def current_rate(self):
+        return self._update(lambda state, now: state["rate"])
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import random
+import time
+
+
+class PermanentError(Exception):
+    """
+    Raised by a fetch function when waiting cannot help, e.g. the request was refused or the key is malformed.
+    """
+
+
+def is_transient(status):
+    """
+    Whether a failed request may succeed later: the resource is not ready yet (202, 404), the
+    request was throttled (429) or the server failed (5xx). Any other status is permanent.
+    """
+    return status in (202, 404, 408, 429) or status >= 500
+
+
+class ReadyStats:
+    """
+    Time-to-ready samples collected by a ReadinessPoller, used to tune its parameters.
+    """
+
+    def __init__(self, name="resource"):
+        self.name = name
+        self.samples = []
+        self.timeouts = 0
+        self.failures = 0
+
+    def record(self, seconds, attempts):
+        self.samples.append((seconds, attempts))
+
+    def record_timeout(self):
+        self.timeouts += 1
+
+    def record_failure(self):
+        self.failures += 1
+
+    def summary(self):
+        times = sorted(seconds for seconds, _ in self.samples)
+        attempts = [n for _, n in self.samples]
+        if not times:
+            return {"name": self.name, "count": 0, "timeouts": self.timeouts, "failures": self.failures}
+
+        def percentile(p):
+            return times[min(len(times) - 1, int(round(p / 100 * (len(times) - 1))))]
+
+        return {
+            "name": self.name,
+            "count": len(times),
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "mean": sum(times) / len(times),
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "max": times[-1],
+            "mean_attempts": sum(attempts) / len(attempts),
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        if not s["count"]:
+            print(f"{self.name}: no samples ({s['timeouts']} timeouts, {s['failures']} failures)")
+            return
+        print(f"{self.name}: {s['count']} ready, {s['timeouts']} timeouts, {s['failures']} failures, "
+              f"mean {s['mean']:.2f}s, p50 {s['p50']:.2f}s, p95 {s['p95']:.2f}s, max {s['max']:.2f}s, "
+              f"{s['mean_attempts']:.1f} attempts on average")
+
+    def dump(self, path):
+        """
+        Append the raw samples to a JSON lines file so they can be aggregated across runs.
+        """
+        with open(path, 'a') as f:
+            for seconds, attempts in self.samples:
+                f.write(json.dumps({"name": self.name, "seconds": seconds, "attempts": attempts}) + "\n")
+
+
+class ReadinessPoller:
+    """
+    Polls a fetch function until it returns something other than None, backing off
+    exponentially with jitter between attempts and giving up at the deadline. A fetch
+    function raises PermanentError to stop polling at once, for errors waiting cannot fix.
+
+    This replaces fixed waits: the result is returned as soon as the server has it,
+    and a slow server is given up to `deadline` seconds instead of a single retry.
+
+    :param initial_delay: Delay before the second attempt, in seconds
+    :param factor: Multiplier applied to the delay after every attempt
+    :param max_delay: Upper bound for a single delay
+    :param jitter: Fraction of the delay randomised in both directions (0 disables jitter)
+    :param deadline: Total seconds to keep trying before returning None
+    :param name: Label used in messages and statistics
+    """
+
+    def __init__(self, initial_delay=0.5, factor=2.0, max_delay=8.0, jitter=0.25, deadline=120.0, name="resource"):
+        self.initial_delay = initial_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.name = name
+        self.stats = ReadyStats(name)
+
+    def delays(self):
+        delay = self.initial_delay
+        while True:
+            spread = delay * self.jitter
+            yield max(0.0, delay + random.uniform(-spread, spread))
+            delay = min(self.max_delay, delay * self.factor)
+
+    def _give_up(self, label, error):
+        self.stats.record_failure()
+        print(f"Giving up on {label or self.name}: {error}")
+        return None
+
+    def poll(self, fetch, label=None):
+        """
+        Call fetch() until it returns a value or the deadline passes.
+
+        :param fetch: Zero-argument callable returning the resource, None while it is not ready,
+            or raising PermanentError
+        :param label: Optional description printed on timeout or failure
+        :return: The first non-None result, or None on timeout or a permanent error
+        """
+        start = time.monotonic()
+        attempts = 0
+        for delay in self.delays():
+            attempts += 1
+            try:
+                result = fetch()
+            except PermanentError as e:
+                return self._give_up(label, e)
+            elapsed = time.monotonic() - start
+            if result is not None:
+                self.stats.record(elapsed, attempts)
+                return result
+            remaining = self.deadline - elapsed
+            if remaining <= 0:
+                break
+            time.sleep(min(delay, remaining))
+        self.stats.record_timeout()
+        print(f"Timed out after {self.deadline}s waiting for {label or self.name} ({attempts} attempts)")
+        return None
+
+    async def poll_async(self, fetch, label=None):
+        """
+        asyncio version of poll; fetch is a zero-argument coroutine function.
+        """
+        start = time.monotonic()
+        attempts = 0
+        for delay in self.delays():
+            attempts += 1
+            try:
+                result = await fetch()
+            except PermanentError as e:
+                return self._give_up(label, e)
+            elapsed = time.monotonic() - start
+            if result is not None:
+                self.stats.record(elapsed, attempts)
+                return result
+            remaining = self.deadline - elapsed
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(delay, remaining))
+        self.stats.record_timeout()
+        print(f"Timed out after {self.deadline}s waiting for {label or self.name} ({attempts} attempts)")
+        return None
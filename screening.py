@@ -0,0 +1,251 @@
+"""
+Screening rules that accept or reject a face from its predictions alone.
+
+Predictions arrive before (and are far smaller than) the image, so candidates are
+screened first and only the survivors are downloaded and shown for review:
+
+    gender > 0.5 and |age| < 1
+    -1 <= happy <= 1 or not (dominant > 2)
+    abs(attractive - trustworthy) < 0.5
+
+Rules combine comparisons (<, <=, >, >=, ==, !=, chained as in Python) of arithmetic
+(+, -, *, /, |x| or abs(x)) on trait names and numbers with and / or / not, grouped
+with parentheses. A trait missing from a face's predictions fails the rule. Names are
+checked against the known traits when the rule is parsed, so a typo is an error rather
+than a rule that rejects every face. A hyphen inside a name is part of it only for
+hyphenated traits such as well-groomed; attractive-trustworthy is a subtraction.
+"""
+import functools
+import operator
+import re
+
+from predictions_matrix import TRAITS
+
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+)
+      | (?P<name>[A-Za-z_]\w*(?:-[A-Za-z_]\w*)*)
+      | (?P<op><=|>=|==|!=|<|>|[-+*/()|])
+    )""", re.VERBOSE)
+
+_COMPARISONS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+                "==": operator.eq, "!=": operator.ne}
+
+_KEYWORDS = {"and", "or", "not", "abs"}
+
+
+def tokenize(text, known_traits=None):
+    """
+    Split a rule into (kind, text) tokens. With known_traits, a hyphenated name that is not
+    a trait is cut after its longest hyphenated prefix that is (or its first part), so the
+    rest is read as a subtraction.
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f"Unexpected {text[position:].strip()[:10]!r} in rule {text!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        position = match.end()
+        if kind == "name" and "-" in value and known_traits is not None and value not in known_traits:
+            parts = value.split("-")
+            cut = next((n for n in range(len(parts) - 1, 1, -1) if "-".join(parts[:n]) in known_traits), 1)
+            value = "-".join(parts[:cut])
+            position = match.start(kind) + len(value)
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive-descent parser compiling a rule into nested closures over a {trait: score} dict.
+    """
+
+    def __init__(self, text, known_traits):
+        self.text = text
+        self.tokens = tokenize(text, known_traits)
+        self.position = 0
+        self.known_traits = known_traits
+        self.traits = set()
+        # |x| bars cannot open a new absolute value while one is waiting to be closed
+        self.bars = 0
+
+    def peek(self):
+        return self.tokens[self.position][1] if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        if self.position >= len(self.tokens):
+            raise ValueError(f"Rule {self.text!r} ends early" + (f"; expected {expected!r}" if expected else ""))
+        kind, value = self.tokens[self.position]
+        if expected is not None and value != expected:
+            raise ValueError(f"Expected {expected!r} but found {value!r} in rule {self.text!r}")
+        self.position += 1
+        return kind, value
+
+    def parse(self):
+        rule = self.disjunction()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected {self.peek()!r} in rule {self.text!r}")
+        return rule
+
+    def disjunction(self):
+        parts = [self.conjunction()]
+        while self.peek() == "or":
+            self.take()
+            parts.append(self.conjunction())
+        return parts[0] if len(parts) == 1 else lambda scores: any(part(scores) for part in parts)
+
+    def conjunction(self):
+        parts = [self.negation()]
+        while self.peek() == "and":
+            self.take()
+            parts.append(self.negation())
+        return parts[0] if len(parts) == 1 else lambda scores: all(part(scores) for part in parts)
+
+    def negation(self):
+        if self.peek() == "not":
+            self.take()
+            inner = self.negation()
+            return lambda scores: not inner(scores)
+        return self.comparison()
+
+    def comparison(self):
+        if self.peek() == "(":
+            # '(gender > 0 or age < 1)' groups conditions, '(age + 1) > 0' groups arithmetic;
+            # try the first and fall back to the second
+            start, bars, traits = self.position, self.bars, set(self.traits)
+            try:
+                self.take("(")
+                inner = self.disjunction()
+                self.take(")")
+                if self.peek() not in _COMPARISONS and self.peek() not in ("+", "-", "*", "/"):
+                    return inner
+                condition_error, condition_end = None, self.position
+            except ValueError as e:
+                condition_error, condition_end = e, self.position
+            self.position, self.bars, self.traits = start, bars, traits
+            try:
+                return self._compare()
+            except ValueError:
+                # Report whichever reading got further into the rule
+                if condition_error is not None and condition_end > self.position:
+                    raise condition_error
+                raise
+        return self._compare()
+
+    def _compare(self):
+        operands = [self.sum()]
+        operators = []
+        while self.peek() in _COMPARISONS:
+            operators.append(_COMPARISONS[self.take()[1]])
+            operands.append(self.sum())
+        if not operators:
+            raise ValueError(f"Rule {self.text!r} has a value where a comparison is expected")
+
+        def compare(scores):
+            values = [operand(scores) for operand in operands]
+            if None in values:
+                return False
+            return all(op(a, b) for op, a, b in zip(operators, values, values[1:]))
+        return compare
+
+    def sum(self):
+        value = self.product()
+        while self.peek() in ("+", "-"):
+            op = operator.add if self.take()[1] == "+" else operator.sub
+            value = _binary(op, value, self.product())
+        return value
+
+    def product(self):
+        value = self.unary()
+        while self.peek() in ("*", "/"):
+            op = operator.mul if self.take()[1] == "*" else _divide
+            value = _binary(op, value, self.unary())
+        return value
+
+    def unary(self):
+        if self.peek() == "-":
+            self.take()
+            inner = self.unary()
+            return lambda scores: None if (v := inner(scores)) is None else -v
+        if self.peek() == "+":
+            self.take()
+            return self.unary()
+        return self.atom()
+
+    def atom(self):
+        kind, value = self.take()
+        if kind == "number":
+            number = float(value)
+            return lambda scores: number
+        if value == "(":
+            inner = self.sum()
+            self.take(")")
+            return inner
+        if value == "|" or value == "abs":
+            if value == "abs":
+                self.take("(")
+                closing = ")"
+            else:
+                if self.bars:
+                    raise ValueError(f"Nested |...| in rule {self.text!r}; use abs() instead")
+                self.bars += 1
+                closing = "|"
+            inner = self.sum()
+            self.take(closing)
+            if closing == "|":
+                self.bars -= 1
+            return lambda scores: None if (v := inner(scores)) is None else abs(v)
+        if kind == "name" and value not in _KEYWORDS:
+            if self.known_traits is not None and value not in self.known_traits:
+                raise ValueError(f"Unknown trait {value!r} in rule {self.text!r}")
+            self.traits.add(value)
+            return lambda scores: scores.get(value)
+        raise ValueError(f"Unexpected {value!r} in rule {self.text!r}")
+
+
+def _binary(op, left, right):
+    def apply(scores):
+        a, b = left(scores), right(scores)
+        return None if a is None or b is None else op(a, b)
+    return apply
+
+
+def _divide(a, b):
+    return a / b if b else None
+
+
+class ScreeningRule:
+    """
+    A compiled screening rule; call it with a predictions dict to accept or reject a face.
+
+    :param text: The rule, e.g. 'gender > 0.5 and |age| < 1'
+    :param known_traits: Trait names the rule may use, or None to allow any name
+    """
+
+    def __init__(self, text, known_traits=TRAITS):
+        self.text = text.strip()
+        parser = _Parser(self.text, set(known_traits) if known_traits is not None else None)
+        self._rule = parser.parse()
+        self.traits = frozenset(parser.traits)
+
+    def __call__(self, predictions):
+        scores = predictions.get("predictions", predictions) if isinstance(predictions, dict) else None
+        if not isinstance(scores, dict):
+            return False
+        return bool(self._rule(scores))
+
+    def __repr__(self):
+        return f"ScreeningRule({self.text!r})"
+
+
+@functools.lru_cache(maxsize=64)
+def compile_rule(text):
+    """
+    Parse a rule once and reuse it; raises ValueError for a malformed rule.
+    """
+    return ScreeningRule(text)
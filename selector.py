@@ -2,211 +2,184 @@
 import requests
 import json
 import sys
-import time
-import os
-from datetime import datetime
-from PIL import Image
-
-
-BASE_URL = "https://gateway.extempo.rocks"
+from auth import TokenManager
+from catalog import Catalog
+from contact_sheet import save_sweep_sheet
+from dedupe import DuplicateDetector
+from display import ImageDisplay
+from extempo_client import BASE_URL, ExtempoClient
+from image_cache import ImageCache
+from manifest import RunManifest
+from prefetch import CandidatePrefetcher
+from predictions_cache import PredictionsCache
+from rate_limit import RateLimiter
+from screening import ScreeningRule
+from storage import create_timestamped_folder, get_timestamped_filename, save_image, save_predictions
+from sweep import run_sweep
+from target import ResponseCurve, run_targets
+
+
+# One pooled keep-alive session shared by every API helper below
+client = ExtempoClient(BASE_URL, timeout=5)
+token_manager = None
+
+# Set FACEGEN_DISPLAY=headless|external|viewer to choose how images are shown
+display = ImageDisplay()
+
+duplicates = None
+
+
+def setup():
+    """
+    Open the local caches and shared state on first use, so importing this module creates no files.
+    """
+    global token_manager, duplicates
+    if client.image_cache is None:
+        # Images already downloaded are served from the local cache
+        client.image_cache = ImageCache()
+    if client.predictions_cache is None:
+        # Predictions already requested are served from the local cache
+        client.predictions_cache = PredictionsCache()
+    if token_manager is None:
+        # Reuses the token cached on disk and logs in again on 401
+        token_manager = TokenManager(client)
+    if client.rate_limiter is None:
+        # Every request draws from the rate budget shared with other local processes
+        client.rate_limiter = RateLimiter()
+    if duplicates is None:
+        # Every saved image is hashed and flagged if it nearly duplicates one already catalogued
+        duplicates = DuplicateDetector(Catalog()).install()
+
+
+# Number of candidate faces downloaded ahead of time while the user is reviewing
+PREFETCH_BUFFER = 3
+PREFETCH_TIMEOUT = 300
 
 def login(username, password):
-    try:
-        print(f"Attempting to connect to {BASE_URL}/auth/login")
-        response = requests.post(f"{BASE_URL}/auth/login", json={"username": username, "password": password}, timeout=5)
-        print(f"Response status code: {response.status_code}")
-        print(f"Response content: {response.text}")
-        if response.status_code == 200:
-            return response.json()["token"]
-        else:
-            print(f"Login failed: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred during login: {e}")
-        print(f"Error type: {type(e).__name__}")
-        return None
+    setup()
+    return client.login(username, password)
 
 
 def get_user_info(token):
-    headers = {"Authorization": f"Bearer {token}"}
-    try:
-        response = requests.get(f"{BASE_URL}/users/me", headers=headers, timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to get user info: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while getting user info: {e}")
-        return None
+    setup()
+    client.set_token(token)
+    return client.get_user_info()
 
 
-def wait_with_message(seconds, message):
-    print(message)
-    for i in range(seconds, 0, -1):
-        print(f"Waiting... {i} seconds remaining", end='\r')
-        time.sleep(1)
-    print("\nDone waiting.")
+def wait_for_image(token, path, id):
+    """
+    Poll for the image with backoff and return it as soon as the server has rendered it.
+    """
+    setup()
+    client.set_token(token)
+    return client.wait_for_image(path, id)
 
 
-def decode_random_face(token):
-    headers = {"Authorization": f"Bearer {token}"}
-    try:
-        response = requests.get(f"{BASE_URL}/decode", headers=headers, timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to decode random face: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while decoding random face: {e}")
-        return None
+def wait_for_predictions(token, s3_key):
+    setup()
+    client.set_token(token)
+    return client.wait_for_predictions(s3_key)
 
 
-def get_image(token, path, id):
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"path": path, "id": id}
-    try:
-        response = requests.get(f"{BASE_URL}/image/{path}/{id}", headers=headers, params=params, timeout=5)
-        if response.status_code == 200:
-            return response.content
-        else:
-            print(f"Failed to get image: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while getting image: {e}")
-        return None
+def decode_random_face(token):
+    setup()
+    client.set_token(token)
+    return client.decode_random_face()
 
 
-def save_and_show_image(image_data, filename, folder):
-    # Create the full path for the file
-    full_path = os.path.join(folder, filename)
-    
-    # Ensure the filename has a .jpg extension
-    if not full_path.lower().endswith('.jpg'):
-        full_path += '.jpg'
-    
-    # Save the image
-    with open(full_path, "wb") as f:
-        f.write(image_data)
-    print(f"Image saved as '{full_path}'")
-    
-    # Show the image
-    Image.open(full_path).show()
+def get_image(token, path, id):
+    setup()
+    client.set_token(token)
+    return client.get_image(path, id)
 
 
-def get_predictions(token, s3_key):
-    headers = {"Authorization": f"Bearer {token}"}
-    parts = s3_key.split('/')
-    if len(parts) < 3:
-        print(f"Invalid s3_key format: {s3_key}")
-        return None
-    
-    prefix = parts[1]
-    image_name = parts[-1]
-    
+def save_and_show_image(image_data, filename, folder, image_key=None):
+    """
+    Save and show an image; return its path, or None if the bytes are not a complete JPEG.
+    """
+    setup()
     try:
-        url = f"{BASE_URL}/predictions/{prefix}/{image_name}"
-        print(f"Requesting predictions from: {url}")
-        response = requests.get(url, headers=headers, timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to get predictions: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while getting predictions: {e}")
+        full_path = save_image(image_data, filename, folder, image_key)
+    except ValueError as e:
+        print(f"Could not save {filename}: {e}")
         return None
+    display.show(full_path)
+    return full_path
 
 
-def save_predictions(predictions, filename, folder):
-    full_path = os.path.join(folder, filename)
-    if not full_path.lower().endswith('.json'):
-        full_path += '.json'
-    with open(full_path, 'w') as f:
-        json.dump(predictions, f, indent=2)
-    print(f"Predictions saved to {full_path}")
-
-
-def create_timestamped_folder(base_dir="generations"):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    folder_name = f"{base_dir}_{timestamp}"
-    os.makedirs(folder_name, exist_ok=True)
-    return folder_name
-
-
-def get_timestamped_filename(base_name, extension):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return f"{base_name}_{timestamp}.{extension}"
-
-
-def save_and_show_image(image_data, filename, folder):
-    full_path = os.path.join(folder, filename)
-    if not full_path.lower().endswith('.jpg'):
-        full_path += '.jpg'
-    with open(full_path, "wb") as f:
-        f.write(image_data)
-    print(f"Image saved as '{full_path}'")
-    Image.open(full_path).show()
-
-
-def save_characteristic_info(attribute, beta, filename, folder, s3_key, photo_filename):
-    full_path = os.path.join(folder, filename)
-    with open(full_path, 'w') as f:
-        f.write(f"Characteristic: {attribute}\n")
-        f.write(f"Beta: {beta}\n")
-        f.write(f"S3 Key: {s3_key}\n")
-        f.write(f"Photo Filename: {photo_filename}")
-    print(f"Characteristic info saved to {full_path}")
+def get_predictions(token, s3_key):
+    setup()
+    client.set_token(token)
+    return client.get_predictions(s3_key)
 
 
 def request_transformation(token, s3_key, attribute, beta, control_attributes=None):
-    headers = {"Authorization": f"Bearer {token}"}
-    path, id = s3_key.split('/', 1)[1].split('/', 1)
-    data = {
-        "attribute": attribute,
-        "betas": [float(beta)],
-        "control_attributes": control_attributes,
-        "interpretable_betas": True
-    }
-    try:
-        response = requests.post(f"{BASE_URL}/request_transformation/{path}/{id}", json=data, headers=headers, timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to request transformation: {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while requesting transformation: {e}")
-        return None
+    setup()
+    client.set_token(token)
+    return client.request_transformation(s3_key, attribute, [float(beta)], control_attributes)
 
 
-def generate_and_approve_face(token, output_folder):
-    while True:
-        random_face = decode_random_face(token)
-        if not random_face:
-            print("Failed to generate a random face. Please try again.")
-            return None
+def generate_and_approve_face(token, output_folder, prefetcher=None, manifest=None, screen=None):
+    """
+    Show random faces until one is approved and return its S3 key.
 
-        print(f"Random face generated: {json.dumps(random_face, indent=2)}")
-        s3_key = random_face["s3_key"]
-
-        wait_with_message(5, "Waiting for the server to generate the image...")
-
-        path, id = s3_key.split('/', 1)[1].split('/', 1)
-        image_data = get_image(token, path, id)
-        if not image_data:
-            print("Failed to retrieve the image. Trying again...")
-            continue
+    With a CandidatePrefetcher the next face comes from its buffer of already downloaded
+    candidates, otherwise each face is decoded and fetched on demand. Every face shown
+    is recorded in the run manifest, if one is given. Without a prefetcher, a screening
+    rule (screen) is checked against each face's predictions before its image is
+    downloaded; a prefetcher applies its own.
+    """
+    while True:
+        if prefetcher is not None:
+            candidate = prefetcher.next_candidate(timeout=PREFETCH_TIMEOUT)
+            if not candidate:
+                print("Failed to generate a random face. Please try again.")
+                return None
+            s3_key = candidate["s3_key"]
+            image_data = candidate["image"]
+            predictions = candidate["predictions"]
+            print(f"Random face generated: {s3_key}")
+        else:
+            random_face = decode_random_face(token)
+            if not random_face:
+                print("Failed to generate a random face. Please try again.")
+                return None
+
+            print(f"Random face generated: {json.dumps(random_face, indent=2)}")
+            s3_key = random_face["s3_key"]
+            predictions = None
+
+            if screen is not None:
+                predictions = wait_for_predictions(token, s3_key)
+                if not (predictions and screen(predictions)):
+                    print("Face does not match the screening rule, generating another...")
+                    continue
+
+            print("Waiting for the server to generate the image...")
+            path, id = s3_key.split('/', 1)[1].split('/', 1)
+            image_data = wait_for_image(token, path, id)
+            if not image_data:
+                print("Failed to retrieve the image. Trying again...")
+                continue
 
+        if manifest is not None:
+            manifest.decode(s3_key)
         image_filename = get_timestamped_filename("initial_face", "jpg")
-        save_and_show_image(image_data, image_filename, output_folder)
+        image_path = save_and_show_image(image_data, image_filename, output_folder, s3_key)
+        if not image_path:
+            print("The image arrived incomplete. Trying again...")
+            continue
+        if manifest is not None:
+            manifest.image(s3_key, image_path)
 
         # Get and save predictions for the initial face
-        predictions = get_predictions(token, s3_key)
+        if predictions is None:
+            predictions = wait_for_predictions(token, s3_key)
         if predictions:
             predictions_filename = image_filename.replace(".jpg", "_predictions.json")
-            save_predictions(predictions, predictions_filename, output_folder)
+            predictions_path = save_predictions(predictions, predictions_filename, output_folder)
+            if manifest is not None:
+                manifest.predictions(s3_key, predictions, predictions_path)
         else:
             print("Failed to get predictions for the initial face")
 
@@ -220,11 +193,11 @@ def generate_and_approve_face(token, output_folder):
 def main():
     print(f"Python version: {sys.version}")
     print(f"Requests version: {requests.__version__}")
+    setup()
 
-    username = input("Enter your email: ")
-    password = input("Enter your password: ")
-
-    token = login(username, password)
+    # Reuses the token cached on disk by earlier runs and only prompts for
+    # credentials when a new login is needed
+    token = token_manager.get_token()
     if not token:
         return
 
@@ -234,61 +207,98 @@ def main():
 
     output_folder = create_timestamped_folder()
     print(f"Output will be saved in: {output_folder}")
-
-    while True:
-        # Generate and approve initial random face
-        s3_key = generate_and_approve_face(token, output_folder)
-        if not s3_key:
-            return
-
+    # Every decode, saved file and transformation of this run goes into one manifest.jsonl
+    manifest = RunManifest(output_folder)
+
+    screen = None
+    while screen is None:
+        rule = input("Only show faces whose predictions match (e.g. gender > 0.5 and |age| < 1; blank for all): ")
+        if not rule.strip():
+            break
+        try:
+            screen = ScreeningRule(rule)
+        except ValueError as e:
+            print(e)
+
+    # Keep the next few candidates downloading in the background while the user reviews;
+    # faces the screening rule rejects are dropped before their images are downloaded
+    prefetcher = CandidatePrefetcher(client, buffer_size=PREFETCH_BUFFER, screen=screen).start()
+    curve = None
+    try:
         while True:
-            attribute = input("Enter the characteristic to transform (or 'quit' to exit): ")
-            if attribute.lower() == 'quit':
+            # Generate and approve initial random face
+            s3_key = generate_and_approve_face(token, output_folder, prefetcher, manifest)
+            if not s3_key:
                 return
 
-            beta = input("Enter the beta value for the transformation: ")
-            try:
-                beta = float(beta)
-            except ValueError:
-                print("Invalid beta value. Please enter a number.")
-                continue
-
-            transformation = request_transformation(token, s3_key, attribute, beta)
-            if transformation:
-                print(f"Transformation result: {json.dumps(transformation, indent=2)}")
-
-                wait_with_message(5, "Waiting for the server to generate transformed image...")
-
-                # Get transformed image
-                image_path = transformation["images"][0]
-                path, id = image_path.split('/', 1)[1].split('/', 1)
-                image_data = get_image(token, path, id)
-                if image_data:
-                    image_filename = get_timestamped_filename(f"transformed_face_{attribute}", "jpg")
-                    save_and_show_image(image_data, image_filename, output_folder)
-                    
-                    info_filename = image_filename.replace(".jpg", "_info.txt")
-                    save_characteristic_info(attribute, beta, info_filename, output_folder, image_path, image_filename)
-                else:
-                    print("Failed to retrieve transformed image")
-
-            else:
-                print("Transformation failed. Please try again.")
-
             while True:
-                choice = input("Would you like to: (1) Perform another transformation, (2) Generate a new random face, or (3) Quit? ").strip()
-                if choice == '1':
-                    break  # Continue with the current face
-                elif choice == '2':
-                    break  # Generate a new face
-                elif choice == '3':
-                    print("Thank you for using the Interactive Face Transformer!")
+                attribute = input("Enter the characteristic to transform (or 'quit' to exit): ")
+                if attribute.lower() == 'quit':
                     return
-                else:
-                    print("Invalid choice. Please enter 1, 2, or 3.")
 
-            if choice == '2':
-                break  # Break the inner loop to generate a new face
+                beta_input = input("Enter the beta value(s) for the transformation, separated by commas, "
+                                   "or =<value> to search for the beta giving that prediction: ")
+                if beta_input.strip().startswith('='):
+                    try:
+                        target = float(beta_input.strip()[1:])
+                    except ValueError:
+                        print("Invalid target value. Please enter a number after '='.")
+                        continue
+                    if curve is None:
+                        # Learned once per session from every catalogued transformation
+                        curve = ResponseCurve.from_catalog(duplicates.catalog)
+                    found = run_targets(token, s3_key, {attribute: target}, output_folder, curve=curve,
+                                        base_url=client.base_url, manifest=manifest,
+                                        image_cache=client.image_cache, predictions_cache=client.predictions_cache,
+                                        token_manager=token_manager, rate_limiter=client.rate_limiter)
+                    for result in found:
+                        print(f"{attribute} predicted at {result['prediction']:.2f} with beta {result['beta']:g} "
+                              f"after {result['calls']} transformation(s)")
+                        if result["image_path"]:
+                            display.show(result["image_path"])
+                    if not found:
+                        print("Target search failed. Please try again.")
+                else:
+                    try:
+                        betas = [float(beta) for beta in beta_input.split(',') if beta.strip()]
+                    except ValueError:
+                        print("Invalid beta value. Please enter numbers.")
+                        continue
+                    if not betas:
+                        print("Please enter at least one beta value.")
+                        continue
+
+                    # All betas go out in one transformation request and download concurrently
+                    results = run_sweep(token, s3_key, attribute, betas, output_folder, base_url=client.base_url,
+                                        image_cache=client.image_cache, predictions_cache=client.predictions_cache,
+                                        token_manager=token_manager, rate_limiter=client.rate_limiter,
+                                        manifest=manifest)
+                    if results:
+                        sheet_path = save_sweep_sheet(results, output_folder)
+                        if sheet_path:
+                            display.show(sheet_path)
+                    else:
+                        print("Transformation failed. Please try again.")
+
+                while True:
+                    choice = input("Would you like to: (1) Perform another transformation, (2) Generate a new random face, or (3) Quit? ").strip()
+                    if choice == '1':
+                        break  # Continue with the current face
+                    elif choice == '2':
+                        break  # Generate a new face
+                    elif choice == '3':
+                        print("Thank you for using the Interactive Face Transformer!")
+                        return
+                    else:
+                        print("Invalid choice. Please enter 1, 2, or 3.")
+
+                if choice == '2':
+                    break  # Break the inner loop to generate a new face
+    finally:
+        prefetcher.stop()
+        manifest.close()
+        # Keep the last image on screen until the user closes the viewer
+        display.wait()
 
     print("Transformation process completed. Thank you for using the Interactive Face Transformer!")
 
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import secrets
+from datetime import datetime
+
+
+# Callables run as hook(path, image_data, image_key) after every saved image, e.g. DuplicateDetector.check;
+# image_data is None when the image was streamed to disk and never held in memory, image_key is the
+# S3 key (or 'path/id') the image was fetched by, or None if unknown
+save_hooks = []
+
+JPEG_START = b"\xff\xd8"
+JPEG_END = b"\xff\xd9"
+
+# Bytes read or written at a time when streaming images
+CHUNK_SIZE = 64 * 1024
+
+
+def create_timestamped_folder(base_dir="generations"):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    folder_name = f"{base_dir}_{timestamp}"
+    os.makedirs(folder_name, exist_ok=True)
+    return folder_name
+
+
+def get_timestamped_filename(base_name, extension):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{base_name}_{timestamp}.{extension}"
+
+
+class ImageWriter:
+    """
+    Writes an image to folder/filename (adding .jpg if missing) chunk by chunk.
+
+    Chunks go straight into a temp file next to the destination while their SHA-256 and
+    length are computed. commit() checks the JPEG start and end markers (and the expected
+    length, if known) and only then renames the file into place, so a crash or a cut-off
+    download never leaves a truncated image under the final name. Use it as a context
+    manager to discard the temp file unless commit() succeeded.
+    """
+
+    def __init__(self, filename, folder):
+        self.path = os.path.join(folder, filename)
+        if not self.path.lower().endswith('.jpg'):
+            self.path += '.jpg'
+        self.folder = folder
+        self.file = None
+        self.tmp_path = None
+        self.reset()
+
+    def reset(self):
+        """
+        Start over, e.g. when a download is retried after a broken connection.
+        """
+        self.abort()
+        # Not named *.jpg, so a catalog scan during the download skips it; created like
+        # open() would, so the final file gets the usual permissions
+        self.tmp_path = os.path.join(self.folder, f".{os.path.basename(self.path)}.{secrets.token_hex(4)}.part")
+        self.file = os.fdopen(os.open(self.tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), "wb")
+        self.hash = hashlib.sha256()
+        self.length = 0
+        # Set from Content-Length by a downloader that knows it
+        self.expected_length = None
+        self.head = b""
+        self.tail = b""
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.hash.update(chunk)
+        self.length += len(chunk)
+        if len(self.head) < 2:
+            self.head = (self.head + chunk)[:2]
+        self.tail = (self.tail + chunk)[-64:]
+
+    def write_file(self, path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                self.write(chunk)
+
+    def sha256(self):
+        return self.hash.hexdigest()
+
+    def commit(self):
+        """
+        Validate the image and move it into place; raises ValueError (and discards it) if it is incomplete.
+        """
+        try:
+            if self.expected_length is not None and self.length != self.expected_length:
+                raise ValueError(f"got {self.length} of {self.expected_length} bytes")
+            # Some encoders pad after the end marker
+            if self.head != JPEG_START or not self.tail.rstrip(b"\0\r\n ").endswith(JPEG_END):
+                raise ValueError(f"not a complete JPEG ({self.length} bytes)")
+            self.file.close()
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+        self.file = self.tmp_path = None
+        print(f"Image saved as '{self.path}'")
+        return self.path
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.tmp_path is not None:
+            try:
+                os.unlink(self.tmp_path)
+            except FileNotFoundError:
+                pass
+            self.tmp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.abort()
+
+
+def run_save_hooks(path, image_data=None, image_key=None):
+    for hook in save_hooks:
+        hook(path, image_data, image_key)
+
+
+def save_image(image_data, filename, folder, image_key=None):
+    """
+    Write image bytes to folder/filename (adding .jpg if missing) and return the full path.
+    The file appears atomically; raises ValueError if the bytes are not a complete JPEG.
+    image_key, the S3 key of the image, is passed on to the save hooks.
+    """
+    with ImageWriter(filename, folder) as writer:
+        writer.write(image_data)
+        full_path = writer.commit()
+    run_save_hooks(full_path, image_data, image_key)
+    return full_path
+
+
+def save_predictions(predictions, filename, folder):
+    full_path = os.path.join(folder, filename)
+    if not full_path.lower().endswith('.json'):
+        full_path += '.json'
+    with open(full_path, 'w') as f:
+        json.dump(predictions, f, indent=2)
+    print(f"Predictions saved to {full_path}")
+    return full_path
+
+
+def save_characteristic_info(attribute, beta, filename, folder, s3_key, photo_filename):
+    """
+    Save the characteristic (attribute), beta value, s3_key, and photo filename to a text file.
+    """
+    full_path = os.path.join(folder, filename)
+    with open(full_path, 'w') as f:
+        f.write(f"Characteristic: {attribute}\n")
+        f.write(f"Beta: {beta}\n")
+        f.write(f"S3 Key: {s3_key}\n")
+        f.write(f"Photo Filename: {photo_filename}")
+    print(f"Characteristic info saved to {full_path}")
+    return full_path
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import os
+import time
+
+from extempo_async import AsyncExtempoClient
+from extempo_client import BASE_URL
+from manifest import RunManifest
+from storage import get_timestamped_filename, save_predictions
+
+
+def format_beta(beta):
+    return f"{float(beta):g}"
+
+
+def key_digest(s3_key):
+    """
+    Short digest of an S3 key; it keeps file names unique when several faces are saved within one second.
+    """
+    return hashlib.sha1(s3_key.encode()).hexdigest()[:8]
+
+
+async def _transform_attribute(client, s3_key, attribute, betas, control_attributes, manifest):
+    """
+    Request every beta for one attribute in a single call and pair the returned keys with their betas.
+    """
+    transformation = await client.request_transformation(s3_key, attribute, [float(b) for b in betas], control_attributes)
+    if not transformation:
+        print(f"Transformation request failed for {attribute}")
+        return []
+    images = transformation.get("images", [])
+    manifest.transformation(s3_key, attribute, betas, control_attributes, images)
+    if len(images) != len(betas):
+        print(f"Expected {len(betas)} images for {attribute}, got {len(images)}")
+    return [(attribute, beta, image_key) for beta, image_key in zip(betas, images)]
+
+
+async def _fetch_and_save(client, attribute, beta, image_key, output_folder, with_predictions, manifest):
+    base_name = f"transformed_face_{attribute}_beta_{format_beta(beta)}_{key_digest(image_key)}"
+    image_filename = get_timestamped_filename(base_name, "jpg")
+    # The image is streamed straight to disk, so memory stays flat however many are in flight
+    fetches = [client.wait_for_download(image_key, image_filename, output_folder)]
+    if with_predictions:
+        fetches.append(client.wait_for_predictions(image_key))
+    results = await asyncio.gather(*fetches)
+    result = {"attribute": attribute, "beta": beta, "s3_key": image_key, "image_path": results[0],
+              "predictions": None}
+    if not result["image_path"]:
+        print(f"Failed to retrieve transformed image for {attribute} beta {format_beta(beta)}")
+        return result
+    manifest.image(image_key, result["image_path"], attribute, beta)
+    if with_predictions and results[1]:
+        result["predictions"] = results[1]
+        await _save_image_predictions(results[1], image_key, image_filename, output_folder, manifest)
+    return result
+
+
+async def _save_image_predictions(predictions, image_key, image_filename, output_folder, manifest):
+    predictions_filename = image_filename.replace(".jpg", "_predictions.json")
+    predictions_path = await asyncio.to_thread(save_predictions, predictions, predictions_filename, output_folder)
+    manifest.predictions(image_key, predictions, predictions_path)
+
+
+async def _fetch_predictions(client, image_key, image_filename, output_folder, manifest):
+    """
+    Fetch and save the predictions of an image saved earlier without them, e.g. by a run that was interrupted.
+    """
+    predictions = await client.wait_for_predictions(image_key)
+    if predictions:
+        await _save_image_predictions(predictions, image_key, image_filename, output_folder, manifest)
+    return predictions
+
+
+async def run_sweep_async(client, s3_key, attributes, betas, output_folder, control_attributes=None,
+                          with_predictions=False, manifest=None):
+    """
+    Transform one face across every attribute x beta combination.
+
+    One request_transformation call is made per attribute (carrying all betas), all
+    attributes are requested concurrently, and every resulting image is polled,
+    downloaded and written to disk as soon as it is ready.
+
+    :param client: An open AsyncExtempoClient
+    :param s3_key: S3 key of the face to transform
+    :param attributes: Attribute name or list of attribute names
+    :param betas: List of betas applied to every attribute
+    :param output_folder: Folder the images are written to
+    :param control_attributes: Optional list of attributes held constant
+    :param with_predictions: Also fetch and save predictions for every result
+    :param manifest: RunManifest the transformations and images are recorded in; by default
+        the output folder's manifest is opened for the duration of the sweep
+    :return: List of result dicts in completion order
+    """
+    if isinstance(attributes, str):
+        attributes = [attributes]
+    own_manifest = manifest is None
+    if own_manifest:
+        os.makedirs(output_folder, exist_ok=True)
+        manifest = RunManifest(output_folder)
+    start = time.monotonic()
+    try:
+        requested = await asyncio.gather(*(
+            _transform_attribute(client, s3_key, attribute, betas, control_attributes, manifest)
+            for attribute in attributes
+        ))
+        tasks = [
+            asyncio.ensure_future(_fetch_and_save(client, attribute, beta, image_key, output_folder, with_predictions,
+                                                  manifest))
+            for items in requested for attribute, beta, image_key in items
+        ]
+        results = []
+        for finished in asyncio.as_completed(tasks):
+            results.append(await finished)
+    finally:
+        if own_manifest:
+            manifest.close()
+        else:
+            manifest.flush()
+    saved = sum(1 for result in results if result["image_path"])
+    print(f"Sweep finished: {saved}/{len(tasks)} images saved in {time.monotonic() - start:.1f}s")
+    return results
+
+
+def run_sweep(token, s3_key, attributes, betas, output_folder, control_attributes=None, with_predictions=False,
+              base_url=BASE_URL, manifest=None, **client_options):
+    """
+    Blocking wrapper around run_sweep_async for synchronous scripts. Extra keyword
+    arguments (max_concurrency, image_cache, ...) are passed to AsyncExtempoClient.
+    """
+    async def run():
+        async with AsyncExtempoClient(base_url, token=token, **client_options) as client:
+            return await run_sweep_async(client, s3_key, attributes, betas, output_folder, control_attributes,
+                                         with_predictions, manifest)
+
+    return asyncio.run(run())
@@ -0,0 +1,303 @@
+"""
+Search for the beta that moves a face to a target prediction.
+
+Instead of guessing betas by hand, give the value a trait should be predicted at:
+
+    python target.py <s3 key> attractive=1.5 age=-1 --tolerance 0.1
+
+The first beta comes from a response curve learned from every catalogued transformation
+(how far one unit of beta moved the trait's prediction, per attribute and direction).
+After each transformation the next beta is a secant step through the two observations
+closest to the target, or a false-position step once the target is bracketed, so most
+targets are reached in two or three request_transformation calls. Only the closest
+result is downloaded and saved. Every probe and its predictions are recorded in the run
+manifest: they feed the curve for the rest of the session, and the catalog indexes them
+for the curves of later sessions.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+
+from auth import TokenManager
+from catalog import DEFAULT_CATALOG_PATH, Catalog
+from extempo_async import AsyncExtempoClient
+from extempo_client import BASE_URL, ExtempoClient
+from manifest import RunManifest
+from storage import create_timestamped_folder
+from sweep import _fetch_and_save
+
+
+# Prediction units moved per unit of beta, assumed until a transformation has been seen
+DEFAULT_SLOPE = 0.5
+
+DEFAULT_TOLERANCE = 0.1
+
+# request_transformation calls per search before settling for the closest result
+DEFAULT_MAX_CALLS = 5
+
+DEFAULT_MAX_BETA = 5.0
+
+# Betas closer than this give too noisy a secant; the response curve is used instead
+MIN_SECANT_SPAN = 0.5
+
+
+def trait_score(predictions, trait):
+    """
+    Return one trait's score from a predictions response or a bare {trait: score} dict.
+    """
+    if not isinstance(predictions, dict):
+        return None
+    scores = predictions.get("predictions", predictions)
+    score = scores.get(trait) if isinstance(scores, dict) else None
+    return float(score) if score is not None else None
+
+
+class ResponseCurve:
+    """
+    Per-attribute estimate of how much one unit of beta moves the attribute's prediction.
+
+    Positive and negative betas are kept apart since transformations are often not
+    symmetric; the median of the observed prediction change per unit of beta keeps a few
+    odd results (e.g. chained transformations measured against the original face) from
+    skewing the estimate.
+
+    :param default_slope: Slope used for an attribute nothing is known about
+    """
+
+    def __init__(self, default_slope=DEFAULT_SLOPE):
+        self.default_slope = default_slope
+        self.ratios = {}
+
+    @classmethod
+    def from_catalog(cls, catalog, scan=True, **kwargs):
+        """
+        Learn a curve from every catalogued transformation, scanning for new runs first unless scan is False.
+        """
+        if scan:
+            catalog.scan()
+        curve = cls(**kwargs)
+        for attribute, beta, face_predictions, predictions in catalog.transformation_pairs():
+            before, after = trait_score(face_predictions, attribute), trait_score(predictions, attribute)
+            if before is not None and after is not None:
+                curve.observe(attribute, beta, after - before)
+        return curve
+
+    def observe(self, attribute, beta, delta):
+        if beta:
+            self.ratios.setdefault((attribute, beta > 0), []).append(delta / beta)
+
+    def slope(self, attribute, positive=True):
+        ratios = self.ratios.get((attribute, positive)) or self.ratios.get((attribute, not positive))
+        slope = statistics.median(ratios) if ratios else self.default_slope
+        # A curve that does not move the trait would send the search to max_beta
+        return slope if abs(slope) > 1e-3 else self.default_slope
+
+    def estimate(self, attribute, current, target):
+        """
+        Beta expected to move a prediction from current to target.
+        """
+        return (target - current) / self.slope(attribute, target > current)
+
+    def __len__(self):
+        return sum(len(ratios) for ratios in self.ratios.values())
+
+
+def next_beta(points, target, curve, attribute, max_beta=DEFAULT_MAX_BETA):
+    """
+    Choose the next beta to try from the (beta, prediction) points seen so far.
+
+    :return: The beta, rounded to 0.01 and clamped to max_beta; it may repeat a beta already tried
+    """
+    below = [point for point in points if point[1] < target]
+    above = [point for point in points if point[1] > target]
+    if below and above:
+        # Bracketed: false position between the closest observations on either side
+        (b1, v1), (b2, v2) = max(below, key=lambda p: p[1]), min(above, key=lambda p: p[1])
+        beta = b1 + (target - v1) * (b2 - b1) / (v2 - v1)
+    else:
+        closest = sorted(points, key=lambda p: abs(p[1] - target))
+        b1, v1 = closest[0]
+        b2, v2 = closest[1] if len(closest) > 1 else (b1, v1)
+        # Secant through the two closest points, unless they are too near for prediction noise to average out
+        if abs(b1 - b2) >= MIN_SECANT_SPAN and v1 != v2:
+            beta = b1 + (target - v1) * (b1 - b2) / (v1 - v2)
+        else:
+            beta = b1 + curve.estimate(attribute, v1, target)
+    return round(max(-max_beta, min(max_beta, beta)), 2)
+
+
+async def search_beta(client, s3_key, attribute, target, tolerance=DEFAULT_TOLERANCE, curve=None,
+                      max_calls=DEFAULT_MAX_CALLS, max_beta=DEFAULT_MAX_BETA, probes=1, control_attributes=None,
+                      manifest=None):
+    """
+    Find the beta whose transformation of s3_key is predicted within tolerance of target for attribute.
+
+    :param client: An open AsyncExtempoClient
+    :param curve: ResponseCurve giving the first guess; updated with every observation
+    :param probes: Betas requested in the first call, spread around the first guess; more
+        probes make a bracket after one round trip more likely
+    :param manifest: Optional RunManifest the transformations and predictions are recorded in
+    :return: Dict with the closest beta, its s3_key and prediction, whether it is within
+        tolerance, the number of calls made and every (beta, prediction) observed; None if
+        the face has no prediction for attribute
+    """
+    curve = curve if curve is not None else ResponseCurve()
+    face_predictions = await client.wait_for_predictions(s3_key)
+    start = trait_score(face_predictions, attribute)
+    if start is None:
+        print(f"No {attribute} prediction for {s3_key}")
+        return None
+    if manifest is not None:
+        # Lets the catalog pair this face with its transformations for later curves
+        manifest.predictions(s3_key, face_predictions)
+    points = [(0.0, start)]
+    keys = {0.0: s3_key}
+    calls = 0
+
+    def closest():
+        return min(points, key=lambda p: abs(p[1] - target))
+
+    while abs(closest()[1] - target) > tolerance and calls < max_calls:
+        beta = next_beta(points, target, curve, attribute, max_beta)
+        if any(abs(beta - b) < 0.01 for b, v in points):
+            if abs(beta) >= max_beta:
+                print(f"{attribute}={target:g} looks out of reach of {s3_key} within beta ±{max_beta:g}")
+            else:
+                # Closer than the beta precision allows; another call would only repeat one
+                print(f"{attribute}={target:g}: next beta {beta:g} was already tried, keeping the closest result")
+            break
+        betas = [beta]
+        if calls == 0 and probes > 1:
+            spread = max(0.25, 0.2 * abs(beta))
+            offsets = [spread * (i - (probes - 1) / 2) for i in range(probes)]
+            betas = sorted({round(max(-max_beta, min(max_beta, beta + offset)), 2) for offset in offsets} - {0.0})
+        transformation = await client.request_transformation(s3_key, attribute, betas, control_attributes)
+        calls += 1
+        images = (transformation or {}).get("images", [])
+        if len(images) != len(betas):
+            print(f"Transformation {attribute} {betas} of {s3_key} failed")
+            break
+        if manifest is not None:
+            manifest.transformation(s3_key, attribute, betas, control_attributes, images)
+        results = await asyncio.gather(*(client.wait_for_predictions(image_key) for image_key in images))
+        for beta, image_key, predictions in zip(betas, images, results):
+            score = trait_score(predictions, attribute)
+            if score is None:
+                continue
+            if manifest is not None:
+                manifest.predictions(image_key, predictions)
+            points.append((beta, score))
+            keys[beta] = image_key
+            curve.observe(attribute, beta, score - start)
+        print(f"{attribute}: " + ", ".join(f"beta {b:g} -> {v:.2f}" for b, v in points[-len(betas):]) +
+              f" (target {target:g})")
+
+    beta, prediction = closest()
+    return {"attribute": attribute, "target": target, "beta": beta, "s3_key": keys[beta], "prediction": prediction,
+            "reached": abs(prediction - target) <= tolerance, "calls": calls, "points": points}
+
+
+async def run_targets_async(client, s3_key, targets, output_folder, tolerance=DEFAULT_TOLERANCE, curve=None,
+                            manifest=None, **search_options):
+    """
+    Search every {attribute: target} concurrently and save the closest image of each.
+
+    :return: List of search results, each with the saved image under 'image_path'
+    """
+    curve = curve if curve is not None else ResponseCurve()
+    own_manifest = manifest is None
+    if own_manifest:
+        os.makedirs(output_folder, exist_ok=True)
+        manifest = RunManifest(output_folder)
+
+    async def one(attribute, target):
+        found = await search_beta(client, s3_key, attribute, target, tolerance, curve, manifest=manifest,
+                                  **search_options)
+        if found is None:
+            return None
+        found["image_path"] = None
+        if found["beta"] != 0:
+            saved = await _fetch_and_save(client, attribute, found["beta"], found["s3_key"], output_folder, False,
+                                          manifest)
+            found["image_path"] = saved["image_path"]
+        manifest.record("target", s3_key=found["s3_key"], face=s3_key, attribute=attribute, target=target,
+                        beta=found["beta"], prediction=found["prediction"], reached=found["reached"],
+                        calls=found["calls"])
+        return found
+
+    try:
+        results = await asyncio.gather(*(one(attribute, target) for attribute, target in targets.items()))
+    finally:
+        if own_manifest:
+            manifest.close()
+        else:
+            manifest.flush()
+    return [result for result in results if result is not None]
+
+
+def run_targets(token, s3_key, targets, output_folder, tolerance=DEFAULT_TOLERANCE, curve=None, base_url=BASE_URL,
+                manifest=None, search_options=None, **client_options):
+    """
+    Blocking wrapper around run_targets_async. Extra keyword arguments are passed to AsyncExtempoClient.
+    """
+    async def run():
+        async with AsyncExtempoClient(base_url, token=token, **client_options) as client:
+            return await run_targets_async(client, s3_key, targets, output_folder, tolerance, curve, manifest,
+                                           **(search_options or {}))
+
+    return asyncio.run(run())
+
+
+def parse_target(text):
+    """
+    Parse 'trait=value' into (trait, value).
+    """
+    trait, sep, value = text.partition('=')
+    try:
+        if not (sep and trait.strip()):
+            raise ValueError
+        return trait.strip(), float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected trait=value, got {text!r}")
+
+
+def print_results(results):
+    for result in results:
+        status = "reached" if result["reached"] else "closest"
+        print(f"{result['attribute']}={result['target']:g}: {status} {result['prediction']:.2f} at beta "
+              f"{result['beta']:g} after {result['calls']} calls -> {result['image_path'] or result['s3_key']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the betas that move a face to target predictions")
+    parser.add_argument("s3_key")
+    parser.add_argument("targets", nargs="+", type=parse_target, metavar="TRAIT=VALUE")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--max-calls", type=int, default=DEFAULT_MAX_CALLS)
+    parser.add_argument("--probes", type=int, default=1, help="betas requested in the first call")
+    parser.add_argument("--control", nargs="+", help="attributes held constant")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH, help="catalog the response curve is learned from")
+    parser.add_argument("--output", help="output folder (default: a new generations_* folder)")
+    parser.add_argument("--base-url", default=BASE_URL)
+    args = parser.parse_args()
+
+    with Catalog(args.catalog) as catalog:
+        curve = ResponseCurve.from_catalog(catalog)
+    print(f"Response curve learned from {len(curve)} transformations")
+    client = ExtempoClient(args.base_url)
+    token_manager = TokenManager(client)
+    token = token_manager.get_token()
+    if not token:
+        return
+    output_folder = args.output or create_timestamped_folder()
+    results = run_targets(token, args.s3_key, dict(args.targets), output_folder, args.tolerance, curve, args.base_url,
+                          search_options={"max_calls": args.max_calls, "probes": args.probes,
+                                          "control_attributes": args.control},
+                          token_manager=token_manager)
+    print_results(results)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Emulator settings that keep tests fast: no latency and images ready after a short wait
+FAST_EMULATOR = {"latency_ms": 0, "ready_after": 0.2, "ready_jitter": 0}
+
+
+@pytest.fixture
+def emulator():
+    """
+    Start local gateway emulators for a test: call it with config overrides to get a base URL.
+    """
+    from generator_api import start_in_background
+
+    servers = []
+
+    def start(**config):
+        base_url, server = start_in_background(**dict(FAST_EMULATOR, **config))
+        servers.append(server)
+        return base_url
+
+    yield start
+    for server in servers:
+        server.should_exit = True
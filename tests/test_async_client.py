@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+
+from extempo_async import AsyncExtempoClient
+from storage import JPEG_END, JPEG_START, ImageWriter
+
+
+def with_client(base_url, fn, **options):
+    async def run():
+        async with AsyncExtempoClient(base_url, **options) as client:
+            await client.login("user", "password")
+            return await fn(client)
+
+    return asyncio.run(run())
+
+
+def test_streamed_downloads_write_off_the_event_loop(emulator, tmp_path, monkeypatch):
+    write_threads = []
+    write = ImageWriter.write
+
+    def recording_write(self, chunk):
+        write_threads.append(threading.get_ident())
+        write(self, chunk)
+
+    monkeypatch.setattr(ImageWriter, "write", recording_write)
+
+    async def download(client):
+        s3_key = (await client.decode_random_face())["s3_key"]
+        return threading.get_ident(), await client.wait_for_download(s3_key, "face.jpg", str(tmp_path))
+
+    loop_thread, path = with_client(emulator(image_size=512), download)
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data.startswith(JPEG_START) and data.endswith(JPEG_END)
+    assert write_threads and loop_thread not in write_threads
+
+
+def test_generate_faces_fetches_images_and_predictions(emulator):
+    faces = with_client(emulator(), lambda client: client.generate_faces(5))
+
+    assert len(faces) == 5
+    assert len({face["s3_key"] for face in faces}) == 5
+    for face in faces:
+        assert face["image"].startswith(JPEG_START)
+        assert face["predictions"]
+
+
+def test_fan_out_is_bounded_by_max_concurrency(emulator):
+    def peak_in_flight(max_concurrency):
+        intervals = []
+
+        def observer(method, endpoint, status, seconds, nbytes):
+            end = time.perf_counter()
+            intervals.append((end - seconds, end))
+
+        faces = with_client(base_url, lambda client: client.decode_random_faces(12), max_concurrency=max_concurrency,
+                            observers=[observer])
+        assert len(faces) == 12
+        # Requests in flight at the moment each one started
+        return max(sum(1 for other in intervals if other[0] <= start < other[1]) for start, _ in intervals)
+
+    base_url = emulator(latency_ms=50)
+    assert peak_in_flight(3) == 3
+    assert peak_in_flight(16) > 3
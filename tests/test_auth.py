@@ -0,0 +1,96 @@
+import base64
+import json
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from auth import TokenManager, prompt_credentials, token_expiry
+from extempo_client import ExtempoClient
+
+
+def jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+class Credentials:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return "user", "password"
+
+
+def test_token_expiry_reads_the_jwt_exp_claim():
+    assert token_expiry(jwt(1700000000)) == 1700000000
+    assert token_expiry("0123456789abcdef") is None
+
+
+def test_credentials_come_from_env_then_config(tmp_path, monkeypatch):
+    config = tmp_path / "config.ini"
+    config.write_text("[extempo]\nusername = from-config\npassword = secret\n")
+    monkeypatch.setenv("EXTEMPO_USERNAME", "from-env")
+    monkeypatch.delenv("EXTEMPO_PASSWORD", raising=False)
+
+    assert prompt_credentials(str(config), interactive=False) == ("from-env", "secret")
+    with pytest.raises(RuntimeError, match="No Extempo credentials"):
+        prompt_credentials(str(tmp_path / "missing.ini"), interactive=False)
+
+
+def test_cached_token_is_reused_without_logging_in(emulator, tmp_path):
+    base_url = emulator()
+    path = str(tmp_path / "auth" / "token.json")
+    credentials = Credentials()
+    token = TokenManager(ExtempoClient(base_url), credentials, path).get_token()
+
+    assert token and credentials.calls == 1
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    client = ExtempoClient(base_url)
+    assert TokenManager(client, credentials, path).get_token() == token
+    assert credentials.calls == 1
+    assert client.get_user_info()
+
+
+def test_expired_jwt_in_the_token_file_is_replaced(emulator, tmp_path):
+    path = tmp_path / "token.json"
+    path.write_text(json.dumps({"token": jwt(time.time() + 10)}))
+    credentials = Credentials()
+
+    token = TokenManager(ExtempoClient(emulator()), credentials, str(path)).get_token()
+
+    assert credentials.calls == 1
+    assert json.loads(path.read_text())["token"] == token
+
+
+def test_rejected_token_is_refreshed_and_the_request_retried(emulator, tmp_path):
+    client = ExtempoClient(emulator(token_ttl=0.5))
+    credentials = Credentials()
+    manager = TokenManager(client, credentials, str(tmp_path / "token.json"))
+    old_token = manager.get_token()
+    time.sleep(0.6)
+
+    assert client.get_user_info()
+    assert credentials.calls == 2
+    assert client.token != old_token
+    # Callers still holding the old token string get the new one
+    assert manager.resolve(old_token) == client.token
+
+
+def test_concurrent_refreshes_log_in_once(emulator, tmp_path):
+    client = ExtempoClient(emulator())
+    credentials = Credentials()
+    manager = TokenManager(client, credentials, str(tmp_path / "token.json"))
+    old_token = manager.get_token()
+
+    threads = [threading.Thread(target=manager.refresh, args=(old_token,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert credentials.calls == 2
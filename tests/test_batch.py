@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+import json
+import os
+
+from batch import JobProgress, run_item
+from manifest import RunManifest, read_manifest
+
+
+class FakeClient:
+    """
+    Stands in for AsyncExtempoClient: every face has the predictions given for its key.
+    """
+
+    def __init__(self, predictions):
+        self.predictions = predictions
+        self.faces = itertools.count()
+        self.calls = {"decode": 0, "predictions": 0, "download": 0, "transformation": 0}
+
+    async def decode_random_face(self):
+        self.calls["decode"] += 1
+        return {"s3_key": f"1/generate/{next(self.faces)}~~generated.jpeg"}
+
+    async def wait_for_predictions(self, s3_key):
+        self.calls["predictions"] += 1
+        # Yield like a real request, so a runaway retry loop still hits the test's timeout
+        await asyncio.sleep(0)
+        return {"predictions": self.predictions.get(s3_key, {"age": 0.0})}
+
+    async def wait_for_download(self, s3_key, filename, folder):
+        self.calls["download"] += 1
+        path = os.path.join(folder, filename)
+        with open(path, "wb") as f:
+            f.write(b"\xff\xd8\xff\xd9")
+        return path
+
+    async def request_transformation(self, s3_key, attribute, betas, control_attributes=None):
+        self.calls["transformation"] += 1
+        return {"images": [f"{s3_key}/{attribute}/{beta}" for beta in betas]}
+
+
+def run(client, job, n=0):
+    os.makedirs(job["output"], exist_ok=True)
+    progress = JobProgress(job["output"])
+    manifest = RunManifest(job["output"], buffer_size=1)
+    try:
+        return asyncio.run(asyncio.wait_for(run_item(client, job, n, progress, manifest), timeout=10))
+    finally:
+        manifest.close()
+
+
+def job(tmp_path, **fields):
+    return dict({"id": "test", "output": str(tmp_path), "attributes": [], "betas": []}, **fields)
+
+
+def events(folder, event):
+    return [record for record in read_manifest(folder) if record.get("event") == event]
+
+
+def test_rejected_explicit_key_fails_once(tmp_path):
+    key = "1/generate/given~~generated.jpeg"
+    client = FakeClient({key: {"age": 2.0}})
+    rejected_job = job(tmp_path, s3_keys=[key], screen="age < 1")
+
+    assert run(client, rejected_job) is False
+    assert len(events(tmp_path, "rejected")) == 1
+    assert client.calls["predictions"] == 1
+    assert client.calls["download"] == 0
+
+
+def test_rejected_explicit_key_is_not_retried_on_resume(tmp_path):
+    key = "1/generate/given~~generated.jpeg"
+    client = FakeClient({key: {"age": 2.0}})
+    rejected_job = job(tmp_path, s3_keys=[key], filters={"age": [None, 1]})
+    run(client, rejected_job)
+
+    resumed = FakeClient({key: {"age": 2.0}})
+    assert run(resumed, rejected_job) is False
+    assert resumed.calls == {"decode": 0, "predictions": 0, "download": 0, "transformation": 0}
+    assert len(events(tmp_path, "rejected")) == 1
+
+
+def test_random_faces_stop_after_max_attempts(tmp_path):
+    client = FakeClient({})
+    hopeless_job = job(tmp_path, count=1, screen="age > 1", max_attempts=3)
+
+    assert run(client, hopeless_job) is False
+    assert client.calls["decode"] == 3
+    assert len(events(tmp_path, "rejected")) == 3
+
+    # The attempts already made count towards the limit after a restart
+    resumed = FakeClient({})
+    assert run(resumed, hopeless_job) is False
+    assert resumed.calls["decode"] == 0
+
+
+def test_accepted_face_resumes_after_last_step(tmp_path):
+    client = FakeClient({})
+    sweep_job = job(tmp_path, count=1, screen="age < 1", attributes=["age"], betas=[1, 2])
+
+    assert run(client, sweep_job) is True
+    assert client.calls == {"decode": 1, "predictions": 1, "download": 3, "transformation": 1}
+
+    resumed = FakeClient({})
+    assert JobProgress(str(tmp_path)).item(0).done
+    assert run(resumed, sweep_job) is True
+    assert resumed.calls["decode"] == 0 and resumed.calls["transformation"] == 0
+
+
+def test_items_transformed_together_keep_their_own_images(tmp_path):
+    client = FakeClient({})
+    sweep_job = job(tmp_path, count=2, attributes=["age"], betas=[1])
+
+    async def both():
+        progress = JobProgress(str(tmp_path))
+        manifest = RunManifest(str(tmp_path), buffer_size=1)
+        try:
+            return await asyncio.gather(*(run_item(client, sweep_job, n, progress, manifest) for n in range(2)))
+        finally:
+            manifest.close()
+
+    assert asyncio.run(both()) == [True, True]
+    transformed = [name for name in os.listdir(tmp_path) if name.startswith("transformed_face_")]
+    assert len(transformed) == 2
+
+
+def test_rejected_faces_keep_their_own_predictions_files(tmp_path):
+    client = FakeClient({f"1/generate/{i}~~generated.jpeg": {"age": float(i)} for i in range(3)})
+    hopeless_job = job(tmp_path, count=1, screen="age > 5", max_attempts=3)
+    run(client, hopeless_job)
+
+    records = events(tmp_path, "predictions")
+    assert len({record["path"] for record in records}) == 3
+    for record in records:
+        with open(tmp_path / record["path"]) as f:
+            assert json.load(f)["predictions"] == record["predictions"]
+
+
+def test_resume_fetches_predictions_missing_for_saved_images(tmp_path):
+    class NoTransformedPredictions(FakeClient):
+        async def wait_for_predictions(self, s3_key):
+            if "/age/" in s3_key:
+                return None
+            return await super().wait_for_predictions(s3_key)
+
+    sweep_job = job(tmp_path, count=1, attributes=["age"], betas=[1, 2], with_predictions=True)
+    assert run(NoTransformedPredictions({}), sweep_job) is False
+    assert len(events(tmp_path, "image")) == 3
+
+    resumed = FakeClient({})
+    assert run(resumed, sweep_job) is True
+    assert resumed.calls["download"] == 0 and resumed.calls["transformation"] == 0
+    predicted = {record["s3_key"]: record["path"] for record in events(tmp_path, "predictions")}
+    for image in events(tmp_path, "image")[1:]:
+        assert predicted[image["s3_key"]] == image["path"].replace(".jpg", "_predictions.json")
+        assert (tmp_path / predicted[image["s3_key"]]).exists()
@@ -0,0 +1,58 @@
+import glob
+import os
+
+import pytest
+
+from bench_pipeline import Recorder, bench_single_faces, bench_sweep, compare, percentile
+from extempo_client import ExtempoClient
+
+
+@pytest.fixture
+def client(emulator):
+    client = ExtempoClient(emulator())
+    client.login("bench@example.com", "bench")
+    return client
+
+
+def test_percentile_interpolates():
+    assert percentile([], 95) == 0.0
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([0, 10], 95) == pytest.approx(9.5)
+
+
+def test_sweep_writes_one_info_file_per_image(client, tmp_path):
+    recorder = Recorder()
+    client.observers.append(recorder)
+
+    result = bench_sweep(client, recorder, str(tmp_path), [-1, 0, 1])
+
+    assert result["images"] == 3
+    info_files = glob.glob(str(tmp_path / "*_info.txt"))
+    assert len(info_files) == 3
+    for path in info_files:
+        photo = path[:-len("_info.txt")] + ".jpg"
+        assert os.path.exists(photo)
+        with open(path) as f:
+            assert f"Photo Filename: {os.path.basename(photo)}" in f.read()
+    assert recorder.stages["sweep.info"] and recorder.endpoints
+
+
+def test_single_faces_are_saved_and_timed(client, tmp_path):
+    recorder = Recorder()
+    client.observers.append(recorder)
+
+    result = bench_single_faces(client, recorder, str(tmp_path), 2)
+
+    assert result["faces"] == 2
+    assert sorted(os.listdir(tmp_path)) == ["face_0.jpg", "face_0_predictions.json",
+                                            "face_1.jpg", "face_1_predictions.json"]
+    assert len(recorder.stages["face.total"]) == 2
+
+
+def test_compare_flags_only_real_regressions():
+    baseline = {"scenarios": {"single": {"faces_per_second": 10.0}},
+                "stages": {"face.image": {"p95": 1.0}, "face.save": {"p95": 0.001}}}
+    report = {"scenarios": {"single": {"faces": 5, "faces_per_second": 7.0}},
+              "stages": {"face.image": {"p95": 1.2}, "face.save": {"p95": 0.002}}}
+
+    assert compare(report, baseline, 0.25) == ["single faces_per_second: 7.00 vs baseline 10.00"]
@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+
+from catalog import Catalog, face_key, parse_info, parse_timestamp
+from manifest import RunManifest
+
+FACE = "61/generate/abc~~generated.jpeg"
+TRANSFORMED = "61/transform/abc~~generated.jpeg~~10001~~0"
+JPEG = b"\xff\xd8\xff\xd9"
+
+
+@pytest.fixture
+def run_folder(tmp_path):
+    """
+    A generations_* folder with a face and its predictions, a legacy transform with an
+    info file, and a manifest recording another transform.
+    """
+    folder = tmp_path / "generations_20241021_102456"
+    folder.mkdir()
+    (folder / "initial_face_20241021_102500.jpg").write_bytes(JPEG)
+    (folder / "initial_face_20241021_102500_predictions.json").write_text(
+        json.dumps({"s3_key": FACE, "predictions": {"age": 0.5}}))
+    (folder / "transformed_face_age_20241021_102600.jpg").write_bytes(JPEG)
+    (folder / "transformed_face_age_20241021_102600_info.txt").write_text(
+        f"Characteristic: age\nBeta: 5\nS3 Key: {TRANSFORMED}\n"
+        "Photo Filename: transformed_face_age_20241021_102600.jpg")
+    (folder / "face_gender.jpg").write_bytes(JPEG)
+    with RunManifest(str(folder)) as manifest:
+        manifest.transformation(FACE, "gender", [1.0, 2.0], None, [f"{FACE}-g1", f"{FACE}-g2"])
+        manifest.image(f"{FACE}-g1", str(folder / "face_gender.jpg"), "gender", 1.0)
+    return folder
+
+
+def test_key_and_name_parsing():
+    assert face_key(TRANSFORMED) == FACE
+    assert face_key(FACE) == FACE
+    assert face_key(None) is None
+    assert parse_timestamp("face_20241021_102456_x_20241022_000000.jpg") == "2024-10-22 00:00:00"
+    assert parse_timestamp("face.jpg") is None
+    assert parse_info("Characteristic: age\nBeta: oops") == {
+        "attribute": "age", "beta": None, "s3_key": None, "photo_filename": None}
+
+
+def test_scan_links_images_to_their_metadata(run_folder, tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.sqlite3"), root=str(tmp_path))
+
+    counts = catalog.scan()
+
+    assert counts["added"] == 6 and counts["errors"] == 0
+    face, = catalog.find(s3_key=FACE)
+    assert face["path"].endswith("initial_face_20241021_102500.jpg")
+    assert face["created"] == "2024-10-21 10:25:00"
+    aged, = catalog.find(attribute="age", beta_min=5)
+    assert aged["s3_key"] == TRANSFORMED and aged["face_key"] == FACE
+    gender, = catalog.find(attribute="gender")
+    assert gender["path"].endswith("face_gender.jpg") and gender["beta"] == 1.0
+    assert len(catalog.find(kind="transformation", attribute="gender")) == 2
+    assert catalog.attributes() == {"age": 1, "gender": 1}
+    predictions, = catalog.find(kind="predictions")
+    assert predictions["predictions"] == {"age": 0.5}
+
+
+def test_rescans_only_parse_changed_files(run_folder, tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.sqlite3"), root=str(tmp_path))
+    catalog.scan()
+
+    assert catalog.scan() == {"added": 0, "updated": 0, "removed": 0, "unchanged": 6, "errors": 0}
+
+    info = run_folder / "transformed_face_age_20241021_102600_info.txt"
+    info.write_text(info.read_text().replace("Beta: 5", "Beta: 6"))
+    os.utime(info, ns=(1, 1))
+    (run_folder / "face_gender.jpg").unlink()
+    counts = catalog.scan()
+
+    assert (counts["updated"], counts["removed"]) == (1, 1)
+    assert catalog.find(attribute="age")[0]["beta"] == 6
+    assert catalog.find(attribute="gender") == []
+
+
+def test_unreadable_files_are_counted_not_raised(run_folder, tmp_path):
+    (run_folder / "broken_predictions.json").write_text("{")
+    catalog = Catalog(str(tmp_path / "catalog.sqlite3"), root=str(tmp_path))
+
+    assert catalog.scan()["errors"] == 1
+    assert len(catalog.find(kind="image")) == 3
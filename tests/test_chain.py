@@ -0,0 +1,170 @@
+import asyncio
+import os
+
+import pytest
+
+from chain import Step, parse_plan, run_chain_async, validate_plan
+
+
+def by_id(steps):
+    return {step.id: step for step in steps}
+
+
+def test_compact_plan_chains_and_branches():
+    steps = by_id(parse_plan("attractive+2>age+1, gender-1.5"))
+
+    assert set(steps) == {"attractive+2", "attractive+2>age+1", "gender-1.5"}
+    older = steps["attractive+2>age+1"]
+    assert (older.attribute, older.beta, older.parent) == ("age", 1.0, "attractive+2")
+    assert steps["attractive+2"].parent is None
+    assert steps["gender-1.5"].beta == -1.5
+
+
+def test_compact_plan_shares_common_prefixes():
+    steps = parse_plan("happy+1>age+1, happy+1>age-1")
+
+    assert [step.id for step in steps] == ["happy+1", "happy+1>age+1", "happy+1>age-1"]
+
+
+def test_compact_plan_accepts_colon_betas_and_controls():
+    step, = parse_plan("well-groomed: -0.5", control_attributes=["age"])
+
+    assert (step.attribute, step.beta, step.control_attributes) == ("well-groomed", -0.5, ["age"])
+
+
+@pytest.mark.parametrize("plan", ["age", "age+", "age+1>", "+1", "age*2"])
+def test_compact_plan_rejects_malformed_steps(plan):
+    with pytest.raises(ValueError):
+        parse_plan(plan)
+
+
+def test_list_plan_uses_explicit_parents():
+    steps = by_id(parse_plan([{"id": "attr", "attribute": "attractive", "beta": 2},
+                              {"id": "older", "parent": "attr", "attribute": "age", "beta": 1},
+                              {"attribute": "gender", "beta": 1}]))
+
+    assert steps["older"].parent == "attr"
+    assert steps["step2"].parent is None
+
+
+def test_duplicate_ids_are_rejected():
+    with pytest.raises(ValueError, match="unique"):
+        validate_plan([Step("a", "age", 1), Step("a", "happy", 1)])
+
+
+def test_unknown_parent_is_rejected():
+    with pytest.raises(ValueError, match="unknown parent 'missing'"):
+        parse_plan([{"id": "a", "attribute": "age", "beta": 1, "parent": "missing"}])
+
+
+@pytest.mark.parametrize("steps", [
+    [Step("a", "age", 1, parent="a")],
+    [Step("a", "age", 1, parent="b"), Step("b", "happy", 1, parent="a")],
+    [Step("root", "age", 1), Step("a", "age", 1, parent="c"), Step("b", "age", 1, parent="a"),
+     Step("c", "age", 1, parent="b")],
+])
+def test_cycles_are_rejected(steps):
+    with pytest.raises(ValueError, match="cycle"):
+        validate_plan(steps)
+
+
+class FakeClient:
+    """
+    Records transformation requests and downloads; images of keys in slow take longer to arrive.
+    """
+
+    def __init__(self, slow=(), failing=()):
+        self.slow = set(slow)
+        self.failing = set(failing)
+        self.events = []
+        # Predictions are held back until this is set
+        self.predictions_ready = asyncio.Event()
+
+    async def wait_for_image_key(self, s3_key):
+        return True
+
+    async def request_transformation(self, s3_key, attribute, betas, control_attributes=None):
+        self.events.append(("transform", s3_key, attribute, tuple(betas)))
+        if attribute in self.failing:
+            return None
+        return {"images": [f"{s3_key}>{attribute}{beta:+g}" for beta in betas]}
+
+    async def wait_for_download(self, s3_key, filename, folder):
+        await asyncio.sleep(0.05 if s3_key.split(">")[-1] in self.slow else 0)
+        self.events.append(("download", s3_key))
+        path = os.path.join(folder, filename)
+        with open(path, "wb") as f:
+            f.write(b"\xff\xd8\xff\xd9")
+        return path
+
+    async def wait_for_predictions(self, s3_key):
+        await self.predictions_ready.wait()
+        self.events.append(("predictions", s3_key))
+        return {"predictions": {"age": 0.0}}
+
+
+def run(client, plan, folder, with_predictions=False):
+    return asyncio.run(run_chain_async(client, "face", parse_plan(plan), str(folder), with_predictions))
+
+
+def test_children_are_requested_after_their_parent_image(tmp_path):
+    client = FakeClient()
+    results = run(client, "attractive+2>age+1>happy-1, gender+1", tmp_path)
+
+    assert all(result["image_path"] for result in results.values())
+    downloaded = []
+    for event in client.events:
+        if event[0] == "download":
+            downloaded.append(event[1])
+        elif event[1] != "face":
+            assert event[1] in downloaded
+    assert results["attractive+2>age+1>happy-1"]["s3_key"] == "face>attractive+2>age+1>happy-1"
+
+
+def test_siblings_with_one_attribute_share_a_request(tmp_path):
+    client = FakeClient()
+    run(client, "age+1, age+2, age-1, happy+1", tmp_path)
+
+    requests = [event for event in client.events if event[0] == "transform"]
+    assert sorted(requests) == [("transform", "face", "age", (1.0, 2.0, -1.0)),
+                                ("transform", "face", "happy", (1.0,))]
+
+
+def test_branches_do_not_wait_for_each_other(tmp_path):
+    client = FakeClient(slow={"attractive+2"})
+    run(client, "attractive+2>age+1, gender+1>happy+1", tmp_path)
+
+    order = [event[1] for event in client.events if event[0] == "transform"]
+    # The fast branch reaches its second step while the slow root image is still downloading
+    assert order.index("face>gender+1") < order.index("face>attractive+2")
+
+
+def test_steps_below_a_failed_step_are_skipped(tmp_path):
+    client = FakeClient(failing={"age"})
+    results = run(client, "age+1>happy+1, gender+1", tmp_path)
+
+    assert set(results) == {"gender+1"}
+
+
+def test_children_do_not_wait_for_their_parent_predictions(tmp_path):
+    client = FakeClient()
+
+    async def release_predictions():
+        # Every step is downloaded before any predictions arrive
+        while sum(1 for event in client.events if event[0] == "download") < 2:
+            await asyncio.sleep(0.01)
+        client.predictions_ready.set()
+
+    async def main():
+        client.predictions_ready = asyncio.Event()
+        release = asyncio.create_task(release_predictions())
+        results = await asyncio.wait_for(
+            run_chain_async(client, "face", parse_plan("age+1>happy+1"), str(tmp_path), True), 5)
+        await release
+        return results
+
+    results = asyncio.run(main())
+
+    assert all(result["predictions"] == {"predictions": {"age": 0.0}} for result in results.values())
+    predictions_files = [name for name in os.listdir(tmp_path) if name.endswith("_predictions.json")]
+    assert len(predictions_files) == 2
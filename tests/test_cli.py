@@ -0,0 +1,72 @@
+import argparse
+import functools
+import json
+import os
+
+import pytest
+
+import cli
+from auth import TokenManager
+from rate_limit import RateLimiter
+
+
+def test_parse_filter():
+    assert cli.parse_filter("gender=0.5:") == ("gender", [0.5, None])
+    assert cli.parse_filter(" age =-1:1") == ("age", [-1.0, 1.0])
+    for text in ("gender", "gender=1", "=1:2", "age=a:b"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            cli.parse_filter(text)
+
+
+def test_arguments_are_checked_before_anything_runs(capsys):
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(["generate", "--screen", "age >"])
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(["transform", "--s3-key", "k", "--attribute", "age"])
+
+    args = cli.build_parser().parse_args(["sweep", "--attributes", "age", "happy", "--betas", "-1", "1",
+                                          "--filter", "age=0:", "--approve", "prompt"])
+    assert (args.attributes, args.betas, args.filter, args.approve) == (["age", "happy"], [-1.0, 1.0],
+                                                                        [("age", [0.0, None])], "prompt")
+    assert args.run is cli.cmd_sweep
+
+
+@pytest.fixture
+def run_cli(emulator, tmp_path, monkeypatch, capsys):
+    """
+    Run cli.main against a fresh emulator with local state kept in tmp_path; returns (exit code, stdout lines).
+    """
+    base_url = emulator()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("EXTEMPO_USERNAME", "user")
+    monkeypatch.setenv("EXTEMPO_PASSWORD", "password")
+    monkeypatch.setattr(cli, "TokenManager", functools.partial(TokenManager, path=str(tmp_path / "token.json")))
+    monkeypatch.setattr(cli, "RateLimiter", functools.partial(RateLimiter, state_path=str(tmp_path / "rate.json")))
+
+    def run(*argv):
+        code = cli.main(["--base-url", base_url, "--config", str(tmp_path / "none.ini"), *argv])
+        return code, capsys.readouterr().out.splitlines()
+
+    return run
+
+
+def test_generate_predict_and_transform(run_cli, tmp_path):
+    code, keys = run_cli("--output", "faces", "generate", "--count", "2")
+    assert code == 0 and len(keys) == 2
+    assert len([name for name in os.listdir(tmp_path / "faces") if name.endswith(".jpg")]) == 2
+
+    code, lines = run_cli("predict", *keys)
+    assert code == 0
+    assert [json.loads(line)["s3_key"] for line in lines] == keys
+    assert all(json.loads(line)["predictions"] for line in lines)
+
+    code, lines = run_cli("--output", "aged", "transform", "--s3-key", keys[0], "--attribute", "age",
+                          "--betas", "-1", "1")
+    assert code == 0
+    assert [line.split("\t")[:2] for line in lines] == [["age", "-1"], ["age", "1"]]
+    assert all(os.path.exists(line.split("\t")[3]) for line in lines)
+
+
+def test_invalid_plan_is_reported(run_cli):
+    code, lines = run_cli("chain", "--s3-key", "k", "--plan", "age")
+    assert code == 2 and lines == []
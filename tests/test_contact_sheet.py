@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from contact_sheet import BACKGROUND, _LABEL_WIDTH, _label_strip, contact_sheet, tile_grid
+
+
+def test_tile_grid_lays_out_rows_with_gaps():
+    tiles = np.arange(6, dtype=np.uint8).reshape(6, 1, 1, 1).repeat(3, axis=3).repeat(2, axis=1).repeat(2, axis=2)
+    grid = tile_grid(tiles, 2, 3, gap=1)
+
+    assert grid.shape == (5, 8, 3)
+    assert grid[0, 3, 0] == 1 and grid[3, 6, 0] == 5
+    assert grid[2, 0, 0] == BACKGROUND
+
+
+@pytest.mark.parametrize("vertical", [True, False])
+def test_long_labels_stay_inside_their_cell(vertical):
+    labels = ["well-groomed f8fc2d12", "trustworthy 0123456789abcdef"]
+    strip = _label_strip(labels, 2 * 100, 100, _LABEL_WIDTH, vertical)
+    inked = (strip < 128).any(axis=2)
+
+    if vertical:
+        # Nothing touches the right edge, where a cut-off label would run out of the strip
+        assert not inked[:, -4:].any()
+    else:
+        # Each label ends before its neighbour's cell starts
+        assert not inked[:, 96:104].any() and not inked[:, -4:].any()
+    assert inked.any()
+
+
+def test_sheet_has_room_for_labels():
+    tiles = np.zeros((4, 8, 8, 3), dtype=np.uint8)
+    sheet = contact_sheet([[None, None], [None, None]], ["a", "b"], ["-1", "1"], tile_size=8, gap=2, tiles=tiles)
+
+    assert sheet.shape == (28 + 18, _LABEL_WIDTH + 18, 3)
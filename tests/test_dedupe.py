@@ -0,0 +1,134 @@
+import os
+import sqlite3
+
+import numpy as np
+from PIL import Image
+
+from catalog import BUSY_TIMEOUT, Catalog
+from dedupe import (DEFAULT_DISTANCE, BKTree, DuplicateDetector, distance, duplicate_groups, face_name, index_images,
+                    phash)
+
+
+def face(tmp_path, name, seed, noise=0):
+    """
+    Save a smooth random image; images of the same seed look alike, noise makes their bytes differ.
+    """
+    rng = np.random.default_rng(seed)
+    pixels = np.kron(rng.integers(0, 256, (8, 8, 3)), np.ones((32, 32, 1)))
+    pixels = pixels + np.random.default_rng(noise).normal(0, noise, pixels.shape)
+    path = str(tmp_path / name)
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, quality=90)
+    return path
+
+
+def catalog(tmp_path):
+    return Catalog(str(tmp_path / "catalog.sqlite3"), str(tmp_path))
+
+
+def test_catalog_waits_for_other_writers(tmp_path):
+    with catalog(tmp_path) as c:
+        assert c.db.execute("PRAGMA busy_timeout").fetchone()[0] == BUSY_TIMEOUT * 1000
+
+
+def test_failing_hash_store_does_not_fail_the_save(tmp_path):
+    class LockedCatalog:
+        def hashes(self):
+            return []
+
+        def hash_faces(self):
+            return {}
+
+        def store_hashes(self, rows):
+            raise sqlite3.OperationalError("database is locked")
+
+    detector = DuplicateDetector(LockedCatalog())
+    first = face(tmp_path, "a.jpg", seed=1)
+    second = face(tmp_path, "b.jpg", seed=1, noise=3)
+
+    assert detector.check(first) == []
+    assert [path for _, path in detector.check(second)] == [first]
+
+
+FACE = "61/generate/a1~~generated.jpeg"
+OTHER_FACE = "61/generate/b2~~generated.jpeg"
+
+
+def test_face_name_is_shared_by_a_face_and_its_transforms():
+    assert face_name(FACE) == face_name("61/transform/a1~~generated.jpeg~~10001~~0") == "a1~~generated.jpeg"
+    assert face_name("transform/a1~~generated.jpeg~~10001~~0~~10002~~1") == "a1~~generated.jpeg"
+    assert face_name(None) is None
+
+
+def test_transforms_of_one_face_are_not_flagged(tmp_path):
+    with catalog(tmp_path) as c:
+        detector = DuplicateDetector(c)
+        detector.check(face(tmp_path, "face.jpg", seed=1), image_key=FACE)
+        sweep = face(tmp_path, "sweep.jpg", seed=1, noise=3)
+
+        assert detector.check(sweep, image_key="61/transform/a1~~generated.jpeg~~10001~~0") == []
+        other = face(tmp_path, "other.jpg", seed=1, noise=4)
+        assert len(detector.check(other, image_key=OTHER_FACE)) == 2
+        # The sweep image only joins the group through the other face
+        names = ("face.jpg", "sweep.jpg", "other.jpg")
+        assert duplicate_groups(c) == [sorted(str(tmp_path / name) for name in names)]
+
+        # The faces are remembered with the hashes, so a new detector skips them too
+        reloaded = DuplicateDetector(c)
+        again = face(tmp_path, "again.jpg", seed=1, noise=5)
+        assert [path for _, path in reloaded.check(again, image_key=FACE)] == [other]
+
+
+def test_groups_leave_out_images_of_one_face(tmp_path):
+    with catalog(tmp_path) as c:
+        detector = DuplicateDetector(c)
+        detector.check(face(tmp_path, "face.jpg", seed=1), image_key=FACE)
+        sweep = face(tmp_path, "sweep.jpg", seed=1, noise=3)
+        detector.check(sweep, image_key="61/transform/a1~~generated.jpeg~~10001~~0")
+
+        assert duplicate_groups(c) == []
+
+
+def test_bk_tree_queries_match_a_linear_scan():
+    rng = np.random.default_rng(0)
+    values = [int(value) for value in rng.integers(0, 1 << 63, 500, dtype=np.int64)]
+    # Near copies and exact duplicates of a few values
+    values += [values[n] ^ (1 << n) for n in range(20)] + values[:5]
+    tree = BKTree()
+    for n, value in enumerate(values):
+        tree.add(value, n)
+    assert len(tree) == len(values)
+
+    for probe in values[:30] + [0, (1 << 64) - 1]:
+        for max_distance in (0, 3, 12):
+            expected = sorted((distance(probe, value), n) for n, value in enumerate(values)
+                              if distance(probe, value) <= max_distance)
+            found = tree.query(probe, max_distance)
+            assert sorted(found) == expected
+            assert [d for d, _ in found] == sorted(d for d, _ in found)
+    assert BKTree().query(0, 64) == []
+
+
+def test_phash_ignores_reencoding_but_not_content(tmp_path):
+    original = phash(face(tmp_path, "a.jpg", seed=1))
+    noisy = phash(face(tmp_path, "b.jpg", seed=1, noise=8))
+    other = phash(face(tmp_path, "c.jpg", seed=2))
+
+    assert distance(original, noisy) <= DEFAULT_DISTANCE
+    assert distance(original, other) > DEFAULT_DISTANCE
+    with open(tmp_path / "a.jpg", "rb") as f:
+        assert phash(f.read()) == original
+
+
+def test_index_images_hashes_only_new_images(tmp_path):
+    folder = tmp_path / "generations_20241021_102456"
+    folder.mkdir()
+    face(folder, "a.jpg", seed=1)
+    face(folder, "b.jpg", seed=1, noise=8)
+    face(folder, "c.jpg", seed=2)
+    (folder / "broken.jpg").write_bytes(b"\xff\xd8 not really")
+    c = catalog(tmp_path)
+    c.scan()
+
+    assert index_images(c, workers=2) == 3
+    assert index_images(c, workers=2) == 0
+    assert [sorted(os.path.basename(path) for path in group) for group in duplicate_groups(c)] == [["a.jpg", "b.jpg"]]
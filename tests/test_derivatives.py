@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from catalog import Catalog
+from derivatives import build, make_derivatives, parse_variant
+
+VARIANTS = [(64, "jpeg"), (128, "webp")]
+
+
+def test_parse_variant():
+    assert parse_variant("96:jpg") == (96, "jpeg")
+    assert parse_variant("384") == (384, "webp")
+    for text in ("big:webp", "0:jpeg", "96:png"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_variant(text)
+
+
+def test_make_derivatives_keeps_the_aspect_ratio(tmp_path):
+    source = str(tmp_path / "face.jpg")
+    Image.new("RGB", (400, 200), (200, 100, 50)).save(source)
+
+    _, outputs, error = make_derivatives(source, str(tmp_path / "out"), VARIANTS)
+
+    assert error is None
+    assert {name: (output["width"], output["height"]) for name, output in outputs.items()} == {
+        "64.jpg": (64, 32), "128.webp": (128, 64)}
+    with Image.open(outputs["128.webp"]["path"]) as image:
+        assert image.format == "WEBP" and image.size == (128, 64)
+    assert not [name for name in os.listdir(tmp_path / "out") if name.endswith(".part")]
+
+
+def test_unreadable_sources_are_reported(tmp_path):
+    source = tmp_path / "broken.jpg"
+    source.write_bytes(b"\xff\xd8 not an image")
+
+    _, outputs, error = make_derivatives(str(source), str(tmp_path / "out"), VARIANTS)
+
+    assert outputs == {} and error
+
+
+def test_build_is_incremental(tmp_path):
+    folder = tmp_path / "generations_20241021_102456"
+    folder.mkdir()
+    for n in range(3):
+        Image.new("RGB", (256, 256), (n * 80, 0, 0)).save(folder / f"face_{n}.jpg")
+    catalog = Catalog(str(tmp_path / "catalog.sqlite3"), root=str(tmp_path))
+    catalog.scan()
+    root = str(tmp_path / "derivatives")
+    out_dir = os.path.join(root, "generations_20241021_102456")
+
+    assert build(catalog, variants=VARIANTS, root=root, workers=2) == {
+        "built": 3, "current": 0, "failed": 0, "pruned": 0}
+    assert build(catalog, variants=VARIANTS, root=root, workers=2)["current"] == 3
+
+    (folder / "face_0.jpg").unlink()
+    Image.new("RGB", (256, 256), (0, 255, 0)).save(folder / "face_1.jpg")
+    os.utime(folder / "face_1.jpg", ns=(1, 1))
+    catalog.scan()
+    assert build(catalog, variants=VARIANTS, root=root, workers=2) == {
+        "built": 1, "current": 1, "failed": 0, "pruned": 1}
+
+    with open(os.path.join(out_dir, "manifest.json")) as f:
+        images = json.load(f)["images"]
+    assert sorted(images) == ["face_1.jpg", "face_2.jpg"]
+    assert images["face_1.jpg"]["outputs"]["64.jpg"]["path"] == "face_1_64.jpg"
+    assert not os.path.exists(os.path.join(out_dir, "face_0_64.jpg"))
@@ -0,0 +1,86 @@
+import builtins
+import threading
+
+import pytest
+from PIL import Image
+
+import display as display_module
+from display import ImageDisplay, default_mode
+
+
+@pytest.mark.parametrize("env, platform, expected", [
+    ({"FACEGEN_DISPLAY": "Viewer"}, "linux", "viewer"),
+    ({"FACEGEN_DISPLAY": "bogus"}, "darwin", "external"),
+    ({}, "linux", "headless"),
+    ({"DISPLAY": ":0"}, "linux", "external"),
+    ({"WAYLAND_DISPLAY": "wayland-0"}, "linux", "external"),
+    ({}, "win32", "external"),
+])
+def test_default_mode(env, platform, expected, monkeypatch):
+    for name in ("FACEGEN_DISPLAY", "DISPLAY", "WAYLAND_DISPLAY"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(display_module.sys, "platform", platform)
+
+    assert default_mode() == expected
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError, match="Unknown display mode"):
+        ImageDisplay("window")
+
+
+def test_headless_never_opens_the_image(monkeypatch):
+    monkeypatch.setattr(Image, "open", lambda *args: pytest.fail("image was decoded"))
+    ImageDisplay("headless").show("missing.jpg")
+
+
+def test_external_opens_the_system_viewer(tmp_path, monkeypatch):
+    shown = []
+    monkeypatch.setattr(Image.Image, "show", lambda self, *args, **kwargs: shown.append(self.size))
+    path = tmp_path / "face.jpg"
+    Image.new("RGB", (8, 4)).save(path)
+
+    ImageDisplay("external").show(str(path))
+
+    assert shown == [(8, 4)]
+
+
+def test_viewer_falls_back_to_external_without_tk(tmp_path, monkeypatch):
+    real_import = builtins.__import__
+
+    def no_tkinter(name, *args, **kwargs):
+        if name == "tkinter":
+            raise ImportError("no tkinter")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_tkinter)
+    shown = []
+    monkeypatch.setattr(Image.Image, "show", lambda self, *args, **kwargs: shown.append(self.size))
+    path = tmp_path / "face.jpg"
+    Image.new("RGB", (8, 4)).save(path)
+
+    display = ImageDisplay("viewer")
+    display.show(str(path))
+
+    assert display.mode == "external"
+    assert shown == [(8, 4)]
+
+
+def test_wait_returns_once_the_viewer_window_is_closed():
+    display = ImageDisplay("viewer")
+    closed = threading.Event()
+    display.thread = threading.Thread(target=closed.wait, daemon=True)
+    display.thread.start()
+
+    waiter = threading.Thread(target=display.wait)
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    closed.set()
+    waiter.join(5)
+    assert not waiter.is_alive() and display.thread is None
+
+    # Nothing to wait for without a viewer window
+    ImageDisplay("headless").wait()
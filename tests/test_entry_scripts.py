@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+import main
+import selector
+from display import ImageDisplay
+
+
+@pytest.mark.parametrize("script", [main, selector])
+def test_incomplete_image_is_reported_not_raised(script, tmp_path, monkeypatch):
+    monkeypatch.setattr(script, "setup", lambda: None)
+    monkeypatch.setattr(script, "display", ImageDisplay("headless"))
+
+    assert script.save_and_show_image(b"<html>not an image</html>", "face.jpg", str(tmp_path)) is None
+    assert script.save_and_show_image(b"\xff\xd8truncated", "face.jpg", str(tmp_path)) is None
+    assert os.listdir(tmp_path) == []
+    assert script.save_and_show_image(b"\xff\xd8\xff\xd9", "face.jpg", str(tmp_path)) == str(tmp_path / "face.jpg")
+
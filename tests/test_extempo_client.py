@@ -0,0 +1,52 @@
+import pytest
+
+import main
+import selector
+from bench_connection_reuse import measure, run_pooled, run_unpooled, start_stub_server
+from extempo_client import ExtempoClient, predictions_key, split_s3_key
+
+
+@pytest.fixture
+def stub_server():
+    server = start_stub_server()
+    yield server
+    server.shutdown()
+
+
+def test_pooled_client_reuses_one_connection(stub_server):
+    connections, _ = measure(stub_server, "pooled", run_pooled, 20)
+    assert connections == 1
+
+    connections, _ = measure(stub_server, "unpooled", run_unpooled, 5)
+    assert connections == 15
+
+
+def test_token_is_set_once_on_the_session():
+    client = ExtempoClient("http://127.0.0.1:1/")
+    assert client.base_url == "http://127.0.0.1:1"
+
+    client.set_token("abc")
+    assert client.session.headers["Authorization"] == "Bearer abc"
+    client.set_token(None)
+    assert "Authorization" not in client.session.headers
+
+
+@pytest.mark.parametrize("script", [main, selector])
+def test_entry_script_helpers_share_one_session(script, stub_server, monkeypatch):
+    monkeypatch.setattr(script, "setup", lambda: None)
+    client = ExtempoClient(f"http://127.0.0.1:{stub_server.server_address[1]}")
+    monkeypatch.setattr(script, "client", client)
+    before = stub_server.connections
+
+    for _ in range(3):
+        assert script.decode_random_face("stub-token")["s3_key"]
+        assert script.get_user_info("stub-token")
+    assert stub_server.connections - before == 1
+    assert client.session.headers["Authorization"] == "Bearer stub-token"
+
+
+def test_s3_key_helpers():
+    key = "61/generate/abc~~generated.jpeg"
+    assert split_s3_key(key) == ("generate", "abc~~generated.jpeg")
+    assert predictions_key(key) == "generate/abc~~generated.jpeg"
+    assert predictions_key("generated.jpeg") is None
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+import requests
+
+
+@pytest.fixture
+def gateway(emulator):
+    """
+    A fresh emulator and a logged-in requests session for it; returns (base_url, session).
+    """
+    base_url = emulator()
+    session = requests.Session()
+    token = session.post(f"{base_url}/auth/login", json={"username": "user", "password": "password"}).json()["token"]
+    session.headers["Authorization"] = f"Bearer {token}"
+    return base_url, session
+
+
+def test_login_requires_credentials(emulator):
+    base_url = emulator()
+    assert requests.post(f"{base_url}/auth/login", json={"username": "user"}).status_code == 401
+    assert requests.get(f"{base_url}/users/me").status_code == 401
+
+
+def test_images_and_predictions_are_404_until_ready(gateway):
+    base_url, session = gateway
+    s3_key = session.get(f"{base_url}/decode").json()["s3_key"]
+    prefix, kind, name = s3_key.split("/")
+
+    assert session.get(f"{base_url}/image/{kind}/{name}").status_code == 404
+    assert session.get(f"{base_url}/predictions/{kind}/{name}").status_code == 404
+    time.sleep(0.25)
+    image = session.get(f"{base_url}/image/{kind}/{name}")
+    assert image.status_code == 200 and image.content[:2] == b"\xff\xd8"
+    # Rendering is deterministic per key
+    assert session.get(f"{base_url}/image/{kind}/{name}").content == image.content
+    predictions = session.get(f"{base_url}/predictions/{kind}/{name}").json()
+    assert predictions["s3_key"] == s3_key and "age" in predictions["predictions"]
+
+    stats = requests.get(f"{base_url}/_emulator/stats").json()
+    assert stats["image.not_ready"] == 1 and stats["image.requests"] == 3
+
+
+def test_transformations_shift_predictions_by_beta(gateway):
+    base_url, session = gateway
+    s3_key = session.get(f"{base_url}/decode").json()["s3_key"]
+    _, kind, name = s3_key.split("/")
+    time.sleep(0.25)
+
+    images = session.post(f"{base_url}/request_transformation/{kind}/{name}",
+                          json={"attribute": "age", "betas": [-2, 2]}).json()["images"]
+    assert len(images) == 2
+    time.sleep(0.25)
+    base = session.get(f"{base_url}/predictions/{kind}/{name}").json()["predictions"]["age"]
+    shifted = [session.get(f"{base_url}/predictions/{key.split('/', 1)[1]}").json()["predictions"]["age"]
+               for key in images]
+    assert shifted[0] == pytest.approx(base - 1.6, abs=0.3)
+    assert shifted[1] == pytest.approx(base + 1.6, abs=0.3)
+
+
+def test_config_can_be_changed_at_runtime(gateway):
+    base_url, session = gateway
+    assert requests.post(f"{base_url}/_emulator/config", json={"bogus": 1}).status_code == 400
+
+    requests.post(f"{base_url}/_emulator/config", json={"throttle_rate": 1.0, "retry_after": 3})
+    response = session.get(f"{base_url}/decode")
+    assert response.status_code == 429 and response.headers["Retry-After"] == "3"
+
+    requests.post(f"{base_url}/_emulator/config", json={"throttle_rate": 0.0, "failure_rate": 1.0})
+    assert session.get(f"{base_url}/decode").status_code == 500
+
+
+def test_tokens_expire_after_their_ttl(emulator):
+    base_url = emulator(token_ttl=0.2)
+    token = requests.post(f"{base_url}/auth/login", json={"username": "u", "password": "p"}).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert requests.get(f"{base_url}/users/me", headers=headers).status_code == 200
+    time.sleep(0.3)
+    assert requests.get(f"{base_url}/users/me", headers=headers).status_code == 401
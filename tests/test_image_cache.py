@@ -0,0 +1,91 @@
+import hashlib
+import os
+
+import requests
+
+from extempo_client import ExtempoClient, split_s3_key
+from image_cache import ImageCache
+
+
+def blob(n, size=1000):
+    return bytes([n]) * size
+
+
+def blob_path(cache, key):
+    with open(cache._key_path(key)) as f:
+        return cache._blob_path(f.read().strip())
+
+
+def test_round_trip_persists_across_instances(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    assert cache.get("1/generate/a") is None
+    cache.put("1/generate/a", blob(1))
+
+    reopened = ImageCache(str(tmp_path))
+    assert reopened.get("1/generate/a") == blob(1)
+    assert "1/generate/a" in reopened and "1/generate/b" not in reopened
+    assert reopened.size == 1000
+    assert reopened.stats()["hits"] == 1
+
+
+def test_identical_images_share_one_blob(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    cache.put("1/generate/a", blob(1))
+    cache.put("1/transform/b", blob(1))
+
+    assert cache.size == 1000
+    assert cache.get("1/transform/b") == blob(1)
+
+
+def test_corrupted_blob_is_dropped(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    cache.put("1/generate/a", blob(1))
+    path = cache.get_path("1/generate/a")
+    with open(path, "r+b") as f:
+        f.write(b"\x00")
+
+    assert cache.get("1/generate/a") is None
+    assert not os.path.exists(path)
+    assert cache.size == 0
+
+
+def test_least_recently_used_blobs_are_evicted(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=3500)
+    for n in range(3):
+        cache.put(f"key{n}", blob(n))
+        # mtimes decide the order, so make them distinct regardless of filesystem resolution
+        os.utime(blob_path(cache, f"key{n}"), (n, n))
+    # A hit makes key0 the most recently used
+    assert cache.get("key0") == blob(0)
+
+    cache.put("key3", blob(3))
+
+    assert "key1" not in cache
+    assert all(key in cache for key in ("key0", "key2", "key3"))
+    assert cache.size <= 3500 * 0.9
+
+
+def test_put_file_and_get_path(tmp_path):
+    cache = ImageCache(str(tmp_path / "cache"))
+    source = tmp_path / "face.jpg"
+    source.write_bytes(blob(7))
+    cache.put_file("1/generate/a", str(source), hashlib.sha256(blob(7)).hexdigest())
+
+    path = cache.get_path("1/generate/a")
+    assert path != str(source)
+    with open(path, "rb") as f:
+        assert f.read() == blob(7)
+
+
+def test_client_serves_repeated_images_from_the_cache(emulator, tmp_path):
+    base_url = emulator()
+    client = ExtempoClient(base_url, image_cache=ImageCache(str(tmp_path)))
+    client.login("user", "password")
+    path, id = split_s3_key(client.decode_random_face()["s3_key"])
+
+    image = client.wait_for_image(path, id)
+    requests_before = requests.get(f"{base_url}/_emulator/stats").json()["image.requests"]
+
+    assert client.get_image(path, id) == image
+    assert requests.get(f"{base_url}/_emulator/stats").json()["image.requests"] == requests_before
+    assert client.image_cache.hits == 1
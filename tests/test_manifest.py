@@ -0,0 +1,75 @@
+import os
+import threading
+
+from catalog import parse_info
+from manifest import RunManifest, export_info_files, read_manifest
+
+
+def test_records_are_buffered_until_flushed(tmp_path):
+    manifest = RunManifest(str(tmp_path), buffer_size=3, flush_interval=60)
+    manifest.decode("1/generate/a")
+    manifest.decode("1/generate/b")
+    assert read_manifest(str(tmp_path)) == []
+
+    manifest.decode("1/generate/c")
+    assert len(read_manifest(str(tmp_path))) == 3
+    manifest.decode("1/generate/d")
+    manifest.close()
+    assert [record["s3_key"] for record in read_manifest(str(tmp_path), "decode")] == [
+        "1/generate/a", "1/generate/b", "1/generate/c", "1/generate/d"]
+
+
+def test_record_fields(tmp_path):
+    with RunManifest(str(tmp_path)) as manifest:
+        manifest.image("1/generate/a", os.path.join(str(tmp_path), "face.jpg"))
+        manifest.image("1/transform/b", os.path.join(str(tmp_path), "aged.jpg"), "age", 2)
+        manifest.predictions("1/generate/a", {"s3_key": "1/generate/a", "predictions": {"age": 0.5}})
+        manifest.transformation("1/generate/a", "age", [2], images=["1/transform/b"])
+
+    face, aged = read_manifest(str(tmp_path), "image")
+    assert face["path"] == "face.jpg" and "attribute" not in face and "beta" not in face
+    assert (aged["attribute"], aged["beta"]) == ("age", 2.0)
+    predictions, = read_manifest(str(tmp_path), "predictions")
+    assert predictions["predictions"] == {"age": 0.5} and "path" not in predictions
+    transformation, = read_manifest(str(tmp_path), "transformation")
+    assert transformation["betas"] == [2.0] and transformation["images"] == ["1/transform/b"]
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    with RunManifest(str(tmp_path)) as manifest:
+        manifest.decode("1/generate/a")
+    with open(tmp_path / "manifest.jsonl", "a") as f:
+        f.write('{"event": "decode", "s3_')
+
+    assert len(read_manifest(str(tmp_path))) == 1
+
+
+def test_concurrent_writers_do_not_interleave_lines(tmp_path):
+    manifests = [RunManifest(str(tmp_path), buffer_size=5) for _ in range(4)]
+
+    def write(manifest, n):
+        for i in range(200):
+            manifest.record("item_done", item=f"{n}-{i}", padding="x" * 200)
+        manifest.close()
+
+    threads = [threading.Thread(target=write, args=(manifest, n)) for n, manifest in enumerate(manifests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    records = read_manifest(str(tmp_path))
+    assert len(records) == 800 and len({record["item"] for record in records}) == 800
+
+
+def test_export_info_files(tmp_path):
+    with RunManifest(str(tmp_path)) as manifest:
+        manifest.image("1/generate/a", os.path.join(str(tmp_path), "face.jpg"))
+        manifest.image("1/transform/b", os.path.join(str(tmp_path), "aged.jpg"), "age", -1.5)
+
+    assert export_info_files(str(tmp_path)) == 1
+    with open(tmp_path / "aged_info.txt") as f:
+        assert parse_info(f.read()) == {"attribute": "age", "beta": -1.5, "s3_key": "1/transform/b",
+                                        "photo_filename": "aged.jpg"}
+    assert export_info_files(str(tmp_path)) == 0
+    assert export_info_files(str(tmp_path), overwrite=True) == 1
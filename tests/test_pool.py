@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from batch import JobProgress, load_jobs
+from pool import AccountStats, read_accounts, run_pool
+
+
+def test_read_accounts(tmp_path):
+    config = tmp_path / "config.ini"
+    config.write_text("[extempo]\nusername = main\n\n"
+                      "[account:lab1]\nusername = lab1@example.com\npassword = one\n\n"
+                      "[account: lab2 ]\nusername = lab2@example.com\npassword = two\nbase_url = http://local\n")
+
+    assert read_accounts(str(config)) == [
+        {"name": "lab1", "username": "lab1@example.com", "password": "one", "base_url": None},
+        {"name": "lab2", "username": "lab2@example.com", "password": "two", "base_url": "http://local"},
+    ]
+
+
+def test_slow_or_failing_accounts_are_expected_to_finish_later():
+    fast, slow, flaky = AccountStats("fast"), AccountStats("slow"), AccountStats("flaky")
+    for _ in range(5):
+        fast.record(True, 1.0, 0)
+        slow.record(True, 3.0, 0)
+        flaky.record(False, 1.0, 2)
+
+    assert (fast.done, flaky.failed, flaky.http_errors) == (5, 5, 10)
+    assert fast.expected_finish(1.0) < slow.expected_finish(1.0)
+    assert fast.expected_finish(1.0) < flaky.expected_finish(1.0)
+    fast.inflight.update({("job", 0), ("job", 1), ("job", 2)})
+    assert fast.expected_finish(1.0) == pytest.approx(4.0)
+    # Accounts without observations use the pool-wide default
+    assert AccountStats("new").expected_finish(2.0) == 2.0
+
+
+def test_items_are_spread_across_accounts(emulator, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    jobs_path = tmp_path / "jobs.jsonl"
+    jobs_path.write_text(json.dumps({"id": "faces", "count": 6, "output": str(tmp_path / "faces")}) + "\n")
+    jobs = load_jobs(str(jobs_path))
+    accounts = [{"name": "lab1", "username": "lab1", "password": "one"},
+                {"name": "lab2", "username": "lab2", "password": "two"},
+                # The emulator rejects an empty password, so this account never becomes ready
+                {"name": "broken", "username": "lab3", "password": ""}]
+
+    stats = run_pool(jobs, accounts, per_account=2, base_url=emulator(),
+                     catalog_path=str(tmp_path / "catalog.sqlite3"))
+
+    assert stats["lab1"].done + stats["lab2"].done == 6
+    assert stats["lab1"].done and stats["lab2"].done
+    assert not stats["broken"].alive and stats["broken"].done == 0
+    progress = JobProgress(str(tmp_path / "faces"))
+    assert all(progress.item(n).done for n in range(6))
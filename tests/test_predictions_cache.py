@@ -0,0 +1,67 @@
+import json
+import os
+
+import requests
+
+from extempo_client import ExtempoClient
+from predictions_cache import PredictionsCache, import_saved_predictions
+
+
+def test_memory_tier_falls_back_to_disk(tmp_path):
+    path = str(tmp_path / "predictions.sqlite3")
+    cache = PredictionsCache(path, capacity=2)
+    for n in range(3):
+        cache.put(f"generate/{n}", {"age": n})
+
+    # generate/0 was pushed out of memory but is still on disk
+    assert list(cache.memory) == ["generate/1", "generate/2"]
+    assert cache.get("generate/0") == {"age": 0}
+    assert cache.get("generate/2") == {"age": 2}
+    assert cache.get("generate/missing") is None
+    assert (cache.disk_hits, cache.memory_hits, cache.misses) == (1, 1, 1)
+    cache.close()
+
+    reopened = PredictionsCache(path)
+    assert len(reopened) == 3
+    assert reopened.get("generate/1") == {"age": 1}
+
+
+def test_get_many_returns_only_cached_keys(tmp_path):
+    cache = PredictionsCache(str(tmp_path / "predictions.sqlite3"), capacity=10)
+    cache.put_many({f"generate/{n}": {"age": n} for n in range(2000)})
+    cache.memory.clear()
+    cache.put("generate/0", {"age": 0})
+
+    keys = [f"generate/{n}" for n in range(0, 2100, 3)]
+    found = cache.get_many(keys)
+
+    assert found == {key: {"age": int(key.split("/")[1])} for key in keys if int(key.split("/")[1]) < 2000}
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["disk_hits"] == len(found) - 1
+    assert stats["misses"] == len(keys) - len(found)
+
+
+def test_import_saved_predictions(tmp_path):
+    folder = tmp_path / "generations_20240101_000000"
+    folder.mkdir()
+    (folder / "face_predictions.json").write_text(json.dumps({"s3_key": "1/generate/a", "predictions": {}}))
+    (folder / "old_predictions.json").write_text(json.dumps({"predictions": {}}))
+    (folder / "broken_predictions.json").write_text("{")
+    cache = PredictionsCache(str(tmp_path / "predictions.sqlite3"))
+
+    assert import_saved_predictions(cache, os.path.join(str(tmp_path), "generations_*", "*predictions*.json")) == 1
+    assert cache.get("generate/a") == {"s3_key": "1/generate/a", "predictions": {}}
+
+
+def test_client_serves_repeated_predictions_from_the_cache(emulator, tmp_path):
+    base_url = emulator()
+    client = ExtempoClient(base_url, predictions_cache=PredictionsCache(str(tmp_path / "predictions.sqlite3")))
+    client.login("user", "password")
+    s3_key = client.decode_random_face()["s3_key"]
+
+    predictions = client.wait_for_predictions(s3_key)
+    requests_before = requests.get(f"{base_url}/_emulator/stats").json()["predictions.requests"]
+
+    assert client.get_predictions(s3_key) == predictions
+    assert requests.get(f"{base_url}/_emulator/stats").json()["predictions.requests"] == requests_before
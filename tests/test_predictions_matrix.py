@@ -0,0 +1,81 @@
+import errno
+import json
+import os
+
+import numpy as np
+import pytest
+
+import predictions_matrix
+from catalog import Catalog
+from predictions_cache import PredictionsCache
+from predictions_matrix import PredictionsMatrix, build_from_cache, build_from_catalog
+
+
+def store(tmp_path):
+    return PredictionsMatrix(str(tmp_path / "matrix"), traits=["age", "happy"])
+
+
+def test_failed_append_leaves_the_index_unchanged(tmp_path, monkeypatch):
+    s = store(tmp_path)
+    s.append([("a", {"age": 1.0, "happy": 2.0})])
+
+    def disk_full(fd):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(predictions_matrix.os, "fsync", disk_full)
+    with pytest.raises(OSError):
+        s.append([("b", {"age": 3.0}), ("c", {"happy": 4.0})])
+    assert "b" not in s and s.get("b") is None and len(s) == 1
+    assert os.path.getsize(s.matrix_path) == s.row_bytes
+
+    monkeypatch.undo()
+    assert s.append([("b", {"age": 5.0})]) == 1
+    assert s.get("b") == {"age": 5.0} and s.get("a") == {"age": 1.0, "happy": 2.0}
+    reopened = store(tmp_path)
+    assert reopened.keys == ["a", "b"] and reopened.get("b") == {"age": 5.0}
+
+
+def test_columns_and_rows(tmp_path):
+    s = store(tmp_path)
+    assert s.append([("a", {"age": 1.0, "happy": 2.0, "unknown": 9.0}), ("b", {"age": 3.0}),
+                     ("a", {"age": 7.0})]) == 2
+
+    assert s.matrix().shape == (2, 2)
+    assert list(s.column("age")) == [1.0, 3.0]
+    assert s.get("b") == {"age": 3.0}
+    rows = s.rows(["b", "missing", "a"])
+    assert rows[0][0] == 3.0 and np.isnan(rows[1]).all() and list(rows[2]) == [1.0, 2.0]
+
+
+def test_traits_are_fixed_when_the_store_is_created(tmp_path):
+    store(tmp_path)
+    assert PredictionsMatrix(str(tmp_path / "matrix"), traits=["other"]).traits == ["age", "happy"]
+
+
+def test_interrupted_append_is_trimmed_on_open(tmp_path):
+    s = store(tmp_path)
+    s.append([("a", {"age": 1.0}), ("b", {"age": 2.0})])
+    # A crash after writing a third row but before its key
+    with open(s.matrix_path, "ab") as f:
+        f.write(s.row_for({"age": 3.0}).tobytes())
+
+    reopened = store(tmp_path)
+
+    assert reopened.keys == ["a", "b"]
+    assert os.path.getsize(reopened.matrix_path) == 2 * reopened.row_bytes
+
+
+def test_build_from_catalog_and_cache(tmp_path):
+    folder = tmp_path / "generations_20241021_102456"
+    folder.mkdir()
+    (folder / "face_predictions.json").write_text(json.dumps({"s3_key": "1/generate/a", "predictions": {"age": 1}}))
+    catalog = Catalog(str(tmp_path / "catalog.sqlite3"), root=str(tmp_path))
+    catalog.scan()
+    cache = PredictionsCache(str(tmp_path / "predictions.sqlite3"))
+    cache.put_many({"generate/a": {"s3_key": "1/generate/a", "predictions": {"age": 1}},
+                    "generate/b": {"s3_key": "1/generate/b", "predictions": {"happy": 2}}})
+    s = store(tmp_path)
+
+    assert build_from_catalog(s, catalog) == 1
+    assert build_from_cache(s, cache) == 1
+    assert s.keys == ["1/generate/a", "1/generate/b"]
@@ -0,0 +1,68 @@
+import itertools
+import json
+import threading
+import time
+
+import prefetch
+from prefetch import CandidatePrefetcher
+
+
+class FakeClient:
+    """
+    Stands in for ExtempoClient; wait_for_image blocks while the gate is closed.
+    """
+
+    def __init__(self):
+        self.faces = itertools.count()
+        self.gate = threading.Event()
+        self.gate.set()
+        self.fetching = threading.Event()
+
+    def decode_random_face(self):
+        return {"s3_key": f"1/generate/{next(self.faces)}~~generated.jpeg"}
+
+    def wait_for_image(self, path, id):
+        self.fetching.set()
+        self.gate.wait()
+        return b"\xff\xd8\xff\xd9"
+
+    def wait_for_predictions(self, s3_key):
+        return {"predictions": {"age": 0.0}}
+
+
+def test_buffered_candidates_are_saved_and_served_first(tmp_path):
+    pool_path = str(tmp_path / "pool.json")
+    client = FakeClient()
+    with CandidatePrefetcher(client, buffer_size=2, workers=1, pool_path=pool_path) as prefetcher:
+        first = prefetcher.next_candidate(timeout=5)
+        # Let the worker refill the buffer before stopping
+        deadline = time.monotonic() + 5
+        while prefetcher.ready.qsize() < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    with open(pool_path) as f:
+        pooled = json.load(f)
+    assert pooled and first["s3_key"] not in [c["s3_key"] for c in pooled]
+
+    with CandidatePrefetcher(FakeClient(), buffer_size=1, workers=1, pool_path=pool_path) as prefetcher:
+        assert prefetcher.next_candidate(timeout=5)["s3_key"] == pooled[0]["s3_key"]
+
+
+def test_candidate_finished_after_stop_gives_up_is_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefetch, "STOP_TIMEOUT", 0.1)
+    pool_path = str(tmp_path / "pool.json")
+    client = FakeClient()
+    client.gate.clear()
+    prefetcher = CandidatePrefetcher(client, buffer_size=1, workers=1, pool_path=pool_path).start()
+    assert client.fetching.wait(5)
+    worker = prefetcher.threads[0]
+
+    prefetcher.stop()
+    with open(pool_path) as f:
+        assert json.load(f) == []
+
+    # The worker outlived stop() and finishes its download only now
+    client.gate.set()
+    worker.join(5)
+    with open(pool_path) as f:
+        pooled = json.load(f)
+    assert [c["s3_key"] for c in pooled] == ["1/generate/0~~generated.jpeg"]
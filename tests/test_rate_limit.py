@@ -0,0 +1,80 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from extempo_async import AsyncExtempoClient
+from extempo_client import ExtempoClient
+from rate_limit import RateLimiter, parse_retry_after
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / "rate_limit.json")
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=2)
+    assert parse_retry_after("soon") is None
+
+
+def test_burst_then_wait_for_refill(state_path):
+    limiter = RateLimiter(rate=20, burst=3, state_path=state_path)
+
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire() == pytest.approx(0.05, abs=0.03)
+
+
+def test_processes_share_one_budget(state_path):
+    first = RateLimiter(rate=1, burst=2, state_path=state_path)
+    second = RateLimiter(rate=1, burst=2, state_path=state_path)
+
+    first.acquire()
+    second.acquire()
+    # The bucket both draw from is now empty
+    assert first._update(first._take) > 0.5
+
+
+def test_throttling_halves_the_rate_and_success_recovers_it(state_path):
+    limiter = RateLimiter(rate=10, burst=5, state_path=state_path)
+
+    assert limiter.on_throttled(retry_after=0.2) == pytest.approx(0.2, abs=0.05)
+    assert limiter.current_rate() == 5
+    # Every process waits out the Retry-After
+    assert RateLimiter(rate=10, burst=5, state_path=state_path)._update(limiter._take) > 0.1
+
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.current_rate() == 10
+
+
+def test_client_retries_throttled_requests(emulator, state_path):
+    base_url = emulator(throttle_rate=0.4, retry_after=0.05, seed=1)
+    limiter = RateLimiter(rate=1000, burst=10, min_rate=50, state_path=state_path)
+    client = ExtempoClient(base_url, rate_limiter=limiter, throttle_retries=20)
+    assert client.login("user", "password")
+
+    for _ in range(10):
+        assert client.get_user_info()
+    stats = requests.get(f"{base_url}/_emulator/stats").json()
+    assert stats.get("users_me.429", 0) + stats.get("login.429", 0) > 0
+    assert stats["users_me.requests"] - stats.get("users_me.429", 0) == 10
+
+
+def test_async_client_retries_throttled_requests(emulator, state_path):
+    base_url = emulator(throttle_rate=0.4, retry_after=0.05, seed=2)
+    limiter = RateLimiter(rate=1000, burst=10, min_rate=50, state_path=state_path)
+
+    async def run():
+        async with AsyncExtempoClient(base_url, rate_limiter=limiter, throttle_retries=20) as client:
+            assert await client.login("user", "password")
+            return await asyncio.gather(*(client.get_user_info() for _ in range(10)))
+
+    assert all(asyncio.run(run()))
+    stats = requests.get(f"{base_url}/_emulator/stats").json()
+    assert stats["users_me.requests"] - stats.get("users_me.429", 0) == 10
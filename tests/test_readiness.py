@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from extempo_async import AsyncExtempoClient
+from extempo_client import ExtempoClient
+from readiness import PermanentError, ReadinessPoller, is_transient
+
+
+def poller(deadline=5):
+    return ReadinessPoller(initial_delay=0.01, max_delay=0.05, jitter=0, deadline=deadline)
+
+
+def test_poll_returns_once_ready():
+    results = iter([None, None, "ready"])
+    p = poller()
+
+    assert p.poll(lambda: next(results)) == "ready"
+    assert p.stats.summary()["count"] == 1 and p.stats.samples[0][1] == 3
+
+
+def test_poll_times_out():
+    p = poller(deadline=0.1)
+
+    assert p.poll(lambda: None) is None
+    assert p.stats.timeouts == 1
+
+
+def test_permanent_error_stops_polling_at_once():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise PermanentError("403 Forbidden")
+
+    p = poller(deadline=60)
+    assert p.poll(fetch) is None
+    assert len(calls) == 1
+    assert p.stats.failures == 1 and p.stats.timeouts == 0
+
+
+def test_permanent_error_stops_async_polling():
+    async def fetch():
+        raise PermanentError("400 Bad Request")
+
+    p = poller(deadline=60)
+    assert asyncio.run(p.poll_async(fetch)) is None
+    assert p.stats.failures == 1
+
+
+def test_only_not_ready_and_server_errors_are_transient():
+    assert all(is_transient(status) for status in (202, 404, 429, 500, 503))
+    assert not any(is_transient(status) for status in (400, 401, 403, 422))
+
+
+def test_client_waits_for_a_face_that_is_not_ready(emulator):
+    with ExtempoClient(emulator(ready_after=0.3)) as client:
+        client.login("user", "password")
+        s3_key = client.decode_random_face()["s3_key"]
+        client.predictions_poller = poller()
+
+        assert client.wait_for_predictions(s3_key)["predictions"]
+        assert client.predictions_poller.stats.samples[0][1] > 1
+
+
+def test_client_stops_on_refused_requests(emulator):
+    # Without a token every request is refused with 401, and there is no token manager to refresh it
+    with ExtempoClient(emulator()) as client:
+        client.predictions_poller = client.image_poller = poller(deadline=60)
+        start = time.monotonic()
+
+        assert client.wait_for_predictions("61/generate/face~~generated.jpeg") is None
+        assert client.wait_for_image("generate", "face~~generated.jpeg") is None
+        assert time.monotonic() - start < 5
+        assert client.image_poller.stats.failures == 2
+
+
+def test_async_client_stops_on_refused_requests_and_malformed_keys(emulator, tmp_path):
+    async def run():
+        async with AsyncExtempoClient(emulator()) as client:
+            client.predictions_poller = client.image_poller = poller(deadline=60)
+            results = [await client.wait_for_predictions("not-a-key"),
+                       await client.wait_for_predictions("61/generate/face~~generated.jpeg"),
+                       await client.wait_for_download("61/generate/face~~generated.jpeg", "face.jpg", str(tmp_path))]
+            return results, client.image_poller.stats.failures
+
+    start = time.monotonic()
+    results, failures = asyncio.run(run())
+    assert results == [None, None, None] and failures == 3
+    assert time.monotonic() - start < 5
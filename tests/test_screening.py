@@ -0,0 +1,102 @@
+import pytest
+
+from screening import ScreeningRule, compile_rule, tokenize
+
+
+FACE = {"gender": 0.8, "age": -0.4, "happy": 1.5, "attractive": 1.0, "trustworthy": 0.3, "well-groomed": 2.0,
+        "dominant": 2.5}
+
+
+def check(rule, predictions=FACE):
+    return ScreeningRule(rule)(predictions)
+
+
+@pytest.mark.parametrize("rule, expected", [
+    ("gender > 0.5", True),
+    ("gender > 0.5 and |age| < 1", True),
+    ("gender > 0.5 and |age| < 0.2", False),
+    ("gender < 0 or happy >= 1.5", True),
+    ("not gender > 0.5", False),
+    ("not not gender > 0.5", True),
+    ("-1 <= happy <= 1", False),
+    ("-1 <= age <= 1 < happy", True),
+    ("age == -0.4 and happy != 1", True),
+    ("abs(attractive - trustworthy) < 0.5", False),
+    ("attractive - trustworthy > 0.5", True),
+    ("2 * age + 1 > 0", True),
+    ("happy / 3 == 0.5", True),
+    ("-age > 0", True),
+    ("+age < 0", True),
+    ("1e-1 < .5", True),
+])
+def test_rules(rule, expected):
+    assert check(rule) is expected
+
+
+@pytest.mark.parametrize("rule, expected", [
+    ("(gender > 0)", True),
+    ("((gender > 0))", True),
+    ("(((gender < 0)))", False),
+    ("((gender > 0) and (happy > 1))", True),
+    ("(|age| < 1)", True),
+    ("((|age| < 1) and not (gender < 0))", True),
+    ("(age + 1) > 0", True),
+    ("((age + 1)) * 2 > 1", True),
+    ("((age) > 0)", False),
+    ("(gender > 0 or age > 0) and (happy > 2 or dominant > 2)", True),
+    ("not (gender > 0 and age > 0)", True),
+    ("(gender > 0) and age < 0 or happy > 5", True),
+])
+def test_parentheses_group_conditions_or_arithmetic(rule, expected):
+    assert check(rule) is expected
+
+
+def test_hyphenated_traits_are_names():
+    assert tokenize("well-groomed > 1", {"well-groomed"})[0] == ("name", "well-groomed")
+    assert check("well-groomed > 1.5")
+    assert check("well-groomed-happy > 0.4") and not check("well-groomed-happy > 0.6")
+
+
+def test_hyphen_between_traits_is_subtraction():
+    assert tokenize("attractive-trustworthy", {"attractive", "trustworthy"}) == [
+        ("name", "attractive"), ("op", "-"), ("name", "trustworthy")]
+    assert check("attractive-trustworthy > 0.6")
+    assert not check("attractive-trustworthy > 0.8")
+
+
+def test_missing_trait_fails_the_rule():
+    assert not check("gender > 0 and smug > 0")
+    assert check("gender > 0 or smug > 0")
+    assert not check("happy / (age + 0.4) > 1")
+
+
+def test_rule_accepts_responses_or_bare_scores():
+    rule = compile_rule("gender > 0.5")
+    assert rule({"predictions": FACE}) and rule(FACE)
+    assert not rule(None) and not rule({"predictions": None})
+
+
+def test_traits_are_collected():
+    assert ScreeningRule("(gender > 0) and abs(age - happy) < 1").traits == {"gender", "age", "happy"}
+
+
+@pytest.mark.parametrize("rule, message", [
+    ("gender >", "ends early"),
+    ("gender > 0 and", "ends early"),
+    ("gender", "comparison is expected"),
+    ("(gender > 0", "ends early"),
+    ("gender > 0)", "Unexpected ')'"),
+    ("(gender > )", "Unexpected ')'"),
+    ("gendr > 0", "Unknown trait 'gendr'"),
+    ("attractive-trustworth > 0", "Unknown trait 'trustworth'"),
+    ("||age| - 1| < 1", "Nested"),
+    ("age > 0 $", "Unexpected '$'"),
+    ("abs age > 0", "Expected '('"),
+])
+def test_malformed_rules_are_errors(rule, message):
+    with pytest.raises(ValueError, match=message.replace("(", r"\(").replace(")", r"\)").replace("$", r"\$")):
+        ScreeningRule(rule)
+
+
+def test_any_name_is_allowed_without_known_traits():
+    assert ScreeningRule("custom > 1", known_traits=None)({"custom": 2})
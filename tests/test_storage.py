@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import storage
+from extempo_client import ExtempoClient, split_s3_key
+from image_cache import ImageCache
+from storage import JPEG_END, JPEG_START, ImageWriter, save_image
+
+JPEG = JPEG_START + b"\x00" * 1000 + JPEG_END
+
+
+def test_commit_moves_a_complete_image_into_place(tmp_path):
+    with ImageWriter("face", str(tmp_path)) as writer:
+        for n in range(0, len(JPEG), 100):
+            writer.write(JPEG[n:n + 100])
+        writer.expected_length = len(JPEG)
+        path = writer.commit()
+
+    assert path == str(tmp_path / "face.jpg")
+    assert os.listdir(tmp_path) == ["face.jpg"]
+    with open(path, "rb") as f:
+        assert f.read() == JPEG
+
+
+@pytest.mark.parametrize("data, expected_length, message", [
+    (JPEG[:500], None, "not a complete JPEG"),
+    (b"<html>502</html>", None, "not a complete JPEG"),
+    (JPEG, len(JPEG) + 10, f"got {len(JPEG)} of {len(JPEG) + 10} bytes"),
+])
+def test_incomplete_images_never_reach_the_final_name(tmp_path, data, expected_length, message):
+    (tmp_path / "face.jpg").write_bytes(JPEG)
+    with ImageWriter("face.jpg", str(tmp_path)) as writer:
+        writer.write(data)
+        writer.expected_length = expected_length
+        with pytest.raises(ValueError, match=message):
+            writer.commit()
+
+    # The earlier image is untouched and no temp file is left behind
+    assert os.listdir(tmp_path) == ["face.jpg"]
+    with open(tmp_path / "face.jpg", "rb") as f:
+        assert f.read() == JPEG
+
+
+def test_padding_after_the_end_marker_is_accepted(tmp_path):
+    assert save_image(JPEG + b"\0\0\r\n", "face.jpg", str(tmp_path))
+
+
+def test_reset_and_abort_discard_the_temp_file(tmp_path):
+    writer = ImageWriter("face.jpg", str(tmp_path))
+    writer.write(b"partial")
+    writer.reset()
+    assert writer.length == 0 and len(os.listdir(tmp_path)) == 1
+    writer.write(JPEG)
+    assert writer.sha256() == hashlib.sha256(JPEG).hexdigest()
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+
+def test_save_hooks_get_the_path_bytes_and_key(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(storage, "save_hooks", [lambda *args: calls.append(args)])
+
+    path = save_image(JPEG, "face.jpg", str(tmp_path), "1/generate/a")
+
+    assert calls == [(path, JPEG, "1/generate/a")]
+
+
+class TruncatingHandler(BaseHTTPRequestHandler):
+    """
+    Serves images cut off before their end marker, as a proxy dropping the connection might.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = JPEG[:600]
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_truncated_download_is_discarded(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TruncatingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = ExtempoClient(f"http://127.0.0.1:{server.server_address[1]}")
+        assert client.download_image("generate", "a", "face.jpg", str(tmp_path)) is None
+    finally:
+        server.shutdown()
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_streams_to_disk_and_fills_the_cache(emulator, tmp_path):
+    base_url = emulator()
+    client = ExtempoClient(base_url, image_cache=ImageCache(str(tmp_path / "cache")))
+    client.login("user", "password")
+    s3_key = client.decode_random_face()["s3_key"]
+    out = tmp_path / "out"
+    out.mkdir()
+
+    path = client.wait_for_download(s3_key, "face.jpg", str(out))
+    again = client.download_image(*split_s3_key(s3_key), "again.jpg", str(out))
+
+    with open(path, "rb") as f, open(again, "rb") as g:
+        data = f.read()
+        assert data.startswith(JPEG_START) and data.endswith(JPEG_END) and g.read() == data
+    assert client.image_cache.hits == 1
+    assert sorted(os.listdir(out)) == ["again.jpg", "face.jpg"]
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+import requests
+
+from extempo_client import ExtempoClient, split_s3_key
+from manifest import read_manifest
+from sweep import format_beta, key_digest, run_sweep
+
+
+@pytest.fixture
+def face(emulator):
+    """
+    Log in to a fresh emulator and decode a face whose image is ready; returns (base_url, token, s3_key).
+    """
+    base_url = emulator()
+    client = ExtempoClient(base_url)
+    client.login("user", "password")
+    s3_key = client.decode_random_face()["s3_key"]
+    assert client.wait_for_image(*split_s3_key(s3_key))
+    return base_url, client.token, s3_key
+
+
+def test_format_beta_and_key_digest():
+    assert [format_beta(beta) for beta in (2, -1.5, 0.0, "3")] == ["2", "-1.5", "0", "3"]
+    assert key_digest("1/generate/a") == key_digest("1/generate/a")
+    assert key_digest("1/generate/a") != key_digest("1/generate/b")
+    assert len(key_digest("1/generate/a")) == 8
+
+
+def test_sweep_makes_one_request_per_attribute(face, tmp_path):
+    base_url, token, s3_key = face
+    results = run_sweep(token, s3_key, ["age", "gender"], [-1, 0, 1], str(tmp_path), with_predictions=True,
+                        base_url=base_url)
+
+    assert len(results) == 6
+    assert {(result["attribute"], result["beta"]) for result in results} == {
+        (attribute, beta) for attribute in ("age", "gender") for beta in (-1, 0, 1)}
+    for result in results:
+        assert os.path.exists(result["image_path"])
+        assert result["predictions"]
+    stats = requests.get(f"{base_url}/_emulator/stats").json()
+    assert stats["request_transformation.requests"] == 2
+
+    # Predictions move with beta along the transformed attribute
+    ages = {result["beta"]: result["predictions"]["predictions"]["age"]
+            for result in results if result["attribute"] == "age"}
+    assert ages[-1] < ages[0] < ages[1]
+
+
+def test_sweep_records_everything_in_the_manifest(face, tmp_path):
+    base_url, token, s3_key = face
+    results = run_sweep(token, s3_key, "age", [1, 2], str(tmp_path), with_predictions=True, base_url=base_url)
+
+    transformation, = read_manifest(str(tmp_path), "transformation")
+    assert (transformation["s3_key"], transformation["attribute"]) == (s3_key, "age")
+    assert sorted(transformation["images"]) == sorted(result["s3_key"] for result in results)
+    images = read_manifest(str(tmp_path), "image")
+    assert sorted(record["path"] for record in images) == sorted(
+        os.path.basename(result["image_path"]) for result in results)
+    assert len(read_manifest(str(tmp_path), "predictions")) == 2
+
+
+def test_failed_transformation_returns_no_results(face, tmp_path):
+    base_url, token, s3_key = face
+    results = run_sweep(token, s3_key.replace("generate", "missing"), "age", [1], str(tmp_path), base_url=base_url)
+
+    assert results == []
+    assert read_manifest(str(tmp_path), "transformation") == []
@@ -0,0 +1,78 @@
+import asyncio
+import os
+
+from catalog import Catalog
+from manifest import RunManifest
+from target import ResponseCurve, search_beta
+
+
+FACE = "61/generate/face~~generated.jpeg"
+
+
+class FakeClient:
+    """
+    Every transformation moves the attribute's prediction by slope * beta from the face's 0.
+    """
+
+    def __init__(self, slope=0.8):
+        self.slope = slope
+        self.betas = {FACE: 0.0}
+        self.calls = 0
+
+    async def wait_for_predictions(self, s3_key):
+        return {"predictions": {"age": self.slope * self.betas[s3_key]}}
+
+    async def request_transformation(self, s3_key, attribute, betas, control_attributes=None):
+        self.calls += 1
+        images = []
+        for beta in betas:
+            image_key = f"61/transform/face~~generated.jpeg~~{self.calls}~~{len(images)}"
+            self.betas[image_key] = beta
+            images.append(image_key)
+        return {"images": images}
+
+
+def search(client, target, **options):
+    return asyncio.run(search_beta(client, FACE, "age", target, **options))
+
+
+def test_search_reaches_target():
+    client = FakeClient()
+    found = search(client, 1.2, tolerance=0.01)
+
+    assert found["reached"] and abs(found["beta"] - 1.5) < 0.02
+    assert found["calls"] <= 2
+
+
+def test_out_of_reach_stops_at_max_beta(capsys):
+    found = search(FakeClient(), 100, max_beta=5)
+
+    assert found["beta"] == 5 and not found["reached"]
+    assert "out of reach" in capsys.readouterr().out
+
+
+def test_repeated_beta_is_not_reported_out_of_reach(capsys):
+    # 0.4004 needs beta 0.5005, which rounds to the 0.5 already tried
+    found = search(FakeClient(), 0.4004, tolerance=0.0001, curve=ResponseCurve(default_slope=0.8))
+
+    output = capsys.readouterr().out
+    assert found["beta"] == 0.5
+    assert "already tried" in output and "out of reach" not in output
+
+
+def test_catalog_learns_from_every_probe(tmp_path):
+    folder = tmp_path / "generations_20240101_000000"
+    os.makedirs(folder)
+    client = FakeClient(slope=0.6)
+    manifest = RunManifest(str(folder))
+    search(client, 1.2, probes=4, manifest=manifest)
+    manifest.close()
+
+    with Catalog(str(tmp_path / "catalog.sqlite3"), str(tmp_path)) as catalog:
+        # from_catalog scans, so the run is learned without indexing it by hand
+        curve = ResponseCurve.from_catalog(catalog)
+        pairs = catalog.transformation_pairs("age")
+
+    # Only probes are recorded here; none of them was downloaded
+    assert len(pairs) == len(curve) == client.calls - 1 + 4
+    assert abs(curve.slope("age") - 0.6) < 1e-6